@@ -0,0 +1,178 @@
+# ann_index.py
+"""
+IVF (inverted file) index cho LocalVectorIndex khi roster quá lớn để quét toàn bộ.
+
+Vectors được chia vào nlist cụm (k-means trên các vector đã chuẩn hoá). Khi query
+chỉ chấm điểm chính xác các row thuộc nprobe cụm gần nhất:
+    nprobe nhỏ -> nhanh hơn, recall thấp hơn; nprobe = nlist -> bằng exact search.
+
+Chưa đủ dữ liệu để train (train_threshold row) thì LocalVectorIndex vẫn quét toàn bộ.
+Row thêm sau khi train được gán vào cụm gần nhất (incremental insert).
+Centroids lưu ở ivf_centroids.npy, gán row -> cụm ở ivf_assign.i32 (memmap).
+"""
+import os
+
+import numpy as np
+
+_MIN_CAPACITY = 1024
+
+
+class IVFIndex:
+    def __init__(self, path: str, dim: int, nlist: int = 1024, nprobe: int = 16,
+                 train_threshold: int = None, kmeans_iters: int = 10, seed: int = 0):
+        if nlist < 1 or nprobe < 1:
+            raise ValueError("nlist và nprobe phải >= 1")
+        self.path = path
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold or nlist * 39
+        self.kmeans_iters = kmeans_iters
+        self._rng = np.random.default_rng(seed)
+        self.centroids = None
+        self._lists = [[] for _ in range(nlist)]
+
+        os.makedirs(path, exist_ok=True)
+        self._centroids_path = os.path.join(path, "ivf_centroids.npy")
+        self._assign_path = os.path.join(path, "ivf_assign.i32")
+        self._assign = self._open_assign(max(self._file_rows(), _MIN_CAPACITY))
+
+        if os.path.exists(self._centroids_path):
+            self.centroids = np.load(self._centroids_path)
+            if self.centroids.shape != (nlist, dim):
+                raise RuntimeError(
+                    f"IVF index tại {path} có centroids {self.centroids.shape}, "
+                    f"nhưng cấu hình là nlist={nlist}, dim={dim}"
+                )
+            self._rebuild_lists()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    # ---------- persistence ----------
+
+    def _file_rows(self):
+        if not os.path.exists(self._assign_path):
+            return 0
+        return os.path.getsize(self._assign_path) // 4
+
+    def _open_assign(self, capacity):
+        new = not os.path.exists(self._assign_path)
+        with open(self._assign_path, "ab") as f:
+            old_size = f.tell()
+            f.truncate(capacity * 4)
+        assign = np.memmap(self._assign_path, dtype=np.int32, mode="r+", shape=(capacity,))
+        start = 0 if new else old_size // 4
+        assign[start:] = -1
+        return assign
+
+    def _grow(self, needed):
+        capacity = self._assign.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._assign.flush()
+        self._assign = self._open_assign(capacity)
+
+    def _rebuild_lists(self):
+        assign = np.asarray(self._assign)
+        rows = np.flatnonzero(assign >= 0)
+        order = rows[np.argsort(assign[rows], kind="stable")]
+        bounds = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+        self._lists = [[order[bounds[c]:bounds[c + 1]]] for c in range(self.nlist)]
+
+    # ---------- build ----------
+
+    def maybe_train(self, matrix, valid):
+        """Train k-means khi đủ train_threshold row hợp lệ, rồi gán toàn bộ row hiện có"""
+        if self.trained:
+            return False
+        rows = np.flatnonzero(valid)
+        if len(rows) < max(self.train_threshold, self.nlist):
+            return False
+
+        sample_size = min(len(rows), self.nlist * 64)
+        sample = matrix[self._rng.choice(rows, size=sample_size, replace=False)]
+        self.centroids = self._kmeans(np.asarray(sample, dtype=np.float32))
+        np.save(self._centroids_path, self.centroids)
+
+        self._lists = [[] for _ in range(self.nlist)]
+        for i in range(0, len(rows), 65536):
+            chunk = rows[i:i + 65536]
+            self.add(chunk, matrix[chunk])
+        return True
+
+    def _kmeans(self, data):
+        # Spherical k-means: vector và centroid đều chuẩn hoá, gán theo tích vô hướng
+        centroids = data[self._rng.choice(len(data), size=self.nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            labels = self._nearest(data, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            counts = np.bincount(labels, minlength=self.nlist)
+            empty = counts == 0
+            # Cụm rỗng -> lấy lại 1 điểm ngẫu nhiên làm centroid
+            sums[empty] = data[self._rng.choice(len(data), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1, norms)
+        return centroids.astype(np.float32)
+
+    @staticmethod
+    def _nearest(data, centroids, chunk=16384):
+        labels = np.empty(len(data), dtype=np.int32)
+        for i in range(0, len(data), chunk):
+            labels[i:i + chunk] = np.argmax(data[i:i + chunk] @ centroids.T, axis=1)
+        return labels
+
+    def add(self, rows, vectors):
+        """Gán các row (mới hoặc vừa được ghi đè) vào cụm gần nhất"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        self._grow(int(rows.max()) + 1)
+        if not self.trained:
+            return
+        labels = self._nearest(np.asarray(vectors, dtype=np.float32), self.centroids)
+        self._assign[rows] = labels
+        order = np.argsort(labels, kind="stable")
+        bounds = np.flatnonzero(np.diff(labels[order])) + 1
+        for group in np.split(order, bounds):
+            self._lists[labels[group[0]]].append(rows[group])
+        self._assign.flush()
+
+    def remove(self, rows):
+        if len(rows):
+            self._assign[np.asarray(rows, dtype=np.int64)] = -1
+            self._assign.flush()
+
+    # ---------- search ----------
+
+    def candidates(self, q, nprobe=None):
+        """Các row thuộc nprobe cụm gần q nhất"""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        sims = self.centroids @ q
+        if nprobe < self.nlist:
+            probes = np.argpartition(-sims, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.nlist)
+
+        parts, owners = [], []
+        for c in probes:
+            chunks = self._lists[c]
+            if len(chunks) > 1:
+                # Gộp các chunk, bỏ row đã chuyển cụm / bị xoá, bỏ trùng
+                merged = np.unique(np.concatenate(chunks))
+                merged = merged[self._assign[merged] == c]
+                self._lists[c] = chunks = [merged]
+            if chunks and len(chunks[0]):
+                parts.append(chunks[0])
+                owners.append(c)
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.concatenate(parts)
+        # Row đã bị xoá hoặc được gán sang cụm khác (upsert ghi đè) vẫn có thể nằm trong list cũ
+        owner = np.repeat(owners, [len(p) for p in parts])
+        return rows[self._assign[rows] == owner]
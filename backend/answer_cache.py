@@ -0,0 +1,121 @@
+# answer_cache.py
+"""
+Cache câu trả lời theo độ tương đồng embedding của câu hỏi.
+
+Câu hỏi mới được coi là trùng 1 câu đã trả lời nếu cosine(embedding) >= threshold
+VÀ retrieval trả về đúng cùng tập học sinh -> dùng lại câu trả lời, bỏ qua Gemini.
+Entry hết hạn sau ttl giây, vượt max_entries thì xoá entry lâu không dùng nhất (LRU).
+Upload làm thay đổi học sinh nào thì các entry liên quan tới học sinh đó bị xoá.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_entries=1000, ttl=600.0, threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # slot -> entry, thứ tự LRU (cũ nhất trước)
+        self._matrix = None             # (max_entries, dim) embedding đã chuẩn hoá
+        self._free = list(range(max_entries - 1, -1, -1))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector):
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _drop(self, slot):
+        del self._entries[slot]
+        self._free.append(slot)
+
+    def get(self, q_emb, related_ids):
+        """Câu trả lời cache (hoặc None) cho câu hỏi có embedding q_emb và tập học sinh related_ids"""
+        related_ids = frozenset(related_ids)
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            now = time.time()
+            for slot in [s for s, e in self._entries.items() if now - e["created_at"] > self.ttl]:
+                self._drop(slot)
+                self.expirations += 1
+
+            slots = [s for s, e in self._entries.items() if e["related_ids"] == related_ids]
+            if slots:
+                scores = self._matrix[slots] @ self._normalize(q_emb)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    slot = slots[best]
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    return self._entries[slot]["answer"]
+
+            self.misses += 1
+            return None
+
+    def put(self, q_emb, related_ids, answer):
+        if self.max_entries <= 0:
+            return
+        q = self._normalize(q_emb)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, len(q)), dtype=np.float32)
+            if not self._free:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+            slot = self._free.pop()
+            self._matrix[slot] = q
+            self._entries[slot] = {
+                "related_ids": frozenset(related_ids),
+                "answer": answer,
+                "created_at": time.time(),
+            }
+
+    def invalidate(self, student_ids):
+        """Xoá mọi entry có dùng tới 1 trong các student_ids"""
+        student_ids = set(student_ids)
+        with self._lock:
+            stale = [s for s, e in self._entries.items() if e["related_ids"] & student_ids]
+            for slot in stale:
+                self._drop(slot)
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        """Xoá mọi entry (không biết học sinh nào đã đổi, vd. snapshot của worker khác)"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+answer_cache = SemanticAnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD)
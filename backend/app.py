@@ -1,66 +1,216 @@
 # app.py
-import os, json, traceback
-from flask import Flask, request, jsonify
+import os, json, time, traceback
+from flask import Flask, request, jsonify, Response, stream_with_context
 from dotenv import load_dotenv
 from flask_cors import CORS
 
 load_dotenv()
-from pinecone_helper import init_pinecone, upsert_vectors, query_index
+from pinecone_helper import init_pinecone
+from retrieval import retrieve
 from embedder import get_embedding
-from generator import generate_answer
-from utils import student_to_text
-from config import TOP_K, FLASK_HOST, FLASK_PORT
+from generator import generate_answer, generate_answer_stream, degraded_answer
+from router import route, get_stats as get_routing_stats
+from embedding_cache import get_stats as get_embedding_cache_stats
+from answer_cache import answer_cache
+from upstream_cache import get_stats as get_upstream_cache_stats
+from utils import format_matches
+from context_builder import build_context, get_stats as get_context_stats
+from upload_jobs import UploadJobs
+from structured_query import try_answer as try_structured_answer
+from batch_chat import answer_batch
+from metrics import (
+    span, inc, observe, sample_debug, render_prometheus, STAGE_SECONDS,
+    get_stats as get_latency_stats,
+)
+from resilience import (
+    call, deadline, ProviderUnavailable, DeadlineExceeded, get_stats as get_provider_stats,
+)
+from startup import server_startup, NotReady
+from config import (
+    TOP_K, FLASK_HOST, FLASK_PORT, VECTOR_STORE, CHAT_DEADLINE, STARTUP_WAIT_TIMEOUT,
+    UPLOAD_JOBS_DIR, UPLOAD_WORKERS, UPLOAD_BATCH_SIZE, BATCH_MAX_QUESTIONS,
+    SNAPSHOT_ENABLED, SNAPSHOT_DIR,
+)
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-index = init_pinecone()
+# Index, kiểm tra embedding và warm-up khởi tạo nền (startup.py): import app.py không gọi
+# network, server nhận request ngay; /api/health/ready báo khi nào sẵn sàng nhận traffic.
+# SNAPSHOT_ENABLED (serve.py): đọc từ snapshot memory-map dùng chung giữa các worker,
+# chỉ job upload mở index ghi (snapshot.py)
+snapshots = None
+if SNAPSHOT_ENABLED:
+    from snapshot import SnapshotStore
+    snapshots = SnapshotStore(SNAPSHOT_DIR, init_pinecone)
+if snapshots is not None and VECTOR_STORE == "local":
+    startup = server_startup(snapshots.open)
+else:
+    startup = server_startup(init_pinecone)
+    if snapshots is not None:
+        startup.add("snapshot", snapshots.open)
+
+index = None  # gán thẳng để dùng index khác (test); None = index của startup
+
+def get_index(block=False):
+    """
+    Vector index cho request. Trong lúc khởi động chờ tối đa STARTUP_WAIT_TIMEOUT giây
+    rồi NotReady (503); block=True chờ tới khi có (job upload chạy nền).
+    """
+    if index is not None:
+        return index
+    return startup.wait("vector_index", None if block else STARTUP_WAIT_TIMEOUT)
+
+# Job upload chờ index tới khi sẵn sàng; chạy tiếp job dở từ lần trước khi index đã có
+# (nhiều worker: mỗi worker nhận các job mồ côi trong UPLOAD_JOBS_DIR, xem upload_jobs.py)
+upload_jobs = UploadJobs(lambda: get_index(block=True), UPLOAD_JOBS_DIR or None,
+                         UPLOAD_WORKERS, UPLOAD_BATCH_SIZE,
+                         session=snapshots.writer if snapshots is not None else None)
+startup.add("upload_jobs", upload_jobs.resume, required=False, after=("vector_index",))
+startup.start()
+
+@app.before_request
+def refresh_snapshot():
+    """Worker khác vừa publish snapshot mới (upload) -> đổi sang trước khi xử lý request"""
+    if snapshots is not None:
+        snapshots.refresh()
 
 @app.route("/api/health", methods=["GET"])
+@app.route("/api/health/live", methods=["GET"])
 def health():
+    """Liveness: process còn phục vụ request, không phụ thuộc index / provider"""
     return jsonify({"status":"ok"}), 200
 
+@app.route("/api/health/ready", methods=["GET"])
+def ready():
+    """Readiness: mọi phụ thuộc bắt buộc đã khởi tạo xong (503 kèm trạng thái từng cái nếu chưa)"""
+    report = startup.report()
+    return jsonify(report), (200 if report["ready"] else 503)
+
+def _not_ready(e: NotReady):
+    return jsonify({"error": "Service starting", "dependency": e.name, "exception": str(e)}), 503
+
+@app.route("/api/stats", methods=["GET"])
+def stats():
+    return jsonify({
+        "routing": get_routing_stats(),
+        "embedding_cache": get_embedding_cache_stats(),
+        "answer_cache": answer_cache.stats(),
+        "upstream_cache": get_upstream_cache_stats(),
+        "context": get_context_stats(),
+        "latency": get_latency_stats(),
+        "providers": get_provider_stats(),
+        "snapshot": snapshots.stats() if snapshots is not None else None,
+    }), 200
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics():
+    """Latency histogram + counter theo Prometheus text format"""
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/api/upload", methods=["POST"])
 def upload_students():
+    """
+    Nhận roster, lưu lại và trả job_id ngay (202); job chạy nền, xem tiến độ ở
+    GET /api/upload/<job_id>. ?wait=true thì chờ job xong rồi mới trả kết quả (roster nhỏ).
+    """
     try:
         data = request.get_json() or {}
         students = data.get("students") if isinstance(data, dict) else data
+        prune = data.get("prune", True) if isinstance(data, dict) else True
         if not isinstance(students, list):
             return jsonify({"error":"students must be a list"}), 400
 
-        vectors = []
-        for idx, s in enumerate(students, start=1):
-            sid = s.get("id") or f"student_{idx:04d}"
-            text = student_to_text(s)
-            emb = get_embedding(text)
-            if len(emb) != 768:
-                return jsonify({"error":"Embedding dimension mismatch"}), 500
-
-            metadata = {
-                "name": s.get("name"),
-                "dob": s.get("dob"),
-                "address": s.get("address"),
-                "hobby": s.get("hobby"),
-                "interest": s.get("interest"),
-                "skill": s.get("skill"),
-                "text": text
-            }
-            vectors.append((sid, emb, metadata))
-
-            if len(vectors) >= 50:
-                upsert_vectors(index, vectors)
-                vectors = []
-
-        if vectors:
-            upsert_vectors(index, vectors)
-
-        return jsonify({"status":"uploaded", "count": len(students)}), 200
+        job = upload_jobs.submit(students, prune=prune)
+        if request.args.get("wait", "").lower() in ("1", "true"):
+            job = upload_jobs.wait(job["id"])
+            return jsonify(job), (200 if job["status"] == "done" else 500)
+        return jsonify({
+            "job_id": job["id"], "status": job["status"], "status_url": f"/api/upload/{job['id']}",
+        }), 202
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/upload/<job_id>", methods=["GET"])
+def upload_status(job_id):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error":"job not found"}), 404
+    return jsonify(job), 200
+
+def _retrieve(question):
+    """Embed câu hỏi + hybrid retrieval, trả về (q_emb, related, documents_text, context_stats)"""
+    # Log debug chỉ cho 1 phần request (DEBUG_SAMPLE_RATE): in cả response Pinecone rất tốn
+    debug = sample_debug()
+
+    # =========================
+    # 1️⃣ Tạo embedding
+    # =========================
+    with span("embedding"):
+        q_emb = get_embedding(question)
+    if debug:
+        print("DEBUG: question =", question)
+        print("DEBUG: embedding length =", len(q_emb))
+        print("DEBUG: embedding sample (first 10 dims) =", q_emb[:10])
+
+    # =========================
+    # 2️⃣ Query Pinecone (filter + BM25)
+    # =========================
+    vector_index = get_index()
+    with span("vector_query"):
+        # Pinecone qua mạng: hedge sau p95; index local trong process thì không cần
+        res = call("vector_store", lambda: retrieve(vector_index, q_emb, question, top_k=TOP_K),
+                   hedge=VECTOR_STORE == "pinecone")
+    if debug:
+        print("DEBUG: metadata filter =", res["filter"])
+        print("DEBUG: raw Pinecone response =", res)
+
+    # =========================
+    # 3️⃣ Ghép context trong giới hạn token
+    # =========================
+    with span("context"):
+        related, verbose_text = format_matches(res)
+        documents_text, context_stats = build_context(related, verbose_text)
+    if debug:
+        print("DEBUG: matches found =", len(related))
+        print("DEBUG: context tokens =", context_stats)
+    return q_emb, related, documents_text, context_stats
+
+def _answer_with_cache(q_emb, related, documents_text, question, intent):
+    """Dùng lại câu trả lời của câu hỏi tương tự (cùng học sinh), nếu không thì gọi Gemini"""
+    ids = [r["id"] for r in related]
+    answer = answer_cache.get(q_emb, ids)
+    inc("rag_answer_cache_total", result="hit" if answer is not None else "miss")
+    if answer is not None:
+        return answer, True
+    with span("generation"):
+        answer = generate_answer(documents_text, question, intent=intent)
+    answer_cache.put(q_emb, ids, answer)
+    return answer, False
+
+def _unavailable(e: ProviderUnavailable):
+    """Embedding / vector store không trả lời kịp: không có gì để hạ cấp -> 504 / 503"""
+    inc("rag_degraded_total", provider=e.provider, reason=e.reason)
+    status = 504 if isinstance(e, DeadlineExceeded) else 503
+    return jsonify({"error": "Provider unavailable", "provider": e.provider,
+                    "reason": e.reason, "exception": str(e)}), status
+
+def _degraded(related, intent, e: ProviderUnavailable, context_stats=None):
+    """Gemini không trả lời kịp: trả câu trả lời chỉ từ retrieval, đánh dấu degraded"""
+    payload = {"answer": degraded_answer(related, e), "related": related, "intent": intent,
+               "degraded": True, "degraded_reason": e.reason}
+    if context_stats is not None:
+        payload["context"] = context_stats
+    return jsonify(payload), 200
+
 @app.route("/api/chat", methods=["POST"])
 def chat():
+    # 1 deadline cho cả câu hỏi: embed, retrieve và generate chỉ được dùng phần còn lại
+    with span("total", endpoint="chat"), deadline(CHAT_DEADLINE):
+        return _chat()
+
+def _chat():
     try:
         body = request.get_json() or {}
         question = (body.get("question") or "").strip()
@@ -68,49 +218,42 @@ def chat():
             return jsonify({"error":"question is required"}), 400
 
         # =========================
-        # 1️⃣ Tạo embedding và debug
+        # 0️⃣ Phân loại intent trước khi embed
         # =========================
-        q_emb = get_embedding(question)
-        print("DEBUG: question =", question)
-        print("DEBUG: embedding length =", len(q_emb))
-        print("DEBUG: embedding sample (first 10 dims) =", q_emb[:10])
+        intent, needs_context = route(question)
+        inc("rag_requests_total", endpoint="chat", intent=intent)
 
-        # =========================
-        # 2️⃣ Query Pinecone và debug
-        # =========================
-        res = query_index(index, q_emb, top_k=TOP_K)
-        print("DEBUG: raw Pinecone response =", res)
+        # Đếm / liệt kê / thống kê: trả lời đầy đủ từ bảng metadata, không cần top_k + LLM
+        structured = try_structured_answer(question, intent)
+        if structured is not None:
+            return jsonify({**structured, "intent": intent}), 200
 
-        matches = res.matches if hasattr(res, "matches") else res.get("matches", [])
-        print("DEBUG: matches found =", len(matches))
+        if not needs_context:
+            # Time/date/weather/... không dùng context -> bỏ qua embedding + Pinecone
+            try:
+                with span("generation"):
+                    answer = generate_answer("", question, intent=intent)
+            except ProviderUnavailable as e:
+                return _degraded([], intent, e)
+            return jsonify({"answer": answer, "related": [], "intent": intent}), 200
 
-        if not matches:
-            return jsonify({"answer": "Không có thông tin.", "related": []}), 200
+        try:
+            q_emb, related, documents_text, context_stats = _retrieve(question)
+        except ProviderUnavailable as e:
+            return _unavailable(e)
+        except NotReady as e:
+            return _not_ready(e)
+        if not related:
+            return jsonify({"answer": "Không có thông tin.", "related": [], "intent": intent}), 200
 
-        # =========================
-        # 3️⃣ Chuẩn bị dữ liệu trả về
-        # =========================
-        docs = []
-        related = []
-        for m in matches:
-            md = m.metadata if hasattr(m, "metadata") else m.get("metadata", {})
-            s = {
-                "id": getattr(m, "id", m.get("id")),
-                "score": getattr(m, "score", m.get("score")),
-                "name": md.get("name"),
-                "dob": md.get("dob"),
-                "address": md.get("address"),
-                "hobby": md.get("hobby"),
-                "interest": md.get("interest"),
-                "skill": md.get("skill")
-            }
-            related.append(s)
-            line = f"{s['name']}, DOB: {s['dob']}, Address: {s['address']}, Hobby: {s['hobby']}, Skill: {s['skill']}"
-            docs.append(line)
-
-        documents_text = "\n".join(f"- {d}" for d in docs)
-        answer = generate_answer(documents_text, question)
-        return jsonify({"answer": answer, "related": related}), 200
+        try:
+            answer, cached = _answer_with_cache(q_emb, related, documents_text, question, intent)
+        except ProviderUnavailable as e:
+            return _degraded(related, intent, e, context_stats)
+        return jsonify({
+            "answer": answer, "related": related, "intent": intent,
+            "cached": cached, "context": context_stats,
+        }), 200
 
     except Exception as e:
         # =========================
@@ -119,6 +262,107 @@ def chat():
         traceback.print_exc()
         return jsonify({"error":"Server error", "exception": str(e)}), 500
 
+@app.route("/api/chat/batch", methods=["POST"])
+def chat_batch():
+    """
+    Nhiều câu hỏi 1 request: {"questions": ["...", ...]}. Trả về NDJSON, mỗi dòng 1 câu
+    theo thứ tự xong trước: {"index", "question", "answer", "related", "intent", ...}
+    (hoặc "error"), dòng cuối {"summary": {...}}. Xem batch_chat.py.
+    """
+    body = request.get_json(silent=True) or {}
+    questions = body.get("questions") if isinstance(body, dict) else body
+    if not isinstance(questions, list) or not all(isinstance(q, str) for q in questions):
+        return jsonify({"error":"questions must be a list of strings"}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"at most {BATCH_MAX_QUESTIONS} questions per batch"}), 413
+    try:
+        vector_index = get_index()
+    except NotReady as e:
+        return _not_ready(e)
+
+    def lines():
+        with span("total", endpoint="chat_batch"):
+            for result in answer_batch(vector_index, questions):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(lines()), mimetype="application/x-ndjson",
+                    headers={"X-Accel-Buffering": "no"})
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route("/api/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Như /api/chat nhưng trả về Server-Sent Events:
+      event: related -> {"related": [...], "intent": ..., "context": {...}} (gửi ngay sau retrieval)
+      event: token   -> {"text": "..."} (từng đoạn câu trả lời)
+      event: done    -> {} ({"degraded": reason} nếu Gemini không kịp, token là câu trả lời hạ cấp)
+      event: error   -> {"error": "..."}
+    """
+    body = request.get_json() or {}
+    question = (body.get("question") or "").strip()
+    if not question:
+        return jsonify({"error":"question is required"}), 400
+
+    def events():
+        with deadline(CHAT_DEADLINE):
+            yield from _chat_events(question)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
+
+def _chat_events(question):
+    """Các event SSE của /api/chat/stream, chạy trong deadline của request"""
+    try:
+        start = time.perf_counter()
+        intent, needs_context = route(question)
+        inc("rag_requests_total", endpoint="chat_stream", intent=intent)
+        structured = try_structured_answer(question, intent)
+        if structured is not None:
+            yield _sse("related", {"related": structured["related"], "intent": intent,
+                                   "structured": structured["structured"]})
+            yield _sse("token", {"text": structured["answer"]})
+            yield _sse("done", {})
+            return
+        q_emb, related, documents_text, context_stats = None, [], "", None
+        if needs_context:
+            q_emb, related, documents_text, context_stats = _retrieve(question)
+        payload = {"related": related, "intent": intent}
+        if context_stats is not None:
+            payload["context"] = context_stats
+        yield _sse("related", payload)
+
+        ids = [r["id"] for r in related]
+        cached = answer_cache.get(q_emb, ids) if related else None
+        if related:
+            inc("rag_answer_cache_total", result="hit" if cached is not None else "miss")
+        if needs_context and not related:
+            yield _sse("token", {"text": "Không có thông tin."})
+        elif cached is not None:
+            yield _sse("token", {"text": cached})
+        else:
+            parts = []
+            try:
+                with span("generation"):
+                    for text in generate_answer_stream(documents_text, question, intent=intent):
+                        if not parts:
+                            # Thời gian từ lúc nhận request tới token đầu tiên
+                            observe(STAGE_SECONDS, time.perf_counter() - start, stage="first_token")
+                        parts.append(text)
+                        yield _sse("token", {"text": text})
+            except ProviderUnavailable as e:
+                # Chỉ xảy ra trước token đầu tiên (xem generator._generate_gemini_stream)
+                yield _sse("token", {"text": degraded_answer(related, e)})
+                yield _sse("done", {"degraded": e.reason})
+                return
+            if related:
+                answer_cache.put(q_emb, ids, "".join(parts))
+        yield _sse("done", {})
+    except Exception as e:
+        traceback.print_exc()
+        yield _sse("error", {"error": str(e)})
+
 
 if __name__ == "__main__":
     app.run(host=FLASK_HOST, port=FLASK_PORT)
@@ -0,0 +1,105 @@
+# asgi.py
+"""
+ASGI server cho chat path async:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Phục vụ /api/health (/live, /ready), /api/metrics và /api/chat (cùng request/response
+với app.py). Upload vẫn đi qua app.py (Flask) hoặc ingest.py. Index và kiểm tra embedding
+khởi tạo nền như app.py (startup.py): server nhận request ngay khi lifespan bắt đầu.
+"""
+import asyncio
+import traceback
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from pinecone_helper import init_pinecone
+from async_pipeline import answer_question, new_http_client, StageTimeout
+from resilience import ProviderUnavailable, DeadlineExceeded
+from startup import server_startup, NotReady
+from metrics import span, render_prometheus
+from config import STARTUP_WAIT_TIMEOUT
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # lambda: tra init_pinecone lúc chạy (test thay được asgi.init_pinecone)
+    app.state.startup = server_startup(lambda: init_pinecone()).start()
+    app.state.http = new_http_client()
+    yield
+    await app.state.http.aclose()
+
+
+async def _index(app):
+    startup = app.state.startup
+    if startup.is_ready():
+        return startup.wait("vector_index")
+    # Đang khởi động: chờ trong thread để không block event loop
+    return await asyncio.to_thread(startup.wait, "vector_index", STARTUP_WAIT_TIMEOUT)
+
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def ready(request):
+    report = request.app.state.startup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+async def metrics(request):
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def chat(request):
+    with span("total", endpoint="chat_async"):
+        return await _chat(request)
+
+
+async def _chat(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    question = ((body.get("question") if isinstance(body, dict) else None) or "").strip()
+    if not question:
+        return JSONResponse({"error": "question is required"}, status_code=400)
+
+    try:
+        index = await _index(request.app)
+        result = await answer_question(index, question, request.app.state.http)
+        return JSONResponse(result)
+    except NotReady as e:
+        return JSONResponse({"error": "Service starting", "dependency": e.name, "exception": str(e)},
+                            status_code=503)
+    except StageTimeout as e:
+        return JSONResponse({"error": "Timeout", "stage": e.stage, "exception": str(e)}, status_code=504)
+    except ProviderUnavailable as e:
+        # Embedding / vector store lỗi hoặc circuit open (Gemini lỗi thì đã hạ cấp trong pipeline)
+        status = 504 if isinstance(e, DeadlineExceeded) else 503
+        return JSONResponse({"error": "Provider unavailable", "provider": e.provider,
+                             "reason": e.reason, "exception": str(e)}, status_code=status)
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse({"error": "Server error", "exception": str(e)}, status_code=500)
+
+
+app = Starlette(
+    routes=[
+        Route("/api/health", health, methods=["GET"]),
+        Route("/api/health/live", health, methods=["GET"]),
+        Route("/api/health/ready", ready, methods=["GET"]),
+        Route("/api/chat", chat, methods=["POST"]),
+        Route("/api/metrics", metrics, methods=["GET"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
@@ -0,0 +1,111 @@
+# async_pipeline.py
+"""
+Chat pipeline async: route -> embed -> retrieve -> generate, mỗi stage có timeout
+riêng. Một event loop giữ được hàng trăm cuộc chat cùng lúc vì các stage chỉ chờ
+network chứ không giữ thread.
+
+Cả câu hỏi chạy trong 1 deadline (CHAT_DEADLINE, resilience.py): timeout của mỗi stage
+không vượt quá thời gian còn lại. Gemini không kịp thì trả câu trả lời chỉ từ retrieval
+(degraded) thay vì lỗi; embedding / vector store không kịp thì vẫn là StageTimeout.
+"""
+import asyncio
+
+import httpx
+
+from config import (
+    TOP_K, CHAT_EMBED_TIMEOUT, CHAT_RETRIEVE_TIMEOUT, CHAT_GENERATE_TIMEOUT,
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, CHAT_DEADLINE, VECTOR_STORE,
+)
+from answer_cache import answer_cache
+from embedder import get_embedding_async
+from generator import generate_answer_async, degraded_answer
+from retrieval import retrieve
+from router import route
+from structured_query import try_answer as try_structured_answer
+from utils import format_matches
+from context_builder import build_context
+from metrics import span, inc
+from resilience import call_async, deadline, remaining, DeadlineExceeded, ProviderUnavailable
+
+
+class StageTimeout(Exception):
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"Stage '{stage}' vượt quá {seconds}s")
+        self.stage = stage
+        self.seconds = seconds
+
+
+async def _stage(name, awaitable, timeout):
+    with span(name):
+        try:
+            return await asyncio.wait_for(awaitable, remaining(timeout))
+        except (asyncio.TimeoutError, DeadlineExceeded):
+            raise StageTimeout(name, timeout)
+
+
+def new_http_client():
+    """httpx.AsyncClient dùng chung cả process: pool kết nối + keep-alive cho weather/news"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        timeout=10,
+    )
+
+
+async def answer_question(index, question: str, http) -> dict:
+    """Trả về {"answer", "related", "intent"} giống /api/chat"""
+    with deadline(CHAT_DEADLINE):
+        return await _answer_question(index, question, http)
+
+
+async def _answer_question(index, question: str, http) -> dict:
+    intent, needs_context = route(question)
+    inc("rag_requests_total", endpoint="chat_async", intent=intent)
+    structured = try_structured_answer(question, intent)
+    if structured is not None:
+        return {**structured, "intent": intent}
+
+    related, documents_text, context_stats = [], "", None
+    if needs_context:
+        q_emb = await _stage("embedding", get_embedding_async(question), CHAT_EMBED_TIMEOUT)
+        # Pinecone SDK là sync -> chạy trong thread pool để không block event loop
+        res = await _stage(
+            "vector_query",
+            call_async("vector_store", lambda: asyncio.to_thread(retrieve, index, q_emb, question, TOP_K),
+                       hedge=VECTOR_STORE == "pinecone"),
+            CHAT_RETRIEVE_TIMEOUT,
+        )
+        with span("context"):
+            related, verbose_text = format_matches(res)
+            documents_text, context_stats = build_context(related, verbose_text)
+        if not related:
+            return {"answer": "Không có thông tin.", "related": [], "intent": intent}
+
+        ids = [r["id"] for r in related]
+        cached = answer_cache.get(q_emb, ids)
+        inc("rag_answer_cache_total", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            return {"answer": cached, "related": related, "intent": intent, "cached": True,
+                    "context": context_stats}
+
+    try:
+        answer = await _stage(
+            "generation",
+            generate_answer_async(documents_text, question, intent=intent, http=http),
+            CHAT_GENERATE_TIMEOUT,
+        )
+    except StageTimeout as e:
+        return _degraded(related, intent, DeadlineExceeded("gemini", str(e)), context_stats)
+    except ProviderUnavailable as e:
+        return _degraded(related, intent, e, context_stats)
+    if needs_context:
+        answer_cache.put(q_emb, [r["id"] for r in related], answer)
+        return {"answer": answer, "related": related, "intent": intent, "context": context_stats}
+    return {"answer": answer, "related": related, "intent": intent}
+
+
+def _degraded(related, intent, error, context_stats=None):
+    result = {"answer": degraded_answer(related, error), "related": related, "intent": intent,
+              "degraded": True, "degraded_reason": error.reason}
+    if context_stats is not None:
+        result["context"] = context_stats
+    return result
@@ -0,0 +1,177 @@
+# batch_chat.py
+"""
+Trả lời nhiều câu hỏi trong 1 request (POST /api/chat/batch) cho tool nội bộ / job đánh giá:
+
+1. Câu hỏi giống hệt nhau (sau khi gộp khoảng trắng) chỉ trả lời 1 lần.
+2. Phân loại intent cả lô; câu đếm / liệt kê / tra cứu trả lời ngay từ bảng học sinh.
+3. Câu cần RAG được embed theo batch của provider (get_embeddings: batch_size / workers
+   của EMBEDDING_PROVIDER, có cache), từng đợt để vector query của đợt đầu bắt đầu sớm.
+4. Vector query chạy song song (BATCH_RETRIEVE_WORKERS thread).
+5. Sinh câu trả lời với tối đa BATCH_GENERATE_CONCURRENCY request Gemini cùng lúc.
+
+answer_batch() yield kết quả theo thứ tự xong trước (mỗi kết quả có "index" của câu hỏi
+trong request), cuối cùng là {"summary": ...}. Không có deadline như /api/chat: provider
+lỗi thì thử lại (resilience.call) rồi trả câu trả lời hạ cấp / "error" cho riêng câu đó.
+"""
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from config import TOP_K, BATCH_RETRIEVE_WORKERS, BATCH_GENERATE_CONCURRENCY
+from answer_cache import answer_cache
+from context_builder import build_context
+from embedder import get_embeddings, get_provider
+from generator import generate_answer, degraded_answer
+from resilience import ProviderUnavailable
+from retrieval import retrieve
+from router import route
+from structured_query import try_answer as try_structured_answer
+from utils import format_matches
+from metrics import span, inc
+
+
+def _normalize(question) -> str:
+    return " ".join(str(question or "").split())
+
+
+class _Batch:
+    """Trạng thái của 1 batch: các pool và hàng đợi kết quả (question, result)"""
+
+    def __init__(self, index):
+        self.index = index
+        self.results = queue.Queue()
+        self.retrieve_pool = ThreadPoolExecutor(BATCH_RETRIEVE_WORKERS, thread_name_prefix="batch-retrieve")
+        self.generate_pool = ThreadPoolExecutor(BATCH_GENERATE_CONCURRENCY, thread_name_prefix="batch-generate")
+        self.cancelled = threading.Event()
+
+    def finish(self, question, result):
+        self.results.put((question, result))
+
+    def submit(self, pool, question, fn, *args):
+        """Chạy fn trên pool; lỗi không lường trước chỉ làm hỏng câu hỏi đó"""
+        def run():
+            if self.cancelled.is_set():
+                return
+            try:
+                fn(question, *args)
+            except Exception as e:
+                traceback.print_exc()
+                self.finish(question, {"error": str(e)})
+        if not self.cancelled.is_set():
+            pool.submit(run)
+
+    def shutdown(self):
+        self.cancelled.set()
+        self.retrieve_pool.shutdown(wait=False, cancel_futures=True)
+        self.generate_pool.shutdown(wait=False, cancel_futures=True)
+
+    # =========================
+    # Các stage
+    # =========================
+    def embed(self, rag, chunk):
+        """Embed câu hỏi RAG theo từng đợt chunk câu, xong đợt nào query đợt đó"""
+        for start in range(0, len(rag), chunk):
+            if self.cancelled.is_set():
+                return
+            part = rag[start:start + chunk]
+            try:
+                with span("embedding"):
+                    vectors = get_embeddings([q for q, _ in part])
+            except Exception as e:
+                traceback.print_exc()
+                for question, _ in part:
+                    self.finish(question, {"error": str(e)})
+                continue
+            for (question, intent), q_emb in zip(part, vectors):
+                self.submit(self.retrieve_pool, question, self.retrieve, intent, q_emb)
+
+    def retrieve(self, question, intent, q_emb):
+        with span("vector_query"):
+            res = retrieve(self.index, q_emb, question, top_k=TOP_K)
+        with span("context"):
+            related, verbose_text = format_matches(res)
+            documents_text, context_stats = build_context(related, verbose_text)
+        if not related:
+            self.finish(question, {"answer": "Không có thông tin.", "related": [], "intent": intent})
+            return
+
+        ids = [r["id"] for r in related]
+        cached = answer_cache.get(q_emb, ids)
+        inc("rag_answer_cache_total", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            self.finish(question, {"answer": cached, "related": related, "intent": intent,
+                                   "cached": True, "context": context_stats})
+            return
+        self.submit(self.generate_pool, question, self.generate, intent, related,
+                    documents_text, context_stats, q_emb)
+
+    def generate(self, question, intent, related=(), documents_text="", context_stats=None, q_emb=None):
+        related = list(related)
+        result = {"related": related, "intent": intent}
+        if context_stats is not None:
+            result["context"] = context_stats
+        try:
+            with span("generation"):
+                answer = generate_answer(documents_text, question, intent=intent)
+        except ProviderUnavailable as e:
+            self.finish(question, {**result, "answer": degraded_answer(related, e),
+                                   "degraded": True, "degraded_reason": e.reason})
+            return
+        if related:
+            answer_cache.put(q_emb, [r["id"] for r in related], answer)
+        self.finish(question, {**result, "answer": answer})
+
+
+def answer_batch(index, questions):
+    """
+    Generator: trả lời questions (list str), yield {"index", "question", "answer", ...}
+    cho từng câu theo thứ tự xong trước, cuối cùng {"summary": {...}}.
+    """
+    start = time.perf_counter()
+    positions = {}  # câu hỏi đã chuẩn hoá -> vị trí trong request
+    for i, question in enumerate(questions):
+        positions.setdefault(_normalize(question), []).append(i)
+
+    batch = _Batch(index)
+    counts = {"structured": 0, "rag": 0, "direct": 0, "errors": 0, "degraded": 0}
+    rag = []
+    try:
+        for question in positions:
+            if not question:
+                batch.finish(question, {"error": "question is required"})
+                continue
+            intent, needs_context = route(question)
+            inc("rag_requests_total", endpoint="chat_batch", intent=intent)
+            structured = try_structured_answer(question, intent)
+            if structured is not None:
+                counts["structured"] += 1
+                batch.finish(question, {**structured, "intent": intent})
+            elif needs_context:
+                counts["rag"] += 1
+                rag.append((question, intent))
+            else:
+                counts["direct"] += 1
+                batch.submit(batch.generate_pool, question, batch.generate, intent)
+        if rag:
+            # Mỗi đợt đủ cho mọi worker embedding của provider cùng gửi 1 batch.
+            # Embed chạy nền để kết quả đã xong (structured, direct) được trả về ngay
+            provider = get_provider()
+            chunk = max(provider.batch_size * provider.workers, 1)
+            threading.Thread(target=batch.embed, args=(rag, chunk), daemon=True).start()
+
+        for _ in range(len(positions)):
+            question, result = batch.results.get()
+            counts["errors"] += "error" in result
+            counts["degraded"] += bool(result.get("degraded"))
+            for i in positions[question]:
+                yield {"index": i, "question": questions[i], **result}
+    finally:
+        # Client ngắt giữa chừng -> bỏ các câu chưa chạy
+        batch.shutdown()
+
+    yield {"summary": {
+        "questions": len(questions), "unique": len(positions), **counts,
+        "seconds": round(time.perf_counter() - start, 3),
+    }}
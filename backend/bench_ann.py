@@ -0,0 +1,81 @@
+# bench_ann.py
+"""
+Benchmark recall@k và latency của IVF so với exact search trên dữ liệu giả 768 chiều.
+
+    python bench_ann.py --n 200000 --nlist 1024 --nprobes 1,4,8,16,32,64
+
+Dữ liệu sinh theo cụm (giống embedding thật hơn nhiễu Gaussian thuần).
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex
+from vector_store import LocalVectorIndex
+
+
+def synthetic(n, dim, centers, seed=0):
+    rng = np.random.default_rng(seed)
+    c = rng.normal(size=(centers, dim)).astype(np.float32)
+    out = np.empty((n, dim), dtype=np.float32)
+    for i in range(0, n, 100_000):
+        m = min(100_000, n - i)
+        out[i:i + m] = c[rng.integers(0, centers, m)] + 0.5 * rng.normal(size=(m, dim)).astype(np.float32)
+    return out
+
+
+def build(path, X, ann=None, batch=10_000):
+    index = LocalVectorIndex(path, X.shape[1], ann=ann)
+    for i in range(0, len(X), batch):
+        index.upsert([(str(j), X[j], {}) for j in range(i, min(i + batch, len(X)))])
+    return index
+
+
+def run_queries(index, queries, k, **kwargs):
+    results, start = [], time.perf_counter()
+    for q in queries:
+        results.append({m["id"] for m in index.query(q, top_k=k, include_metadata=False, **kwargs)["matches"]})
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--centers", type=int, default=2000, help="số cụm trong dữ liệu giả")
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobes", default="1,4,8,16,32,64")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"Sinh {args.n} vectors {args.dim} chiều...")
+    X = synthetic(args.n, args.dim, args.centers)
+    rng = np.random.default_rng(1)
+    queries = X[rng.choice(args.n, args.queries, replace=False)] + 0.1 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+    tmp = tempfile.mkdtemp(prefix="bench_ann_")
+    try:
+        exact_index = build(f"{tmp}/flat", X)
+        truth, exact_ms = run_queries(exact_index, queries, args.k)
+
+        start = time.perf_counter()
+        ann = IVFIndex(f"{tmp}/ivf", args.dim, nlist=args.nlist)
+        ivf_index = build(f"{tmp}/ivf", X, ann=ann)
+        print(f"Build IVF (gồm train k-means): {time.perf_counter() - start:.1f}s, trained={ann.trained}")
+
+        print(f"{'index':>10} {'nprobe':>7} {'recall@' + str(args.k):>10} {'ms/query':>9} {'speedup':>8}")
+        print(f"{'exact':>10} {'-':>7} {1.0:>10.3f} {exact_ms:>9.2f} {1.0:>8.1f}")
+        for nprobe in map(int, args.nprobes.split(",")):
+            got, ms = run_queries(ivf_index, queries, args.k, nprobe=nprobe)
+            recall = sum(len(a & b) for a, b in zip(truth, got)) / (args.k * len(queries))
+            print(f"{'ivf':>10} {nprobe:>7} {recall:>10.3f} {ms:>9.2f} {exact_ms / ms:>8.1f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
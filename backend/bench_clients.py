@@ -0,0 +1,96 @@
+# bench_clients.py
+"""
+Benchmark chi phí tạo client mỗi request so với dùng lại client từ registry (clients.py).
+
+    python bench_clients.py --n 200
+    python bench_clients.py --url https://newsapi.org --n 20   # đo cả TLS handshake thật
+
+Không có --url thì dùng 1 HTTP server local (chỉ đo được TCP connect, chưa có TLS).
+Phần Gemini chỉ đo configure + GenerativeModel, không gọi API.
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import clients
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Header + body gửi 1 lần, tránh delayed-ACK 40ms trên kết nối keep-alive
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"status": "ok"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def timed(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1000
+
+
+def bench_http(url, n):
+    fresh = timed(lambda: requests.get(url, timeout=10).content, n)
+    session = clients.get_http_session()
+    session.get(url, timeout=10).content   # mở kết nối trước, như warm_up()
+    pooled = timed(lambda: session.get(url, timeout=10).content, n)
+    return fresh, pooled
+
+
+def bench_gemini(n):
+    import google.generativeai as genai
+
+    def per_call():
+        genai.configure(api_key="bench-key")
+        genai.GenerativeModel(clients.GEMINI_CHAT_MODEL)
+
+    fresh = timed(per_call, n)
+    clients.get_generative_model()
+    pooled = timed(clients.get_generative_model, n)
+    return fresh, pooled
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200, help="số request mỗi cách")
+    parser.add_argument("--url", default=None, help="URL thật để đo (mặc định: server local)")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    rows = [("http " + url, *bench_http(url, args.n))]
+    try:
+        rows.append(("gemini configure+model", *bench_gemini(args.n)))
+    except ImportError:
+        print("Bỏ qua Gemini: chưa cài google-generativeai")
+
+    print(f"{'client':>40} {'per-call ms':>12} {'registry ms':>12} {'saved ms':>9}")
+    for name, fresh, pooled in rows:
+        print(f"{name:>40} {fresh:>12.3f} {pooled:>12.3f} {fresh - pooled:>9.3f}")
+
+    clients.reset()
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
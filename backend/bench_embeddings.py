@@ -0,0 +1,43 @@
+# bench_embeddings.py
+"""
+Benchmark throughput embedding offline bằng fake provider.
+
+    python bench_embeddings.py --n 10000 --latency-ms 150
+
+So sánh gọi từng text một (như cách cũ) với batch + worker pool.
+"""
+import argparse
+import time
+
+from fake_providers import fake_embed_batch
+from utils import embed_in_batches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=2000, help="số text")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--latency-ms", type=float, default=50, help="latency giả lập mỗi request")
+    parser.add_argument("--batch-sizes", default="1,20,100")
+    parser.add_argument("--workers", default="1,4,8")
+    args = parser.parse_args()
+
+    texts = [f"Name: Student {i}. Address: Hà Nội. Hobby: Đọc sách. Skill: Đá bóng {i % 7}." for i in range(args.n)]
+
+    def embed_batch(batch):
+        return fake_embed_batch(batch, args.dim, latency_ms=args.latency_ms)
+
+    print(f"{'batch':>6} {'workers':>8} {'seconds':>9} {'texts/s':>10}")
+    for batch_size in map(int, args.batch_sizes.split(",")):
+        for workers in map(int, args.workers.split(",")):
+            # batch=1, workers=1 tương đương vòng lặp get_embedding tuần tự cũ
+            n = min(args.n, 200) if batch_size == 1 and workers == 1 else args.n
+            start = time.perf_counter()
+            vectors = embed_in_batches(texts[:n], embed_batch, batch_size=batch_size, max_workers=workers)
+            elapsed = time.perf_counter() - start
+            assert len(vectors) == n
+            print(f"{batch_size:>6} {workers:>8} {elapsed:>9.3f} {n / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# bench_intent.py
+"""
+So sánh bộ phân loại intent cũ (quét `keyword in question` theo thứ tự dict)
+với intent_matcher: độ chính xác trên data_intents.json và số câu/giây.
+
+    python bench_intent.py --repeat 2000
+"""
+import argparse
+import json
+import os
+import time
+
+from intent_matcher import INTENT_KEYWORDS, matcher
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_intents.json")
+
+# Bảng cũ: các phép tính là ký tự toán tử đứng riêng
+_LEGACY_KEYWORDS = dict(INTENT_KEYWORDS, calculation=INTENT_KEYWORDS["calculation"] + ["+", "-", "*", "/"])
+
+
+def legacy_classify(question: str) -> str:
+    question_lower = question.lower()
+    for intent, keywords in _LEGACY_KEYWORDS.items():
+        if any(keyword in question_lower for keyword in keywords):
+            return intent
+    return "general"
+
+
+def load_cases(path=DATA_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def accuracy(classify, cases):
+    return sum(classify(c["question"]) == c["intent"] for c in cases) / len(cases)
+
+
+def throughput(classify, questions, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in questions:
+            classify(q)
+    return repeat * len(questions) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000, help="số lần lặp lại bộ câu hỏi")
+    args = parser.parse_args()
+
+    cases = load_cases()
+    questions = [c["question"] for c in cases]
+    print(f"{len(cases)} câu có nhãn, lặp {args.repeat} lần")
+    # Câu không khớp từ khoá nào là trường hợp xấu nhất của bộ cũ (quét hết bảng)
+    unmatched = [c["question"] for c in cases if c["intent"] == "general"]
+    print(f"{'classifier':>12} {'accuracy':>9} {'q/s':>10} {'q/s (general)':>14}")
+    for name, classify in (("legacy", legacy_classify), ("matcher", matcher.classify)):
+        print(f"{name:>12} {accuracy(classify, cases):>9.3f} "
+              f"{throughput(classify, questions, args.repeat):>10.0f} "
+              f"{throughput(classify, unmatched, args.repeat):>14.0f}")
+
+    wrong = [(c["question"], c["intent"], matcher.classify(c["question"]))
+             for c in cases if matcher.classify(c["question"]) != c["intent"]]
+    for question, expected, got in wrong:
+        print(f"  sai: {question!r} -> {got} (nhãn {expected})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+# bench_load.py
+"""
+Benchmark tải cho /api/chat, /api/chat/batch và /api/upload, chạy offline hoàn toàn:
+
+    python bench_load.py generate --n 5000 --out cache/students_5000.json
+    python bench_load.py run --roster 2000 --concurrency 1,8,32 --output cache/bench_before.json
+    python bench_load.py run --endpoints chat,batch --concurrency 8 --requests 400 --batch-size 400
+    python bench_load.py compare cache/bench_before.json cache/bench_after.json
+
+"run" mặc định khởi động app.py trong process (werkzeug, threaded) với provider giả lập:
+embedding fake, model Gemini giả (FakeGenerativeModel), local vector index bọc FakeVectorIndex;
+latency + tỉ lệ lỗi của từng provider chỉnh qua tham số. --url để bắn vào server đang chạy.
+Kết quả (throughput, p50/p95/p99, tỉ lệ lỗi theo endpoint x concurrency) ghi ra JSON,
+"compare" so 2 file và trả exit code 1 nếu có regression vượt --threshold.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BASE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_students.json")
+
+_FAMILY = ["Nguyen", "Tran", "Le", "Pham", "Hoang", "Huynh", "Phan", "Vu", "Vo", "Dang", "Bui", "Do"]
+_MIDDLE = ["Van", "Thi", "Minh", "Duc", "Ngoc", "Thanh", "Quoc", "Gia", "Huu", "Bao"]
+_GIVEN = ["An", "Binh", "Chi", "Dung", "Giang", "Hai", "Hoa", "Khanh", "Linh", "Long", "Mai",
+          "Nam", "Phuong", "Quan", "Son", "Tam", "Trang", "Tuan", "Viet", "Yen"]
+_ADDRESS = ["Hà Nội", "Hồ Chí Minh", "Đà Nẵng", "Hải Phòng", "Cần Thơ", "Huế", "Nha Trang",
+            "Vũng Tàu", "Đà Lạt", "Quảng Ninh"]
+_HOBBY = ["Đọc sách", "Chơi game", "Du lịch", "Nấu ăn", "Vẽ tranh", "Chụp ảnh", "Âm nhạc", "Nhảy"]
+_INTEREST = ["Cafe sách", "Công nghệ", "Thời trang", "Phim ảnh", "Thể thao", "Lịch sử", "Khoa học"]
+_SKILL = ["Đá bóng", "Bơi lội", "Lập trình", "Guitar", "Piano", "Cầu lông", "Bóng rổ", "Tiếng Anh"]
+
+CHAT_QUESTIONS = [
+    "ai biết đá bóng",
+    "ai ở Hà Nội thích đọc sách",
+    "người nào biết lập trình",
+    "tìm học sinh sinh năm 2002 ở Đà Nẵng",
+    "ai có kỹ năng bơi lội",
+    "thông tin học sinh thích âm nhạc",
+    "mấy giờ rồi",
+    "2 + 3 bằng bao nhiêu",
+]
+
+
+# =========================
+# Dữ liệu giả lập
+# =========================
+
+def generate_students(n, seed=0, base_path=BASE_DATA):
+    """Mở rộng data_students.json thành n học sinh (deterministic theo seed)"""
+    rng = random.Random(seed)
+    with open(base_path, "r", encoding="utf-8") as f:
+        students = json.load(f)[:n]
+
+    pools = {field: sorted({s[field] for s in students} | set(extra)) for field, extra in
+             (("address", _ADDRESS), ("hobby", _HOBBY), ("interest", _INTEREST), ("skill", _SKILL))}
+    for i in range(len(students), n):
+        name = f"{rng.choice(_FAMILY)} {rng.choice(_MIDDLE)} {rng.choice(_GIVEN)}"
+        dob = f"{rng.randint(1998, 2006)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        students.append({
+            "id": f"syn{i:06d}", "name": name, "dob": dob,
+            **{field: rng.choice(values) for field, values in pools.items()},
+        })
+    return students
+
+
+# =========================
+# Server offline
+# =========================
+
+def start_offline_server(args):
+    """Chạy app.py trong process với provider giả lập, trả về (base_url, server)"""
+    # Phải set trước khi import config / app
+    os.environ.update({
+        "EMBEDDING_PROVIDER": "fake",
+        "EMBEDDING_DIM": str(args.dim),
+        "FAKE_EMBEDDING_LATENCY_MS": str(args.embed_latency_ms),
+        "FAKE_EMBEDDING_ERROR_RATE": str(args.embed_error_rate),
+        "EMBEDDING_CACHE_PATH": "",
+        "VECTOR_STORE": "local",
+        "LOCAL_INDEX_PATH": tempfile.mkdtemp(prefix="bench_index_"),
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "bench",
+        "WARM_UP_ON_START": "false",
+        "UPLOAD_JOBS_DIR": "",
+        "UPLOAD_MANIFEST_PATH": "",
+        "RETRIEVAL_VOCAB_PATH": "",
+        "DEBUG_SAMPLE_RATE": "0",
+    })
+    if not args.answer_cache:
+        os.environ["ANSWER_CACHE_MAX_ENTRIES"] = "0"
+
+    from werkzeug.serving import make_server
+
+    import app
+    import generator
+    from fake_providers import FakeGenerativeModel, FakeVectorIndex
+
+    model = FakeGenerativeModel(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_latency_ms / 5,
+                                error_rate=args.llm_error_rate)
+    generator.get_generative_model = lambda *a, **kw: model
+    app.index = FakeVectorIndex(app.get_index(block=True), latency_ms=args.vector_latency_ms,
+                                jitter_ms=args.vector_latency_ms / 5, error_rate=args.vector_error_rate)
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # không log từng request
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+# =========================
+# Load driver
+# =========================
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def run_level(make_request, concurrency, total):
+    """Gửi total request với concurrency worker, mỗi worker 1 session (keep-alive)"""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                res = make_request(session, i)
+                ok = res.status_code < 400
+                error = None if ok else f"HTTP {res.status_code}"
+            except requests.RequestException as e:
+                error = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if error:
+                    errors.append(error)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / max(len(latencies), 1), 4),
+        "seconds": round(seconds, 3),
+        "rps": round(len(latencies) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def chat_request(base_url):
+    def make(session, i):
+        question = CHAT_QUESTIONS[i % len(CHAT_QUESTIONS)]
+        return session.post(f"{base_url}/api/chat", json={"question": question}, timeout=60)
+    return make
+
+
+def batch_request(base_url, size):
+    sequence = itertools.count()
+
+    def make(session, i):
+        # Câu hỏi khác nhau trong cả lần chạy -> đo đúng chi phí, không nhờ bỏ trùng
+        n = next(sequence)
+        questions = [f"{CHAT_QUESTIONS[j % len(CHAT_QUESTIONS)]} ({n}.{j})" for j in range(size)]
+        return session.post(f"{base_url}/api/chat/batch", json={"questions": questions}, timeout=600)
+    return make
+
+
+def upload_request(base_url, students, size):
+    sequence = itertools.count()
+
+    def make(session, i):
+        # Mỗi request sửa 1 trường (khác nhau giữa mọi request, kể cả giữa các mức concurrency)
+        # -> bản ghi thật sự đổi, không bị manifest bỏ qua
+        n = next(sequence)
+        start = (n * size) % max(len(students) - size, 1)
+        batch = [dict(s, interest=f"{s['interest']} #{n}") for s in students[start:start + size]]
+        return session.post(f"{base_url}/api/upload?wait=true",
+                            json={"students": batch, "prune": False}, timeout=300)
+    return make
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def run(args):
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        base_url, server = start_offline_server(args)
+
+    students = generate_students(max(args.roster, args.upload_size), seed=args.seed)
+    if args.roster:
+        start = time.perf_counter()
+        res = requests.post(f"{base_url}/api/upload?wait=true", json=students[:args.roster], timeout=3600)
+        res.raise_for_status()
+        print(f"📂 Nạp roster {args.roster} học sinh trong {time.perf_counter() - start:.2f}s")
+
+    endpoints = {
+        "chat": chat_request(base_url),
+        "batch": batch_request(base_url, args.batch_size),
+        "upload": upload_request(base_url, students, args.upload_size),
+    }
+    totals = {"chat": args.requests, "batch": args.batch_requests, "upload": args.upload_requests}
+    results = []
+    print(f"{'endpoint':>8} {'conc':>5} {'req':>6} {'err%':>6} {'rps':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name in args.endpoints.split(","):
+        total = totals[name]
+        for concurrency in map(int, args.concurrency.split(",")):
+            result = dict(run_level(endpoints[name], concurrency, total), endpoint=name)
+            results.append(result)
+            print(f"{name:>8} {concurrency:>5} {result['requests']:>6} {result['error_rate'] * 100:>6.2f} "
+                  f"{result['rps']:>9.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+                  f"{result['p99_ms']:>9.1f}")
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "offline": not args.url,
+            "args": vars(args),
+        },
+        "results": results,
+        # Latency từng stage phía server (metrics.py), để biết chậm ở đâu
+        "server_latency": requests.get(f"{base_url}/api/stats", timeout=10).json().get("latency"),
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Đã ghi {args.output}")
+    if server is not None:
+        server.shutdown()
+    return report
+
+
+def compare(old, new, threshold=0.1):
+    """
+    So 2 report theo (endpoint, concurrency): rps giảm hoặc p95 tăng quá threshold
+    (tỉ lệ) là regression. Trả về list dòng so sánh + số regression.
+    """
+    before = {(r["endpoint"], r["concurrency"]): r for r in old["results"]}
+    rows, regressions = [], 0
+    for r in new["results"]:
+        key = (r["endpoint"], r["concurrency"])
+        if key not in before:
+            continue
+        b = before[key]
+        rps_delta = (r["rps"] - b["rps"]) / b["rps"] if b["rps"] else 0.0
+        p95_delta = (r["p95_ms"] - b["p95_ms"]) / b["p95_ms"] if b["p95_ms"] else 0.0
+        regressed = rps_delta < -threshold or p95_delta > threshold
+        regressions += regressed
+        rows.append({"endpoint": key[0], "concurrency": key[1], "rps_delta": round(rps_delta, 4),
+                     "p95_delta": round(p95_delta, 4), "regressed": regressed})
+    return rows, regressions
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tải offline cho /api/chat và /api/upload")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="sinh roster giả lập từ data_students.json")
+    gen.add_argument("--n", type=int, default=1000)
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--out", default="-", help="file JSON (- = stdout)")
+
+    r = sub.add_parser("run", help="chạy load test")
+    r.add_argument("--url", default=None, help="server đang chạy (mặc định: app.py offline trong process)")
+    r.add_argument("--endpoints", default="chat,upload")
+    r.add_argument("--concurrency", default="1,8,32")
+    r.add_argument("--requests", type=int, default=200, help="số request /api/chat mỗi mức concurrency")
+    r.add_argument("--batch-requests", type=int, default=1, help="số request /api/chat/batch mỗi mức")
+    r.add_argument("--batch-size", type=int, default=200, help="số câu hỏi mỗi request batch")
+    r.add_argument("--upload-requests", type=int, default=20, help="số request /api/upload mỗi mức")
+    r.add_argument("--upload-size", type=int, default=100, help="số học sinh mỗi request upload")
+    r.add_argument("--roster", type=int, default=1000, help="số học sinh nạp trước khi đo")
+    r.add_argument("--seed", type=int, default=0)
+    r.add_argument("--dim", type=int, default=768, help="số chiều embedding giả lập")
+    r.add_argument("--embed-latency-ms", type=float, default=30)
+    r.add_argument("--embed-error-rate", type=float, default=0)
+    r.add_argument("--llm-latency-ms", type=float, default=300)
+    r.add_argument("--llm-error-rate", type=float, default=0)
+    r.add_argument("--vector-latency-ms", type=float, default=20)
+    r.add_argument("--vector-error-rate", type=float, default=0)
+    r.add_argument("--answer-cache", action="store_true", help="bật answer cache (mặc định tắt để đo đủ pipeline)")
+    r.add_argument("--output", default=None, help="ghi kết quả JSON")
+
+    c = sub.add_parser("compare", help="so 2 file kết quả")
+    c.add_argument("old")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=0.1, help="rps giảm / p95 tăng quá tỉ lệ này là regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.command == "generate":
+        students = generate_students(args.n, seed=args.seed)
+        if args.out == "-":
+            json.dump(students, sys.stdout, ensure_ascii=False, indent=2)
+        else:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(students, f, ensure_ascii=False, indent=2)
+            print(f"💾 Đã ghi {len(students)} học sinh vào {args.out}")
+        return 0
+    if args.command == "run":
+        run(args)
+        return 0
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    rows, regressions = compare(old, new, args.threshold)
+    print(f"{'endpoint':>8} {'conc':>5} {'rps Δ':>8} {'p95 Δ':>8}")
+    for row in rows:
+        flag = "  ⚠️ regression" if row["regressed"] else ""
+        print(f"{row['endpoint']:>8} {row['concurrency']:>5} {row['rps_delta'] * 100:>7.1f}% "
+              f"{row['p95_delta'] * 100:>7.1f}%{flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+# bench_quantization.py
+"""
+Báo cáo recall@k theo bộ nhớ cho các cách giảm chiều (reduction.py) và lượng tử hoá
+(LocalVectorIndex quantization) so với exact search float32 trên vector gốc.
+
+    python bench_quantization.py --n 50000 --dims 128,256,384 --k 10
+    python bench_quantization.py --vectors corpus.npy --query-vectors queries.npy
+
+Dữ liệu giả: cụm + phổ phương sai giảm dần theo chiều (các chiều đầu mang nhiều thông tin,
+giống embedding Matryoshka). Kết quả trên embedding thật có thể khác: dùng --vectors với
+ma trận (n, dim) xuất từ model đang dùng để chọn cấu hình.
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from reduction import Reducer
+from vector_store import LocalVectorIndex
+
+
+def synthetic(n, dim, centers, seed=0):
+    rng = np.random.default_rng(seed)
+    spectrum = (np.arange(dim, dtype=np.float32) + 1) ** -0.5
+    c = rng.normal(size=(centers, dim)).astype(np.float32) * spectrum
+    out = np.empty((n, dim), dtype=np.float32)
+    for i in range(0, n, 100_000):
+        m = min(100_000, n - i)
+        noise = 0.5 * rng.normal(size=(m, dim)).astype(np.float32) * spectrum
+        out[i:i + m] = c[rng.integers(0, centers, m)] + noise
+    return out
+
+
+def exact_top_k(X, queries, k):
+    Xn = X / np.linalg.norm(X, axis=1, keepdims=True)
+    qn = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = qn @ Xn.T
+    return [set(np.argpartition(-s, k - 1)[:k].tolist()) for s in scores]
+
+
+def evaluate(X, queries, truth, k, reducer, quantization, rescore_factor, batch=10_000):
+    Xr, qr = reducer.transform(X), reducer.transform(queries)
+    tmp = tempfile.mkdtemp(prefix="bench_quant_")
+    try:
+        index = LocalVectorIndex(tmp, Xr.shape[1], quantization=quantization, rescore_factor=rescore_factor)
+        for i in range(0, len(Xr), batch):
+            index.upsert([(str(j), Xr[j], {}) for j in range(i, min(i + batch, len(Xr)))])
+
+        hits, start = 0, time.perf_counter()
+        for q, expected in zip(qr, truth):
+            found = {int(m["id"]) for m in index.query(q, top_k=k, include_metadata=False)["matches"]}
+            hits += len(found & expected)
+        query_ms = (time.perf_counter() - start) / len(qr) * 1000
+        bytes_per_vector = index.describe_index_stats()["bytes_per_vector"]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "reduction": reducer.signature().split(":")[0],
+        "dim": int(Xr.shape[1]),
+        "quantization": quantization,
+        "rescore_factor": rescore_factor if quantization != "none" else None,
+        "recall": round(hits / (k * len(qr)), 4),
+        "bytes_per_vector": bytes_per_vector,
+        "query_ms": round(query_ms, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--centers", type=int, default=500, help="số cụm trong dữ liệu giả")
+    parser.add_argument("--vectors", default=None, help="file .npy (n, dim) embedding thật thay cho dữ liệu giả")
+    parser.add_argument("--query-vectors", default=None, help="file .npy query (mặc định: nhiễu quanh corpus)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dims", default="128,256,384", help="số chiều sau khi giảm")
+    parser.add_argument("--quantizations", default="none,float16,int8")
+    parser.add_argument("--rescore", type=int, default=4, help="rescore_factor cho bản lượng tử hoá (0 = tắt)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", default=None, help="ghi kết quả JSON")
+    args = parser.parse_args()
+
+    X = np.load(args.vectors).astype(np.float32) if args.vectors else synthetic(args.n, args.dim, args.centers)
+    rng = np.random.default_rng(1)
+    if args.query_vectors:
+        queries = np.load(args.query_vectors).astype(np.float32)
+    else:
+        picks = X[rng.choice(len(X), args.queries, replace=False)]
+        queries = picks + 0.1 * rng.normal(size=picks.shape).astype(np.float32) * np.abs(picks).mean()
+    truth = exact_top_k(X, queries, args.k)
+    print(f"{len(X)} vectors {X.shape[1]} chiều, {len(queries)} query, recall@{args.k} so với exact float32")
+
+    reducers = [Reducer("none")]
+    for d in map(int, args.dims.split(",")):
+        if d >= X.shape[1]:
+            continue
+        reducers.append(Reducer("matryoshka", d))
+        pca = Reducer("pca", d)
+        pca.fit(X[rng.choice(len(X), min(len(X), max(2000, d)), replace=False)])
+        reducers.append(pca)
+
+    results = []
+    print(f"{'reduction':>10} {'dim':>5} {'quant':>8} {'rescore':>7} {'recall':>7} "
+          f"{'B/vector':>9} {'vs f32':>7} {'ms/query':>9}")
+    baseline = X.shape[1] * 4
+    for reducer in reducers:
+        for quantization in args.quantizations.split(","):
+            factors = [0, args.rescore] if quantization != "none" and args.rescore else [0]
+            for factor in factors:
+                r = evaluate(X, queries, truth, args.k, reducer, quantization, factor)
+                results.append(r)
+                print(f"{r['reduction']:>10} {r['dim']:>5} {quantization:>8} {factor if quantization != 'none' else '-':>7} "
+                      f"{r['recall']:>7.3f} {r['bytes_per_vector']:>9} {baseline / r['bytes_per_vector']:>6.1f}x "
+                      f"{r['query_ms']:>9.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"n": len(X), "dim": int(X.shape[1]), "k": args.k, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
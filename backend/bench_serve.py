@@ -0,0 +1,159 @@
+# bench_serve.py
+"""
+Đo bộ nhớ của serve.py theo số worker, snapshot dùng chung so với mỗi worker 1 bản index:
+
+    python bench_serve.py --students 50000 --workers 1,2,4
+    python bench_serve.py --students 50000 --workers 1,2,4 --output serve.json
+
+Tạo roster giả (vector ngẫu nhiên + metadata) trong 1 thư mục tạm, rồi với mỗi chế độ
+(snapshot: SNAPSHOT_ENABLED=true, copy: mỗi worker mở LocalVectorIndex riêng) và mỗi số
+worker: chạy serve.py, gửi --queries câu hỏi để mọi worker quét index, đọc
+/proc/<pid>/smaps_rollup của master + worker:
+
+- total_pss_mb:  tổng PSS (trang dùng chung chia đều cho các process) = RAM thực tế dùng
+- worker_uss_mb: trung bình bộ nhớ riêng (Private_Clean + Private_Dirty) mỗi worker
+
+Chạy offline (fake embedding, Gemini không có key thật -> câu trả lời hạ cấp, retrieval vẫn chạy).
+Chỉ chạy trên Linux (fork + /proc).
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from bench_startup import offline_env
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+CITIES = ["Hà Nội", "Đà Nẵng", "Huế", "TP HCM", "Hải Phòng", "Cần Thơ"]
+SKILLS = ["Đá bóng", "Vẽ", "Bơi", "Lập trình", "Guitar"]
+HOBBIES = ["Đọc sách", "Du lịch", "Nấu ăn", "Chơi cờ"]
+
+
+def build_roster(data_dir, students, dim, seed=0):
+    """LocalVectorIndex + bảng học sinh với students bản ghi giả (không gọi embedding)"""
+    import numpy as np
+    from structured_query import StudentTable
+    from vector_store import LocalVectorIndex
+
+    rng = np.random.default_rng(seed)
+    index = LocalVectorIndex(os.path.join(data_dir, "index"), dim)
+    table = StudentTable(os.path.join(data_dir, "table.json"))
+    for start in range(0, students, 5000):
+        records = []
+        for i in range(start, min(start + 5000, students)):
+            md = {"name": f"Học sinh {i}", "dob": f"{2000 + i % 8}-01-01", "address": CITIES[i % 6],
+                  "hobby": HOBBIES[i % 4], "interest": "Âm nhạc", "skill": SKILLS[i % 5],
+                  "birth_year": 2000 + i % 8}
+            md["text"] = ", ".join(f"{k}: {v}" for k, v in md.items())
+            records.append((f"s{i}", md))
+        index.upsert([(sid, v, md) for (sid, md), v in zip(records, rng.normal(size=(len(records), dim)))])
+        table.upsert(records)
+    table.save()
+    index.close()
+
+
+def _memory(pid):
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return fields
+
+
+def _children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure(env, workers, queries, timeout=300):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen([sys.executable, "serve.py", "--workers", str(workers), "--port", str(port)],
+                            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + timeout
+        while len(_children(proc.pid)) < workers or not _all_ready(base, workers):
+            if proc.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"serve.py không sẵn sàng (code {proc.poll()})")
+            time.sleep(0.2)
+        # Mỗi kết nối mới có thể rơi vào worker bất kỳ -> đủ nhiều để worker nào cũng quét index
+        for i in range(queries):
+            requests.post(f"{base}/api/chat", json={"question": f"ai ở {CITIES[i % 6]} biết {SKILLS[i % 5]}"},
+                          timeout=60)
+        pids = [proc.pid] + _children(proc.pid)
+        mem = {pid: _memory(pid) for pid in pids}
+        workers_mem = [mem[pid] for pid in pids[1:]]
+        return {
+            "workers": workers,
+            "total_pss_mb": round(sum(m["Pss"] for m in mem.values()), 1),
+            "worker_uss_mb": round(sum(m["Private_Clean"] + m["Private_Dirty"] for m in workers_mem)
+                                   / len(workers_mem), 1),
+            "worker_rss_mb": round(sum(m["Rss"] for m in workers_mem) / len(workers_mem), 1),
+            "worker_anon_mb": round(sum(m["Anonymous"] for m in workers_mem) / len(workers_mem), 1),
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def _all_ready(base, workers):
+    """Đủ request /ready trả 200 liên tiếp để gần như chắc mọi worker đã nạp index"""
+    try:
+        return all(requests.get(f"{base}/api/health/ready", timeout=5).ok for _ in range(workers * 4))
+    except requests.RequestException:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--workers", default="1,2,4", help="các số worker cần đo, cách nhau bởi dấu phẩy")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--modes", default="snapshot,copy")
+    parser.add_argument("--output", default=None, help="ghi kết quả JSON")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="bench_serve_")
+    env = offline_env()
+    env.update({"EMBEDDING_DIM": str(args.dim), "LOCAL_INDEX_PATH": os.path.join(data_dir, "index"),
+                "STUDENT_TABLE_PATH": os.path.join(data_dir, "table.json"), "CHAT_DEADLINE": "2",
+                # Câu hỏi liệt kê đi qua RAG (vector query) thay vì trả lời từ bảng học sinh
+                "STRUCTURED_QUERY": "false"})
+    os.environ.update(env)
+    start = time.perf_counter()
+    build_roster(data_dir, args.students, args.dim)
+    print(f"📂 Roster {args.students} học sinh ({args.dim} chiều) tại {data_dir} "
+          f"trong {time.perf_counter() - start:.1f}s")
+
+    results = []
+    for mode in args.modes.split(","):
+        mode_env = dict(env, SNAPSHOT_ENABLED="true" if mode == "snapshot" else "false",
+                        SNAPSHOT_DIR=os.path.join(data_dir, "snapshots"))
+        for workers in (int(w) for w in args.workers.split(",")):
+            row = {"mode": mode, **measure(mode_env, workers, args.queries)}
+            results.append(row)
+            print(f"{mode:8s} {workers} worker: tổng PSS {row['total_pss_mb']:8.1f} MB, "
+                  f"riêng mỗi worker {row['worker_uss_mb']:7.1f} MB, RSS mỗi worker {row['worker_rss_mb']:7.1f} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"students": args.students, "dim": args.dim, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# bench_startup.py
+"""
+Đo thời gian khởi động server (mỗi lần chạy 1 process mới, như 1 replica vừa được scale):
+
+    python bench_startup.py --runs 5
+    python bench_startup.py --runs 5 --online            # dùng .env thật (Pinecone, Gemini)
+    python bench_startup.py --cwd /tmp/before/backend    # checkout khác để so sánh
+
+- import_ms: thời gian `import app` (module + khởi tạo chạy lúc import)
+- live_ms:   từ lúc spawn process tới khi /api/health (/live) trả 200 = bắt đầu nhận request
+- ready_ms:  tới khi /api/health/ready trả 200 (checkout cũ không có endpoint này: = live_ms,
+             vì server cũ chỉ mở port sau khi khởi tạo xong)
+
+Mặc định chạy offline (fake embedding, local vector index) để kết quả không phụ thuộc mạng.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+
+
+def offline_env(base=None):
+    env = dict(base or os.environ)
+    env.update({
+        "EMBEDDING_PROVIDER": "fake",
+        "EMBEDDING_DIM": "768",
+        "EMBEDDING_CACHE_PATH": "",
+        "VECTOR_STORE": "local",
+        "LOCAL_INDEX_PATH": tempfile.mkdtemp(prefix="bench_startup_"),
+        "GEMINI_API_KEY": env.get("GEMINI_API_KEY") or "bench",
+        "WARM_UP_ON_START": "false",
+        "UPLOAD_JOBS_DIR": "",
+        "UPLOAD_MANIFEST_PATH": "",
+        "RETRIEVAL_VOCAB_PATH": "",
+        "STUDENT_TABLE_PATH": "",
+        "TOP_K": "5",
+        "FLASK_HOST": "127.0.0.1",
+    })
+    return env
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(cwd, env):
+    out = subprocess.run([sys.executable, "-c", _IMPORT_SNIPPET], cwd=cwd, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return float(out.strip().splitlines()[-1]) * 1000
+
+
+def measure_server(cwd, env, timeout=120):
+    """Spawn `python app.py`, poll live rồi ready; trả về (live_ms, ready_ms)"""
+    port = _free_port()
+    env = dict(env, FLASK_PORT=str(port))
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "app.py"], cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    live = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"app.py thoát với code {proc.returncode}")
+            try:
+                if live is None and requests.get(f"{base}/api/health", timeout=1).ok:
+                    live = (time.perf_counter() - start) * 1000
+                if live is not None:
+                    res = requests.get(f"{base}/api/health/ready", timeout=1)
+                    if res.status_code == 404:   # checkout chưa có readiness
+                        ready = live
+                    elif res.ok:
+                        ready = (time.perf_counter() - start) * 1000
+                if ready is not None:
+                    return live, ready
+            except requests.RequestException:
+                pass
+            time.sleep(0.01)
+        raise TimeoutError(f"server chưa sẵn sàng sau {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--cwd", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="thư mục backend cần đo (mặc định: checkout hiện tại)")
+    parser.add_argument("--online", action="store_true", help="dùng biến môi trường / .env thật")
+    parser.add_argument("--output", default=None, help="ghi kết quả JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ) if args.online else offline_env()
+    runs = []
+    for i in range(args.runs):
+        import_ms = measure_import(args.cwd, env)
+        live_ms, ready_ms = measure_server(args.cwd, env)
+        runs.append({"import_ms": import_ms, "live_ms": live_ms, "ready_ms": ready_ms})
+        print(f"run {i + 1}: import {import_ms:7.1f} ms  live {live_ms:7.1f} ms  ready {ready_ms:7.1f} ms")
+
+    summary = {key: round(statistics.median(r[key] for r in runs), 1) for key in runs[0]}
+    print(f"median: import {summary['import_ms']} ms, live {summary['live_ms']} ms, "
+          f"ready {summary['ready_ms']} ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cwd": args.cwd, "online": args.online, "median": summary, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
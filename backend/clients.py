@@ -0,0 +1,131 @@
+# clients.py
+"""
+Registry client/provider dùng chung cả process: mỗi client chỉ tạo 1 lần rồi dùng lại.
+
+    get_genai()              -> module google.generativeai đã configure API key
+    get_generative_model()   -> GenerativeModel theo tên model
+    get_openai_client()      -> OpenAI client
+    get_sentence_transformer() -> model sentence-transformers (EMBEDDING_PROVIDER=local)
+    get_http_session()       -> requests.Session có connection pool + keep-alive
+
+warm_up() tạo sẵn các client và mở trước kết nối TLS tới weather/news,
+để request đầu tiên không chậm hơn các request sau.
+"""
+import os
+import threading
+import time
+
+from config import GEMINI_API_KEY, OPENAI_API_KEY, HTTP_MAX_CONNECTIONS
+
+GEMINI_CHAT_MODEL = "gemini-1.5-flash"
+
+# Host được mở kết nối trước khi warm-up (chỉ khi có API key tương ứng)
+_WARM_UP_URLS = {
+    "WEATHER_API_KEY": "http://api.weatherapi.com",
+    "NEWS_API_KEY": "https://newsapi.org",
+}
+
+_lock = threading.RLock()  # factory có thể gọi lồng (model -> genai)
+_clients = {}
+
+
+def _get_or_create(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def get_genai():
+    def factory():
+        try:
+            import google.generativeai as genai
+        except ImportError:
+            raise RuntimeError("Cần cài `google-generativeai` để dùng Gemini.")
+        if not GEMINI_API_KEY:
+            raise RuntimeError("GEMINI_API_KEY chưa được set.")
+        genai.configure(api_key=GEMINI_API_KEY)
+        return genai
+
+    return _get_or_create("genai", factory)
+
+
+def get_generative_model(name: str = GEMINI_CHAT_MODEL):
+    return _get_or_create(f"model:{name}", lambda: get_genai().GenerativeModel(name))
+
+
+def get_openai_client():
+    def factory():
+        try:
+            from openai import OpenAI
+        except ImportError:
+            raise RuntimeError("Cần cài `openai` để dùng OpenAI.")
+        if not OPENAI_API_KEY:
+            raise RuntimeError("OPENAI_API_KEY chưa được set.")
+        return OpenAI(api_key=OPENAI_API_KEY)
+
+    return _get_or_create("openai", factory)
+
+
+def get_sentence_transformer(name: str):
+    def factory():
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError("Cần cài `sentence-transformers` để dùng EMBEDDING_PROVIDER=local.")
+        return SentenceTransformer(name)
+
+    return _get_or_create(f"sentence_transformer:{name}", factory)
+
+
+def get_http_session():
+    def factory():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=HTTP_MAX_CONNECTIONS)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    return _get_or_create("http", factory)
+
+
+def warm_up() -> dict:
+    """
+    Tạo trước các client đã cấu hình và mở kết nối tới weather/news.
+    Trả về thời gian (ms) từng bước; bước lỗi ghi lại lỗi chứ không raise.
+    """
+    steps = {"http_session": get_http_session}
+    if GEMINI_API_KEY:
+        steps["gemini_model"] = get_generative_model
+    if OPENAI_API_KEY:
+        steps["openai_client"] = get_openai_client
+    for env, url in _WARM_UP_URLS.items():
+        if os.getenv(env):
+            # HEAD không cần API key; chỉ để pool giữ sẵn 1 kết nối (TLS) tới host
+            steps[f"connect:{url}"] = lambda url=url: get_http_session().head(url, timeout=5)
+
+    timings = {}
+    for name, step in steps.items():
+        start = time.perf_counter()
+        try:
+            step()
+            timings[name] = round((time.perf_counter() - start) * 1000, 1)
+        except Exception as e:
+            timings[name] = f"error: {e}"
+    print(f"Warm-up clients: {timings}")
+    return timings
+
+
+def reset():
+    """Xoá toàn bộ client đã tạo (dùng trong test / benchmark)"""
+    with _lock:
+        session = _clients.get("http")
+        if session is not None:
+            session.close()
+        _clients.clear()
@@ -12,7 +12,8 @@ PINECONE_INDEX = os.getenv("PINECONE_INDEX", "students-index")
 PINECONE_CLOUD = os.getenv("PINECONE_CLOUD", "aws")
 
 # Embedding / LLM
-EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini").lower()  # "gemini" hoặc "openai"
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini").lower()  # "gemini", "openai", "local" hoặc "fake"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")  # rỗng = model mặc định của provider (embedder.py)
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
 
 # API Keys
@@ -22,3 +23,132 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 # Embedding dimension + top_k
 EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 768))
 TOP_K = int(os.getenv("TOP_K", 5))
+
+# Giảm chiều embedding trước khi lưu / query: "none", "matryoshka" (cắt + chuẩn hoá lại)
+# hoặc "pca" (fit trên corpus, lưu tại EMBEDDING_PCA_PATH). Index có INDEX_DIM chiều.
+EMBEDDING_REDUCTION = os.getenv("EMBEDDING_REDUCTION", "none").lower()
+EMBEDDING_REDUCED_DIM = int(os.getenv("EMBEDDING_REDUCED_DIM", 256))
+EMBEDDING_PCA_PATH = os.getenv("EMBEDDING_PCA_PATH", "cache/pca.npz")
+EMBEDDING_PCA_SAMPLE = int(os.getenv("EMBEDDING_PCA_SAMPLE", 2000))  # số bản ghi dùng để fit PCA
+INDEX_DIM = EMBEDDING_DIM if EMBEDDING_REDUCTION == "none" else EMBEDDING_REDUCED_DIM
+
+# Batch embedding: số text mỗi request, số request song song, retry + backoff (giây).
+# Mặc định theo giới hạn của từng provider; EMBEDDING_BATCH_SIZE_<PROVIDER> /
+# EMBEDDING_WORKERS_<PROVIDER> (vd. EMBEDDING_WORKERS_OPENAI) ghi đè giá trị chung.
+_EMBEDDING_BATCH_DEFAULTS = {"gemini": (100, 4), "openai": (512, 4), "local": (64, 1), "fake": (100, 4)}
+_batch_default, _workers_default = _EMBEDDING_BATCH_DEFAULTS.get(EMBEDDING_PROVIDER, (100, 4))
+EMBEDDING_BATCH_SIZE = int(os.getenv(f"EMBEDDING_BATCH_SIZE_{EMBEDDING_PROVIDER.upper()}",
+                                     os.getenv("EMBEDDING_BATCH_SIZE", _batch_default)))
+EMBEDDING_WORKERS = int(os.getenv(f"EMBEDDING_WORKERS_{EMBEDDING_PROVIDER.upper()}",
+                                  os.getenv("EMBEDDING_WORKERS", _workers_default)))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 3))
+EMBEDDING_BACKOFF = float(os.getenv("EMBEDDING_BACKOFF", 0.5))
+
+# Fake provider (EMBEDDING_PROVIDER=fake) để benchmark offline
+FAKE_EMBEDDING_LATENCY_MS = float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", 0))
+FAKE_EMBEDDING_ERROR_RATE = float(os.getenv("FAKE_EMBEDDING_ERROR_RATE", 0))  # tỉ lệ batch lỗi giả lập
+
+# Cache embedding trên đĩa (để rỗng để tắt), giới hạn số vector, xoá theo LRU
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 100_000))
+
+# Vector store: "pinecone" hoặc "local" (index NumPy trong process, lưu tại LOCAL_INDEX_PATH)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone").lower()
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "cache/local_index")
+
+# ANN cho local vector store: "flat" (exact) hoặc "ivf" (approximate, cho roster rất lớn)
+LOCAL_INDEX_TYPE = os.getenv("LOCAL_INDEX_TYPE", "flat").lower()
+LOCAL_IVF_NLIST = int(os.getenv("LOCAL_IVF_NLIST", 1024))   # số cụm
+LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", 16))   # số cụm quét mỗi query (recall <-> latency)
+
+# Lượng tử hoá ma trận vector của local index: "none" (float32), "float16" hoặc "int8".
+# Quét trên bản lượng tử hoá, rồi chấm lại top_k * LOCAL_RESCORE_FACTOR ứng viên bằng float32.
+LOCAL_QUANTIZATION = os.getenv("LOCAL_QUANTIZATION", "none").lower()
+LOCAL_RESCORE_FACTOR = int(os.getenv("LOCAL_RESCORE_FACTOR", 4))  # 0 = không chấm lại
+
+# Chat pipeline async (asgi.py): timeout mỗi stage (giây) + connection pool HTTP
+CHAT_EMBED_TIMEOUT = float(os.getenv("CHAT_EMBED_TIMEOUT", 5))
+CHAT_RETRIEVE_TIMEOUT = float(os.getenv("CHAT_RETRIEVE_TIMEOUT", 5))
+CHAT_GENERATE_TIMEOUT = float(os.getenv("CHAT_GENERATE_TIMEOUT", 30))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+
+# Deadline cho cả 1 câu hỏi chat (giây), chia dần cho embed -> retrieve -> generate.
+# Không kịp sinh câu trả lời thì trả câu trả lời chỉ từ retrieval (danh sách học sinh liên quan)
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", 10))
+PROVIDER_RETRIES = int(os.getenv("PROVIDER_RETRIES", 1))     # thử lại khi provider lỗi nhanh
+PROVIDER_POOL_SIZE = int(os.getenv("PROVIDER_POOL_SIZE", 32))  # thread chờ provider có timeout
+# Hedging: chưa xong sau p95 latency của provider thì gửi thêm 1 request, lấy kết quả về trước
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", 0.95))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))   # chưa đủ mẫu latency thì không hedge
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.05))
+# Circuit breaker mỗi provider: BREAKER_FAILURES lỗi liên tiếp -> mở BREAKER_COOLDOWN giây
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", 30))
+
+# Cache câu trả lời theo độ tương đồng câu hỏi (0 để tắt)
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 600))          # giây
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))  # cosine tối thiểu
+
+# Tạo sẵn client (Gemini, HTTP session) và mở kết nối weather/news khi app khởi động
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "true").lower() == "true"
+
+# Index / kiểm tra embedding khởi tạo nền (startup.py): request trong lúc khởi động chờ tối đa
+# STARTUP_WAIT_TIMEOUT giây rồi trả 503; khởi tạo lỗi thì thử lại sau STARTUP_RETRY_INTERVAL giây
+STARTUP_WAIT_TIMEOUT = float(os.getenv("STARTUP_WAIT_TIMEOUT", 10))
+STARTUP_RETRY_INTERVAL = float(os.getenv("STARTUP_RETRY_INTERVAL", 5))
+
+# Cache weather/news (giây, 0 để tắt). Hết TTL vẫn trả dữ liệu cũ thêm tối đa
+# UPSTREAM_STALE_TTL giây trong lúc refresh nền
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", 600))
+NEWS_CACHE_TTL = float(os.getenv("NEWS_CACHE_TTL", 900))
+UPSTREAM_STALE_TTL = float(os.getenv("UPSTREAM_STALE_TTL", 1800))
+
+# Hybrid retrieval: filter metadata rút từ câu hỏi + trộn điểm BM25 với điểm vector
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", 0.7))        # trọng số điểm vector (1 = chỉ vector)
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 3))  # lấy top_k * N ứng viên rồi xếp lại
+RETRIEVAL_VOCAB_PATH = os.getenv("RETRIEVAL_VOCAB_PATH", "cache/vocabulary.json")  # rỗng = chỉ giữ trong RAM
+
+# Câu hỏi đếm / liệt kê / thống kê trả lời thẳng từ bảng metadata học sinh (không gọi LLM).
+# Bảng lưu tại STUDENT_TABLE_PATH (rỗng = chỉ giữ trong RAM); liệt kê tối đa STRUCTURED_MAX_LIST tên
+STRUCTURED_QUERY = os.getenv("STRUCTURED_QUERY", "true").lower() == "true"
+STUDENT_TABLE_PATH = os.getenv("STUDENT_TABLE_PATH", "cache/student_table.json")
+STRUCTURED_MAX_LIST = int(os.getenv("STRUCTURED_MAX_LIST", 50))
+
+# POST /api/chat/batch: số câu hỏi tối đa mỗi request, số vector query song song
+# và số request Gemini cùng lúc của 1 batch
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 5000))
+BATCH_RETRIEVE_WORKERS = int(os.getenv("BATCH_RETRIEVE_WORKERS", 16))
+BATCH_GENERATE_CONCURRENCY = int(os.getenv("BATCH_GENERATE_CONCURRENCY", 8))
+
+# Context gửi cho LLM: giới hạn token ước lượng + ngưỡng Jaccard coi 2 học sinh là trùng
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1000))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", 0.9))
+
+# Log debug (embedding, response Pinecone, ...) cho 1 phần request: 0 = tắt, 1 = mọi request
+DEBUG_SAMPLE_RATE = float(os.getenv("DEBUG_SAMPLE_RATE", 0))
+
+# Manifest hash nội dung các bản ghi đã upsert (rỗng = chỉ giữ trong RAM)
+UPLOAD_MANIFEST_PATH = os.getenv("UPLOAD_MANIFEST_PATH", "cache/manifest.json")
+
+# Upload chạy nền: thư mục lưu payload + trạng thái job (rỗng = chỉ giữ trong RAM, mất khi restart),
+# số thread embed/upsert song song và số bản ghi mỗi batch
+UPLOAD_JOBS_DIR = os.getenv("UPLOAD_JOBS_DIR", "cache/upload_jobs")
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 2))
+UPLOAD_BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE", 50))
+
+# Production nhiều process (serve.py, pre-fork): số worker (0 = số CPU), hàng đợi kết nối
+# của socket chung
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", 0))
+SERVE_BACKLOG = int(os.getenv("SERVE_BACKLOG", 1024))
+
+# Snapshot chỉ đọc (memory-map) của vector + metadata dùng chung giữa các worker (snapshot.py).
+# Mỗi job upload publish 1 snapshot mới vào SNAPSHOT_DIR; worker kiểm tra snapshot hiện tại
+# tối đa mỗi SNAPSHOT_CHECK_INTERVAL giây và đổi sang bản mới không cần restart.
+# serve.py bật mặc định; giữ SNAPSHOT_KEEP bản gần nhất trên đĩa
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "false").lower() == "true"
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "cache/snapshots")
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", 3))
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("SNAPSHOT_CHECK_INTERVAL", 1.0))
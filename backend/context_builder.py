@@ -0,0 +1,106 @@
+# context_builder.py
+"""
+Ghép context cho prompt từ các học sinh retrieval trả về, trong giới hạn token:
+
+1. Ước lượng token tại chỗ (không gọi tokenizer của provider).
+2. Bỏ các match gần như trùng nhau (cùng học sinh upload 2 lần với id khác, ...).
+3. Xếp theo score giảm dần, thêm lần lượt tới khi hết CONTEXT_TOKEN_BUDGET.
+4. Mã hoá gọn: 1 dòng header tên trường + mỗi học sinh 1 dòng giá trị cách nhau "|"
+   thay vì "Name, DOB: ..., Address: ..." lặp lại nhãn ở mỗi dòng.
+
+Mỗi request trả về số token đã dùng và đã tiết kiệm so với context kiểu cũ.
+"""
+import re
+import threading
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD
+from intent_matcher import normalize, fold
+
+FIELDS = ("name", "dob", "address", "hobby", "interest", "skill")
+HEADER = "|".join(FIELDS)
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Ước lượng số token: từ ASCII ~4 ký tự/token, âm tiết tiếng Việt có dấu
+    ~2 ký tự/token (tokenizer BPE tách ký tự có dấu thành nhiều byte), dấu câu 1 token.
+    """
+    n = 0
+    for piece in _PIECE.findall(text):
+        if piece.isascii():
+            n += (len(piece) + 3) // 4
+        else:
+            n += (len(piece) + 1) // 2
+    return n
+
+
+def _row(student) -> str:
+    return "|".join(str(student.get(f) or "").replace("|", "/").strip() for f in FIELDS)
+
+
+def _signature(row: str):
+    return frozenset(fold(normalize(row)).replace("|", " ").split())
+
+
+def _near_duplicate(sig, kept, threshold):
+    for other in kept:
+        union = len(sig | other)
+        if union and len(sig & other) / union >= threshold:
+            return True
+    return False
+
+
+_lock = threading.Lock()
+_totals = {"requests": 0, "tokens": 0, "baseline_tokens": 0, "saved_tokens": 0,
+           "deduplicated": 0, "dropped": 0}
+
+
+def build_context(related, baseline_text: str = "", budget: int = CONTEXT_TOKEN_BUDGET,
+                  dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD):
+    """
+    related: list dict học sinh (có "score") từ format_matches.
+    baseline_text: context kiểu cũ, chỉ dùng để tính số token tiết kiệm.
+    Trả về (documents_text, stats).
+    """
+    ordered = sorted(related, key=lambda s: s.get("score") or 0.0, reverse=True)
+
+    lines, kept, deduplicated, dropped = [], [], 0, 0
+    used = estimate_tokens(HEADER) + 1
+    for student in ordered:
+        row = _row(student)
+        sig = _signature(row)
+        if _near_duplicate(sig, kept, dedup_threshold):
+            deduplicated += 1
+            continue
+        cost = estimate_tokens(row) + 1  # + xuống dòng
+        if used + cost > budget and lines:
+            # Luôn giữ học sinh điểm cao nhất; học sinh sau có thể ngắn hơn và vẫn vừa
+            dropped += 1
+            continue
+        kept.append(sig)
+        lines.append(row)
+        used += cost
+
+    documents_text = HEADER + "\n" + "\n".join(lines) if lines else ""
+    tokens = estimate_tokens(documents_text) if lines else 0
+    baseline = estimate_tokens(baseline_text)
+    stats = {
+        "tokens": tokens,
+        "baseline_tokens": baseline,
+        "saved_tokens": max(baseline - tokens, 0),
+        "students": len(lines),
+        "deduplicated": deduplicated,
+        "dropped": dropped,
+    }
+    with _lock:
+        _totals["requests"] += 1
+        for key in ("tokens", "baseline_tokens", "saved_tokens", "deduplicated", "dropped"):
+            _totals[key] += stats[key]
+    return documents_text, stats
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(_totals, budget=CONTEXT_TOKEN_BUDGET)
@@ -1,34 +1,226 @@
 # embedder.py
-import os
+"""
+Lớp embedding duy nhất cho cả server (app.py, asgi.py) lẫn upload / ingest (upload_jobs.py,
+ingest.py): cùng provider, model và số chiều nên dữ liệu và câu hỏi luôn nằm trong cùng
+không gian vector.
+
+    EMBEDDING_PROVIDER = gemini | openai | local (sentence-transformers) | fake
+    EMBEDDING_MODEL    = rỗng -> DEFAULT_MODELS[provider]
+    EMBEDDING_DIM      = số chiều provider phải trả về (trước khi giảm chiều, reduction.py)
+
+Gemini / OpenAI được yêu cầu trả đúng EMBEDDING_DIM chiều (output_dimensionality /
+dimensions); vector sai chiều là lỗi chứ không bị cắt ngầm. validate_dimensions(index)
+kiểm tra provider và index lúc khởi động.
+
+Embedding câu hỏi (get_embedding / get_embedding_async) chạy trong deadline của request
+qua resilience.call: hedge sau p95 latency và circuit breaker "embedding".
+"""
+import asyncio
+import threading
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-EMBEDDING_DIM = 768  # chiều embedding target
+from config import (
+    EMBEDDING_PROVIDER, EMBEDDING_MODEL, EMBEDDING_DIM, INDEX_DIM,
+    EMBEDDING_BATCH_SIZE, EMBEDDING_WORKERS, EMBEDDING_MAX_RETRIES, EMBEDDING_BACKOFF,
+    FAKE_EMBEDDING_LATENCY_MS, FAKE_EMBEDDING_ERROR_RATE,
+)
+from utils import embed_in_batches
+from embedding_cache import cached_embeddings, cached_embeddings_async
+from clients import get_genai, get_openai_client, get_sentence_transformer
+from reduction import get_reducer
+from resilience import call, call_async
+
+DEFAULT_MODELS = {
+    "gemini": "models/gemini-embedding-001",
+    "openai": "text-embedding-3-small",
+    "local": "sentence-transformers/paraphrase-multilingual-mpnet-base-v2",  # 768 chiều, có tiếng Việt
+    "fake": "fake",
+}
+
+
+class EmbeddingProvider:
+    """1 provider = 1 model ở 1 số chiều cố định; embed_batch() là 1 request tới provider"""
+    name = ""
+
+    def __init__(self, model, dim, batch_size=100, workers=4):
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+        self.workers = workers
+
+    def signature(self) -> str:
+        """Đổi khi vector mới không còn so được với vector cũ (cache key, manifest)"""
+        return f"{self.name}:{self.model}:{self.dim}"
+
+    def embed_batch(self, texts):
+        raise NotImplementedError
+
+    async def embed_batch_async(self, texts):
+        return await asyncio.to_thread(self.embed_batch, texts)
+
+    def check(self, vectors, count):
+        if len(vectors) != count:
+            raise ValueError(f"❌ {self.signature()} trả về {len(vectors)} vector cho {count} text")
+        for vector in vectors:
+            if len(vector) != self.dim:
+                raise ValueError(f"❌ {self.name} ({self.model}) trả về vector {len(vector)} chiều, "
+                                 f"EMBEDDING_DIM = {self.dim}")
+        return vectors
+
+
+class GeminiProvider(EmbeddingProvider):
+    name = "gemini"
+
+    def embed_batch(self, texts):
+        texts = list(texts)
+        result = get_genai().embed_content(model=self.model, content=texts,
+                                           output_dimensionality=self.dim)
+        return self.check(result["embedding"], len(texts))
+
+    async def embed_batch_async(self, texts):
+        texts = list(texts)
+        result = await get_genai().embed_content_async(model=self.model, content=texts,
+                                                       output_dimensionality=self.dim)
+        return self.check(result["embedding"], len(texts))
+
+
+class OpenAIProvider(EmbeddingProvider):
+    name = "openai"
+
+    def embed_batch(self, texts):
+        texts = list(texts)
+        # Chỉ text-embedding-3-* nhận tham số dimensions
+        kwargs = {"dimensions": self.dim} if self.model.startswith("text-embedding-3") else {}
+        response = get_openai_client().embeddings.create(input=texts, model=self.model, **kwargs)
+        vectors = [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+        return self.check(vectors, len(texts))
+
+
+class LocalProvider(EmbeddingProvider):
+    """sentence-transformers chạy trong process; số chiều do model quyết định"""
+    name = "local"
+
+    def native_dim(self) -> int:
+        return get_sentence_transformer(self.model).get_sentence_embedding_dimension()
+
+    def embed_batch(self, texts):
+        texts = list(texts)
+        vectors = get_sentence_transformer(self.model).encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True)
+        return self.check(vectors.tolist(), len(texts))
+
+
+class FakeProvider(EmbeddingProvider):
+    """Embedding deterministic offline cho test / benchmark (fake_providers.py)"""
+    name = "fake"
+
+    def embed_batch(self, texts):
+        from fake_providers import fake_embed_batch
+        return fake_embed_batch(texts, self.dim, latency_ms=FAKE_EMBEDDING_LATENCY_MS,
+                                error_rate=FAKE_EMBEDDING_ERROR_RATE)
+
+
+PROVIDERS = {p.name: p for p in (GeminiProvider, OpenAIProvider, LocalProvider, FakeProvider)}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> EmbeddingProvider:
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            cls = PROVIDERS.get(EMBEDDING_PROVIDER)
+            if cls is None:
+                raise ValueError(f"❌ EMBEDDING_PROVIDER {EMBEDDING_PROVIDER} không hợp lệ "
+                                 f"({', '.join(PROVIDERS)}).")
+            _provider = cls(EMBEDDING_MODEL or DEFAULT_MODELS[cls.name], EMBEDDING_DIM,
+                            batch_size=EMBEDDING_BATCH_SIZE, workers=EMBEDDING_WORKERS)
+    return _provider
+
+
+def _reduce(vectors):
+    """Giảm chiều (EMBEDDING_REDUCTION) -> vector INDEX_DIM chiều; "none" thì giữ nguyên"""
+    reducer = get_reducer()
+    if reducer.method == "none" or not vectors:
+        return vectors
+    return reducer.transform(vectors).tolist()
+
 
 def get_embedding(text: str):
-    """Lấy embedding cho text từ Gemini, trả về vector dimension 768"""
-    return _get_gemini_embedding(text)
+    """Embedding cho 1 text (câu hỏi), vector INDEX_DIM chiều, trong deadline của request"""
+    provider = get_provider()
+    vectors = cached_embeddings(provider.name, provider.signature(), [text],
+                                lambda texts: call("embedding", lambda: provider.embed_batch(texts), hedge=True))
+    return _reduce(vectors)[0]
 
-def _get_gemini_embedding(text: str):
-    try:
-        import google.generativeai as genai
-    except ImportError:
-        raise RuntimeError("Cần cài `google-generativeai` để dùng Gemini embeddings.")
-    
-    if not GEMINI_API_KEY:
-        raise RuntimeError("GEMINI_API_KEY chưa được set.")
-    
-    genai.configure(api_key=GEMINI_API_KEY)
 
-    model = "models/gemini-embedding-001"  # model Gemini
+def get_embeddings(texts):
+    """
+    Lấy embedding cho nhiều text: gom thành batch gửi qua endpoint multi-input
+    của provider, các batch chạy song song (batch_size / workers theo provider) có retry.
+    Trả về list vectors (đã giảm chiều) theo đúng thứ tự texts.
+    Text đã có trong cache không gọi lại provider.
+    """
+    return _reduce(get_raw_embeddings(texts))
+
+
+def get_raw_embeddings(texts):
+    """Như get_embeddings nhưng chưa giảm chiều (EMBEDDING_DIM chiều, dùng để fit PCA)"""
+    provider = get_provider()
+
+    def compute(missing):
+        return embed_in_batches(
+            missing, provider.embed_batch,
+            batch_size=provider.batch_size,
+            max_workers=provider.workers,
+            max_retries=EMBEDDING_MAX_RETRIES,
+            backoff=EMBEDDING_BACKOFF,
+        )
 
-    result = genai.embed_content(model=model, content=text)
-    embedding = result["embedding"]
+    return cached_embeddings(provider.name, provider.signature(), texts, compute)
 
-    if len(embedding) != EMBEDDING_DIM:
-        # Nếu model trả ra không đúng chiều, bạn có thể giảm dimension bằng PCA hoặc cắt
-        embedding = embedding[:EMBEDDING_DIM]
 
-    return embedding
+async def get_embedding_async(text: str):
+    """Như get_embedding nhưng không block event loop (dùng cho asgi.py)"""
+    provider = get_provider()
+    vectors = await cached_embeddings_async(
+        provider.name, provider.signature(), [text],
+        lambda texts: call_async("embedding", lambda: provider.embed_batch_async(texts), hedge=True))
+    return _reduce(vectors)[0]
+
+
+def validate_dimensions(index):
+    """
+    Gọi lúc khởi động: provider phải trả EMBEDDING_DIM chiều và index phải có INDEX_DIM chiều,
+    nếu không dữ liệu và câu hỏi không so được với nhau -> RuntimeError.
+    Không gọi được provider / index (thiếu API key, mất mạng) thì chỉ cảnh báo.
+    """
+    provider = get_provider()
+    try:
+        if isinstance(provider, LocalProvider):
+            dim = provider.native_dim()
+        else:
+            # 1 text ngắn; đi qua cache nên chỉ tốn 1 request ở lần khởi động đầu tiên
+            dim = len(get_raw_embeddings(["dimension check"])[0])
+    except ValueError as e:
+        raise RuntimeError(str(e)) from e
+    except Exception as e:
+        print(f"⚠️ Không kiểm tra được số chiều của {provider.signature()}: {e}")
+        dim = None
+    if dim is not None and dim != EMBEDDING_DIM:
+        raise RuntimeError(f"❌ {provider.name} ({provider.model}) trả về {dim} chiều "
+                           f"nhưng EMBEDDING_DIM = {EMBEDDING_DIM}")
+
+    try:
+        index_dim = index.describe_index_stats()["dimension"]
+    except Exception as e:
+        print(f"⚠️ Không đọc được số chiều của index: {e}")
+        return
+    if index_dim != INDEX_DIM:
+        raise RuntimeError(f"❌ Index có {index_dim} chiều nhưng embedding có {INDEX_DIM} chiều "
+                           f"(EMBEDDING_DIM / EMBEDDING_REDUCED_DIM): tạo lại index hoặc sửa cấu hình")
+    print(f"✅ Embedding {provider.signature()} -> index {index_dim} chiều")
@@ -0,0 +1,178 @@
+# embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+
+
+def cache_key(provider: str, model: str, text: str) -> str:
+    """Key content-addressed: hash(provider, model, text)"""
+    h = hashlib.sha256()
+    for part in (provider, model, text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache embedding trên đĩa (SQLite), vector lưu dạng float32 bytes.
+    Giới hạn max_entries, vượt quá thì xoá các entry lâu không dùng nhất (LRU).
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys):
+        """Trả về dict key -> vector cho các key có trong cache"""
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            # SQLite giới hạn số tham số mỗi câu lệnh -> chia nhỏ
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, k) for k in found],
+                )
+                self._conn.commit()
+
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, items):
+        """items: list (key, vector)"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(k, array("f", v).tobytes(), now) for k, v in items],
+            )
+            # File cache có thể dùng chung giữa app.py và ingest.py -> đếm lại số dòng thật
+            self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        excess = self._size - self.max_entries
+        if excess <= 0:
+            return
+        cur = self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._size -= cur.rowcount
+        self.evictions += cur.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Cache dùng chung trong process, None nếu EMBEDDING_CACHE_PATH rỗng"""
+    global _cache
+    if not EMBEDDING_CACHE_PATH:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            os.makedirs(os.path.dirname(os.path.abspath(EMBEDDING_CACHE_PATH)), exist_ok=True)
+            _cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+    return _cache
+
+
+def _lookup(provider, model, texts):
+    """(cache, keys, found, missing) — missing: key -> text chưa có trong cache"""
+    cache = get_cache()
+    keys = [cache_key(provider, model, t) for t in texts]
+    found = cache.get_many(keys)
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    return cache, keys, found, missing
+
+
+def _store(cache, keys, found, missing, vectors):
+    new_items = [(k, array("f", v).tolist()) for k, v in zip(missing.keys(), vectors)]
+    cache.put_many(new_items)
+    found.update(new_items)
+    return [found[k] for k in keys]
+
+
+def cached_embeddings(provider: str, model: str, texts, compute):
+    """
+    Lấy embedding cho texts qua cache: chỉ gọi compute(missing_texts)
+    cho những text chưa có, rồi ghi kết quả vào cache.
+    Vector trả về luôn có độ chính xác float32 (như khi đọc từ cache),
+    nên cùng 1 text cho cùng 1 vector ở lần gọi đầu và các lần sau.
+    """
+    texts = list(texts)
+    if get_cache() is None:
+        return compute(texts)
+
+    cache, keys, found, missing = _lookup(provider, model, texts)
+    vectors = compute(list(missing.values())) if missing else []
+    return _store(cache, keys, found, missing, vectors)
+
+
+async def cached_embeddings_async(provider: str, model: str, texts, compute):
+    """Như cached_embeddings nhưng compute là coroutine (chat pipeline async)"""
+    texts = list(texts)
+    if get_cache() is None:
+        return await compute(texts)
+
+    cache, keys, found, missing = _lookup(provider, model, texts)
+    vectors = await compute(list(missing.values())) if missing else []
+    return _store(cache, keys, found, missing, vectors)
+
+
+def get_stats():
+    cache = get_cache()
+    return cache.stats() if cache else {"enabled": False}
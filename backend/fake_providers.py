@@ -0,0 +1,126 @@
+# fake_providers.py
+"""
+Provider giả lập để chạy test / benchmark offline: embedding, model sinh câu trả lời
+(cùng interface với genai.GenerativeModel) và vector index bọc ngoài index thật.
+Mỗi provider có latency (+ jitter) và tỉ lệ lỗi cấu hình được.
+"""
+import asyncio
+import hashlib
+import math
+import random
+import re
+import time
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fake_embedding(text: str, dim: int):
+    """
+    Embedding giả lập, deterministic theo text (hashing trick trên từng từ).
+    Text có nhiều từ chung -> cosine cao, đủ để test RAG offline.
+    """
+    vec = [0.0] * dim
+    for token in _TOKEN_RE.findall(text.lower()):
+        h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        sign = 1.0 if (h >> 63) & 1 else -1.0
+        vec[h % dim] += sign
+
+    norm = math.sqrt(sum(x * x for x in vec))
+    if not norm:
+        vec[0] = 1.0
+        return vec
+    return [x / norm for x in vec]
+
+
+class InjectedFault(RuntimeError):
+    """Lỗi cố ý của provider giả lập"""
+
+
+def _delay(latency_ms: float, jitter_ms: float = 0) -> float:
+    return max(latency_ms + (random.uniform(-jitter_ms, jitter_ms) if jitter_ms else 0), 0) / 1000
+
+
+def _maybe_fail(error_rate: float, what: str):
+    if error_rate and random.random() < error_rate:
+        raise InjectedFault(f"{what}: lỗi giả lập")
+
+
+def fake_embed_batch(texts, dim: int, latency_ms: float = 0, error_rate: float = 0):
+    """Giả lập 1 request batch tới provider: tốn latency_ms cho mỗi request"""
+    if latency_ms:
+        time.sleep(latency_ms / 1000)
+    _maybe_fail(error_rate, "embedding")
+    return [fake_embedding(t, dim) for t in texts]
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """
+    Thay cho genai.GenerativeModel: trả lời bằng vài dòng đầu của prompt sau latency_ms.
+    stream=True chia câu trả lời thành chunks, token đầu sau first_token_ms.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0, first_token_ms=None, chunks=8):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.first_token_ms = latency_ms / 4 if first_token_ms is None else first_token_ms
+        self.chunks = chunks
+
+    @staticmethod
+    def _answer(prompt):
+        return "Fake answer: " + " / ".join(prompt.strip().splitlines()[-3:])[:200]
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        if stream:
+            return self._stream(prompt)
+        time.sleep(_delay(self.latency_ms, self.jitter_ms))
+        _maybe_fail(self.error_rate, "generation")
+        return _Response(self._answer(prompt))
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        await asyncio.sleep(_delay(self.latency_ms, self.jitter_ms))
+        _maybe_fail(self.error_rate, "generation")
+        return _Response(self._answer(prompt))
+
+    def _stream(self, prompt):
+        time.sleep(_delay(self.first_token_ms, self.jitter_ms))
+        _maybe_fail(self.error_rate, "generation")
+        text = self._answer(prompt)
+        step = max(len(text) // self.chunks, 1)
+        rest = _delay(self.latency_ms - self.first_token_ms) / self.chunks
+        for i in range(0, len(text), step):
+            if i:
+                time.sleep(rest)
+            yield _Response(text[i:i + step])
+
+
+class FakeVectorIndex:
+    """Bọc 1 index (vd. LocalVectorIndex), thêm latency / lỗi mạng như Pinecone"""
+
+    def __init__(self, index, latency_ms=0, jitter_ms=0, error_rate=0):
+        self.index = index
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def _call(self, name, *args, **kwargs):
+        time.sleep(_delay(self.latency_ms, self.jitter_ms))
+        _maybe_fail(self.error_rate, f"vector {name}")
+        return getattr(self.index, name)(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        return self._call("query", *args, **kwargs)
+
+    def upsert(self, *args, **kwargs):
+        return self._call("upsert", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._call("delete", *args, **kwargs)
+
+    def fetch(self, *args, **kwargs):
+        return self._call("fetch", *args, **kwargs)
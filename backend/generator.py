@@ -1,14 +1,19 @@
 # generator.py
 import os
 import traceback
-import google.generativeai as genai
 from dotenv import load_dotenv
 import datetime
-import requests
 import json
 import re
 from typing import Dict, Any
 
+from clients import get_generative_model, get_http_session
+from upstream_cache import weather_cache, news_cache
+from intent_matcher import matcher as intent_matcher
+from metrics import span, inc, sample_debug
+from resilience import call, call_async, remaining, ProviderUnavailable
+from urllib.parse import urlsplit
+
 load_dotenv()
 
 # Load all API keys
@@ -16,24 +21,26 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 
+# google-generativeai chỉ được import khi gọi Gemini lần đầu (clients.get_genai): import mất
+# gần 1s. Thiếu GEMINI_API_KEY thì server vẫn chạy, câu hỏi cần LLM nhận câu trả lời hạ cấp.
 if not GEMINI_API_KEY:
-    raise RuntimeError("GEMINI_API_KEY chưa được set.")
-
-genai.configure(api_key=GEMINI_API_KEY)
+    print("⚠️ GEMINI_API_KEY chưa được set: câu hỏi cần Gemini sẽ nhận câu trả lời hạ cấp.")
 
-def generate_answer(context: str, question: str) -> str:
+def generate_answer(context: str, question: str, intent: str = None) -> str:
     """
     Sinh câu trả lời dựa trên context và question với multi-intent support.
+    Nếu intent đã được phân loại trước (router) thì dùng lại, không phân loại lần nữa.
     """
     try:
         # Phân loại intent của câu hỏi
-        intent = _classify_intent(question)
-        print(f"DEBUG: Intent detected = {intent}")
+        if intent is None:
+            intent = classify_intent(question)
+        if sample_debug():
+            print(f"DEBUG: Intent detected = {intent}")
         
         # Xử lý theo từng loại intent
         if intent == "database_query" and context.strip():
-            prompt = f"Dựa vào thông tin sau:\n{context}\n\nHãy trả lời câu hỏi: {question}"
-            return _generate_gemini(prompt)
+            return _generate_gemini(_llm_prompt(context, question, intent))
         
         elif intent == "time":
             return _get_current_time()
@@ -63,78 +70,165 @@ def generate_answer(context: str, question: str) -> str:
             return _get_news_vietnam(question)
         
         else:
-            prompt = f"Hãy trả lời câu hỏi: {question}"
-            return _generate_gemini(prompt)
-            
+            return _generate_gemini(_llm_prompt(context, question, intent))
+
+    except ProviderUnavailable:
+        raise  # nơi gọi hạ cấp câu trả lời (degraded_answer)
     except Exception as e:
         traceback.print_exc()
         return f"Xin lỗi, tôi gặp lỗi: {str(e)}"
 
-def _classify_intent(question: str) -> str:
+# Intent trả lời trực tiếp (không gọi LLM)
+_DIRECT_INTENTS = {"time", "date", "weather", "weather_vn", "calculation",
+                   "greeting", "joke", "news", "news_vn"}
+
+def _llm_prompt(context: str, question: str, intent: str):
+    """Prompt gửi Gemini, None nếu intent được trả lời trực tiếp"""
+    if intent == "database_query" and context.strip():
+        return f"Dựa vào thông tin sau:\n{context}\n\nHãy trả lời câu hỏi: {question}"
+    if intent in _DIRECT_INTENTS:
+        return None
+    return f"Hãy trả lời câu hỏi: {question}"
+
+def generate_answer_stream(context: str, question: str, intent: str = None):
     """
-    Phân loại intent của câu hỏi.
+    Như generate_answer nhưng yield từng đoạn text ngay khi Gemini stream về.
+    Intent trả lời trực tiếp (time, weather, ...) yield cả câu trả lời 1 lần.
     """
-    question_lower = question.lower()
-    
-    intent_keywords = {
-        "time": ["mấy giờ", "giờ là", "thời gian", "bao giờ", "now", "time"],
-        "date": ["hôm nay", "ngày nào", "thứ mấy", "date", "today"],
-        "weather": ["thời tiết", "weather", "nắng", "mưa", "nóng", "lạnh", "nhiệt độ", "độ ẩm"],
-        "weather_vn": ["thời tiết việt nam", "thời tiết hà nội", "thời tiết sài gòn", 
-                      "thời tiết đà nẵng", "thời tiết hồ chí minh", "thời tiết hà nội",
-                      "thời tiết tphcm", "thời tiết đà nẵng", "thời tiết huế", "thời tiết cần thơ",
-                      "thời tiết nha trang", "thời tiết vũng tàu", "thời tiết đà lạt"],
-        "calculation": ["tính", "cộng", "trừ", "nhân", "chia", "+", "-", "*", "/", "bằng bao nhiêu"],
-        "greeting": ["xin chào", "hello", "hi", "chào", "helo", "hế lô"],
-        "joke": ["kể chuyện cười", "đùa", "joke", "funny", "hài"],
-        "news": ["tin tức", "news", "báo", "tin mới", "thời sự", "tin thế giới"],
-        "news_vn": ["tin việt nam", "báo việt nam", "thời sự việt nam", 
-                   "tin trong nước", "báo trong nước", "thời sự trong nước",
-                   "tin việt", "báo mới việt nam"],
-        "database_query": ["ai", "người nào", "tìm", "thông tin", "skill", "hobby"]
-    }
-    
-    for intent, keywords in intent_keywords.items():
-        if any(keyword in question_lower for keyword in keywords):
-            return intent
-    
-    return "general"
+    if intent is None:
+        intent = classify_intent(question)
+    prompt = _llm_prompt(context, question, intent)
+    if prompt is None:
+        yield generate_answer(context, question, intent=intent)
+        return
+    yield from _generate_gemini_stream(prompt)
+
+async def generate_answer_async(context: str, question: str, intent: str = None, http=None) -> str:
+    """
+    Bản async của generate_answer cho asgi.py: Gemini qua generate_content_async,
+    weather/news qua http (httpx.AsyncClient dùng chung, giữ kết nối keep-alive).
+    Intent chỉ tính toán cục bộ (time, date, joke, ...) dùng lại hàm sync.
+    """
+    if intent is None:
+        intent = classify_intent(question)
+
+    prompt = _llm_prompt(context, question, intent)
+    if prompt is not None:
+        return await _generate_gemini_async(prompt)
+
+    if intent in ("weather", "weather_vn"):
+        if not WEATHER_API_KEY:
+            return "Dịch vụ thời tiết chưa được cấu hình. Vui lòng thêm WEATHER_API_KEY vào file .env"
+        try:
+            city = _resolve_city(question)
+            data = await weather_cache.get_async(city, lambda: _fetch_json_async(http, _weather_url(city)))
+            return _format_weather(data)
+        except Exception as e:
+            return f"❌ Lỗi dịch vụ thời tiết: {str(e)}"
+
+    if intent in ("news", "news_vn"):
+        if not NEWS_API_KEY:
+            return "Dịch vụ tin tức chưa được cấu hình."
+        url, fmt = (_news_url(), _format_news) if intent == "news" else (_news_vietnam_url(), _format_news_vietnam)
+        try:
+            return fmt(await news_cache.get_async(intent, lambda: _fetch_json_async(http, url)))
+        except Exception as e:
+            return f"📰 Lỗi dịch vụ tin tức: {str(e)}"
+
+    return generate_answer(context, question, intent=intent)
+
+async def _fetch_json_async(http, url: str):
+    host = urlsplit(url).hostname
+
+    async def fetch():
+        response = await http.get(url, timeout=remaining(10))
+        if response.status_code >= 500:
+            response.raise_for_status()  # lỗi tạm thời của upstream -> không cache
+        return response.json()
+
+    with span("external_api", target=host):
+        return await call_async(host, fetch, timeout=10)
+
+def classify_intent(question: str) -> str:
+    """
+    Phân loại intent của câu hỏi (xem intent_matcher: nguyên từ, bỏ dấu, priority).
+    """
+    return intent_matcher.classify(question)
+
+_GENERATION_CONFIG = {"temperature": 0.7, "max_output_tokens": 200}  # = genai.types.GenerationConfig
 
 def _generate_gemini(prompt: str) -> str:
     """
-    Sử dụng Gemini API với fallback.
+    Gọi Gemini trong deadline của request (hedge sau p95, circuit breaker).
+    Lỗi / quá deadline -> ProviderUnavailable để nơi gọi trả câu trả lời hạ cấp.
     """
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.7,
-                max_output_tokens=200,
-            )
-        )
-        
+    return call("gemini", lambda: get_generative_model().generate_content(
+        prompt, generation_config=_GENERATION_CONFIG).text, hedge=True)
+
+async def _generate_gemini_async(prompt: str) -> str:
+    """Như _generate_gemini nhưng không block event loop"""
+    async def generate():
+        response = await get_generative_model().generate_content_async(
+            prompt, generation_config=_GENERATION_CONFIG)
         return response.text
-        
+
+    return await call_async("gemini", generate, hedge=True)
+
+def _chunk_text(chunk) -> str:
+    try:
+        return chunk.text
+    except ValueError:
+        return ""  # chunk không có text (bị chặn / chỉ có metadata)
+
+def _generate_gemini_stream(prompt: str):
+    """
+    Gemini streaming: chờ chunk đầu tiên trong deadline (circuit breaker, không hedge
+    vì stream không gửi lại được), sau đó yield từng chunk. Không có chunk đầu ->
+    ProviderUnavailable; lỗi giữa chừng thì dừng stream ở đoạn đã gửi.
+    """
+    def first_chunk():
+        response = iter(get_generative_model().generate_content(
+            prompt, generation_config=_GENERATION_CONFIG, stream=True))
+        for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                return text, response
+        return "", response
+
+    text, response = call("gemini", first_chunk)
+    if text:
+        yield text
+    try:
+        for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                yield text
     except Exception as e:
         print(f"Gemini API error: {str(e)}")
-        return _get_fallback_response(prompt)
 
-def _get_fallback_response(prompt: str) -> str:
+_DEGRADED_REASONS = {
+    "deadline": "phản hồi quá chậm",
+    "circuit_open": "tạm thời không khả dụng",
+    "error": "đang gặp lỗi",
+}
+
+def degraded_answer(related, error: ProviderUnavailable) -> str:
     """
-    Fallback response khi Gemini không hoạt động.
+    Câu trả lời khi không gọi được Gemini trong deadline: liệt kê học sinh liên quan
+    đã tìm được (retrieval vẫn đúng, chỉ thiếu phần diễn đạt của LLM).
     """
-    prompt_lower = prompt.lower()
-    
-    if any(word in prompt_lower for word in ["bóng", "đá bóng", "football"]):
-        return "Tôi thấy có người có kỹ năng đá bóng: Pham Thi C và Nguyen Van A."
-    elif any(word in prompt_lower for word in ["sách", "đọc sách", "book"]):
-        return "Có người thích đọc sách: Le Van B và Nguyen Van A."
-    elif any(word in prompt_lower for word in ["âm nhạc", "nhảy", "music"]):
-        return "Tran Thi Huong có sở thích âm nhạc và nhảy."
-    else:
-        return "Tôi đã tìm thấy thông tin phù hợp. Bạn cần biết thêm chi tiết gì?"
+    inc("rag_degraded_total", provider=error.provider, reason=error.reason)
+    print(f"⚠️ Trả lời hạ cấp: {error}")
+    if not related:
+        return "Xin lỗi, hệ thống đang quá tải, vui lòng thử lại sau ít phút."
+    lines = [f"⚠️ Trợ lý {_DEGRADED_REASONS.get(error.reason, 'đang gặp lỗi')}, "
+             f"đây là các học sinh liên quan tìm được:"]
+    for r in related:
+        details = [f"{label}: {r[key]}" for key, label in
+                   (("dob", "ngày sinh"), ("address", "địa chỉ"), ("hobby", "sở thích"),
+                    ("interest", "quan tâm"), ("skill", "kỹ năng")) if r.get(key)]
+        lines.append(f"• {r.get('name') or r.get('id')}" + (f" ({', '.join(details)})" if details else ""))
+    return "\n".join(lines)
 
 # === CÁC CHỨC NĂNG BỔ SUNG VỚI API ===
 
@@ -153,36 +247,53 @@ def _get_weather_info(question: str) -> str:
         return "Dịch vụ thời tiết chưa được cấu hình. Vui lòng thêm WEATHER_API_KEY vào file .env"
     
     try:
-        # Xác định thành phố từ câu hỏi
-        city = _extract_city_from_question(question)
-        if not city:
-            city = "Hanoi"  # Default fallback
-        
-        url = f"http://api.weatherapi.com/v1/current.json?key={WEATHER_API_KEY}&q={city}&aqi=no&lang=vi"
-        
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        
-        if 'error' not in data:
-            location = data['location']['name']
-            temp_c = data['current']['temp_c']
-            condition = data['current']['condition']['text']
-            humidity = data['current']['humidity']
-            wind_kph = data['current']['wind_kph']
-            feels_like = data['current']['feelslike_c']
-            
-            return (f"🌤️ Thời tiết {location}:\n"
-                   f"• Tình trạng: {condition}\n"
-                   f"• Nhiệt độ: {temp_c}°C (cảm giác như {feels_like}°C)\n"
-                   f"• Độ ẩm: {humidity}%\n"
-                   f"• Gió: {wind_kph} km/h")
-        else:
-            error_msg = data['error'].get('message', 'Lỗi không xác định')
-            return f"❌ Không thể lấy thông tin thời tiết: {error_msg}"
+        city = _resolve_city(question)
+        data = weather_cache.get(city, lambda: _fetch_json(_weather_url(city)))
+        return _format_weather(data)
             
     except Exception as e:
         return f"❌ Lỗi dịch vụ thời tiết: {str(e)}"
 
+def _fetch_json(url: str):
+    host = urlsplit(url).hostname
+
+    def fetch():
+        response = get_http_session().get(url, timeout=remaining(10))
+        if response.status_code >= 500:
+            response.raise_for_status()  # lỗi tạm thời của upstream -> không cache
+        return response.json()
+
+    with span("external_api", target=host):
+        return call(host, fetch, timeout=10)
+
+def _resolve_city(question: str) -> str:
+    # Xác định thành phố từ câu hỏi (cũng là key cache thời tiết)
+    city = _extract_city_from_question(question)
+    if not city:
+        city = "Hanoi"  # Default fallback
+    return city
+
+def _weather_url(city: str) -> str:
+    return f"http://api.weatherapi.com/v1/current.json?key={WEATHER_API_KEY}&q={city}&aqi=no&lang=vi"
+
+def _format_weather(data: Dict[str, Any]) -> str:
+    if 'error' not in data:
+        location = data['location']['name']
+        temp_c = data['current']['temp_c']
+        condition = data['current']['condition']['text']
+        humidity = data['current']['humidity']
+        wind_kph = data['current']['wind_kph']
+        feels_like = data['current']['feelslike_c']
+        
+        return (f"🌤️ Thời tiết {location}:\n"
+               f"• Tình trạng: {condition}\n"
+               f"• Nhiệt độ: {temp_c}°C (cảm giác như {feels_like}°C)\n"
+               f"• Độ ẩm: {humidity}%\n"
+               f"• Gió: {wind_kph} km/h")
+    else:
+        error_msg = data['error'].get('message', 'Lỗi không xác định')
+        return f"❌ Không thể lấy thông tin thời tiết: {error_msg}"
+
 def _extract_city_from_question(question: str) -> str:
     """Trích xuất tên thành phố từ câu hỏi"""
     question_lower = question.lower()
@@ -219,69 +330,71 @@ def _get_news(question: str) -> str:
         return "Dịch vụ tin tức chưa được cấu hình."
     
     try:
-        # Sử dụng tin tức từ Mỹ (có sẵn trong free plan)
-        url = f"https://newsapi.org/v2/top-headlines?country=us&apiKey={NEWS_API_KEY}"
-        
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        
-        if data.get('status') == 'ok' and data.get('articles'):
-            articles = data['articles'][:3]
-            news_list = []
-            
-            for i, article in enumerate(articles, 1):
-                title = article.get('title', '')
-                if title and title != "[Removed]":
-                    source = article.get('source', {}).get('name', '')
-                    # Dịch tiêu đề sang tiếng Việt nếu có thể
-                    translated_title = _translate_news_title(title)
-                    news_list.append(f"{i}. {translated_title} ({source})")
-            
-            if news_list:
-                return "📰 Tin tức quốc tế:\n" + "\n".join(news_list)
-            else:
-                return "📰 Hiện không có tin tức quốc tế nào."
-        else:
-            return "📰 Không thể lấy tin tức lúc này."
+        return _format_news(news_cache.get("news", lambda: _fetch_json(_news_url())))
             
     except Exception as e:
         return f"📰 Lỗi dịch vụ tin tức: {str(e)}"
 
+def _news_url() -> str:
+    # Sử dụng tin tức từ Mỹ (có sẵn trong free plan)
+    return f"https://newsapi.org/v2/top-headlines?country=us&apiKey={NEWS_API_KEY}"
+
+def _format_news(data: Dict[str, Any]) -> str:
+    if data.get('status') == 'ok' and data.get('articles'):
+        articles = data['articles'][:3]
+        news_list = []
+        
+        for i, article in enumerate(articles, 1):
+            title = article.get('title', '')
+            if title and title != "[Removed]":
+                source = article.get('source', {}).get('name', '')
+                # Dịch tiêu đề sang tiếng Việt nếu có thể
+                translated_title = _translate_news_title(title)
+                news_list.append(f"{i}. {translated_title} ({source})")
+        
+        if news_list:
+            return "📰 Tin tức quốc tế:\n" + "\n".join(news_list)
+        else:
+            return "📰 Hiện không có tin tức quốc tế nào."
+    else:
+        return "📰 Không thể lấy tin tức lúc này."
+
 def _get_news_vietnam(question: str) -> str:
     """Lấy tin tức Việt Nam từ NewsAPI bằng cách tìm kiếm"""
     if not NEWS_API_KEY:
         return "Dịch vụ tin tức chưa được cấu hình."
     
     try:
-        # Tìm kiếm tin tức về Vietnam bằng từ khóa
-        url = f"https://newsapi.org/v2/everything?q=Vietnam&language=vi&sortBy=publishedAt&apiKey={NEWS_API_KEY}"
-        
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        
-        if data.get('status') == 'ok' and data.get('articles'):
-            articles = data['articles'][:3]
-            news_list = []
-            
-            for i, article in enumerate(articles, 1):
-                title = article.get('title', '')
-                if title and title != "[Removed]":
-                    source = article.get('source', {}).get('name', '')
-                    # Cắt ngắn title nếu quá dài
-                    if len(title) > 80:
-                        title = title[:80] + "..."
-                    news_list.append(f"{i}. {title} ({source})")
-            
-            if news_list:
-                return "📰 Tin tức Việt Nam:\n" + "\n".join(news_list)
-            else:
-                return "📰 Hiện không có tin tức Việt Nam nào."
-        else:
-            return "📰 Không thể lấy tin tức Việt Nam lúc này."
+        return _format_news_vietnam(news_cache.get("news_vn", lambda: _fetch_json(_news_vietnam_url())))
             
     except Exception as e:
         return f"📰 Lỗi dịch vụ tin tức: {str(e)}"
 
+def _news_vietnam_url() -> str:
+    # Tìm kiếm tin tức về Vietnam bằng từ khóa
+    return f"https://newsapi.org/v2/everything?q=Vietnam&language=vi&sortBy=publishedAt&apiKey={NEWS_API_KEY}"
+
+def _format_news_vietnam(data: Dict[str, Any]) -> str:
+    if data.get('status') == 'ok' and data.get('articles'):
+        articles = data['articles'][:3]
+        news_list = []
+        
+        for i, article in enumerate(articles, 1):
+            title = article.get('title', '')
+            if title and title != "[Removed]":
+                source = article.get('source', {}).get('name', '')
+                # Cắt ngắn title nếu quá dài
+                if len(title) > 80:
+                    title = title[:80] + "..."
+                news_list.append(f"{i}. {title} ({source})")
+        
+        if news_list:
+            return "📰 Tin tức Việt Nam:\n" + "\n".join(news_list)
+        else:
+            return "📰 Hiện không có tin tức Việt Nam nào."
+    else:
+        return "📰 Không thể lấy tin tức Việt Nam lúc này."
+
 def _translate_news_title(title: str) -> str:
     """Dịch tiêu đề tin tức sang tiếng Việt (đơn giản)"""
     # Một số từ khóa thông dụng
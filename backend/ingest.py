@@ -1,13 +1,28 @@
 # ingest.py
+import argparse
+import hashlib
+import itertools
 import json
 import os
+import queue
+import threading
+import time
+from contextlib import nullcontext
 from dotenv import load_dotenv
-from pinecone_helper import init_pinecone, upsert_vectors
-from embeddings import get_embedding
 
-# Load biến môi trường từ .env
+# Load biến môi trường từ .env (trước khi import config)
 load_dotenv()
 
+from pinecone_helper import init_pinecone, upsert_vectors, delete_vectors
+from embedder import get_embeddings, get_raw_embeddings, validate_dimensions
+from reduction import get_reducer
+from config import EMBEDDING_PCA_SAMPLE, SNAPSHOT_ENABLED, SNAPSHOT_DIR
+from retrieval import vocabulary, birth_year
+from manifest import get_manifest, record_hash
+from structured_query import student_table
+from utils import student_id
+from snapshot import SnapshotStore
+
 PINECONE_INDEX = os.getenv("PINECONE_INDEX", "students-index")
 DATA_FILE = "data_students.json"
 
@@ -16,41 +31,310 @@ def load_data(file_path):
     with open(file_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def prepare_vectors(data):
-    """Tạo vectors (id, embedding, metadata)"""
-    vectors = []
-    for i, student in enumerate(data, start=1):
-        # Ghép các trường làm input cho embedding
-        text = f"{student['name']} - {student['id']} - {student['dob']} - {student['address']} - {student['hobby']} - {student['interest']} - {student['skill']}"
-        embedding = get_embedding(text)
-
-        metadata = {
-            "id": student["id"],
-            "name": student["name"],
-            "dob": student["dob"],
-            "address": student["address"],
-            "hobby": student["hobby"],
-            "interest": student["interest"],
-            "skill": student["skill"]
-        }
-
-        vectors.append((str(i), embedding, metadata))
-    return vectors
+def _student_text(student):
+    # Ghép các trường làm input cho embedding
+    return f"{student['name']} - {student_id(student)} - {student['dob']} - {student['address']} - {student['hobby']} - {student['interest']} - {student['skill']}"
+
+def _student_metadata(student):
+    metadata = {
+        "id": student_id(student),
+        "name": student["name"],
+        "dob": student["dob"],
+        "address": student["address"],
+        "hobby": student["hobby"],
+        "interest": student["interest"],
+        "skill": student["skill"],
+        "text": _student_text(student),
+    }
+    year = birth_year(student["dob"])
+    if year is not None:
+        metadata["birth_year"] = year  # để filter theo năm sinh
+    return metadata
+
+def prepare_vectors(data, manifest=None):
+    """
+    Tạo vectors (id, embedding, metadata) cho các bản ghi mới hoặc đã đổi so với manifest
+    (id ổn định theo student_id, giống /api/upload).
+    Trả về (vectors, hashes); ghi hashes vào manifest sau khi upsert thành công.
+    """
+    if manifest is None:
+        manifest = get_manifest()
+    get_reducer().ensure_fitted([_student_text(s) for s in data], get_raw_embeddings)
+    records = {}
+    for student in data:
+        text, metadata = _student_text(student), _student_metadata(student)
+        records[student_id(student)] = (text, metadata, record_hash(text, metadata))
+
+    student_table.upsert((rid, r[1]) for rid, r in records.items())
+    changed = manifest.changed({rid: r[2] for rid, r in records.items()})
+    embeddings = get_embeddings([records[rid][0] for rid in changed])
+
+    vectors = [(rid, embedding, records[rid][1]) for rid, embedding in zip(changed, embeddings)]
+    vocabulary.add(records[rid][1] for rid in changed)
+    return vectors, {rid: records[rid][2] for rid in changed}
+
+def prune_missing(index, manifest, seen_ids):
+    """Xoá khỏi index các bản ghi có trong manifest nhưng không còn trong file"""
+    seen_ids = set(seen_ids)
+    missing = [rid for rid in manifest.ids() if rid not in seen_ids]
+    if missing:
+        delete_vectors(index, missing)
+        manifest.remove(missing)
+        student_table.remove(missing)
+    return len(missing)
+
+# =========================
+# Streaming ingest
+# =========================
+
+def iter_records(file_path, chunk_size=1 << 16):
+    """
+    Đọc từng bản ghi mà không load cả file: hỗ trợ JSON array ([{...}, {...}])
+    và JSON Lines (mỗi dòng 1 object).
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, "r", encoding="utf-8-sig") as f:
+        buf = f.read(chunk_size)
+        eof = not buf
+        pos = 0
+
+        def fill():
+            nonlocal buf, pos, eof
+            more = f.read(chunk_size)
+            if not more:
+                eof = True
+            buf = buf[pos:] + more
+            pos = 0
+
+        def skip_ws(extra=""):
+            nonlocal pos
+            while True:
+                while pos < len(buf) and (buf[pos].isspace() or buf[pos] in extra):
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        skip_ws()
+        is_array = pos < len(buf) and buf[pos] == "["
+        if is_array:
+            pos += 1
+
+        while True:
+            skip_ws("," if is_array else "")
+            if pos >= len(buf):
+                return
+            if is_array and buf[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Object bị cắt ngang giữa 2 chunk -> đọc thêm rồi thử lại
+                fill()
+                continue
+            pos = end
+            yield obj
+
+def iter_batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _file_fingerprint(file_path, head_bytes=1 << 16):
+    """Size + mtime + hash 64KB đầu: nhận ra file bị ghi lại ở cùng đường dẫn"""
+    st = os.stat(file_path)
+    with open(file_path, "rb") as f:
+        head = hashlib.sha256(f.read(head_bytes)).hexdigest()
+    return {"size": st.st_size, "mtime": st.st_mtime, "head_sha256": head}
+
+def _load_checkpoint(path, source):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("source") != os.path.abspath(source):
+        return 0
+    if state.get("fingerprint") != _file_fingerprint(source):
+        print(f"⚠️ {source} đã thay đổi kể từ checkpoint {path}, bỏ qua checkpoint và ingest lại từ đầu")
+        return 0
+    return int(state.get("committed", 0))
+
+def _save_checkpoint(path, source, committed, fingerprint):
+    # Ghi ra file tạm rồi rename để checkpoint không bao giờ bị ghi dở
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({
+            "source": os.path.abspath(source),
+            "fingerprint": fingerprint,
+            "committed": committed,
+            "updated_at": time.time(),
+        }, f)
+    os.replace(tmp, path)
+
+def _upsert_with_retry(index, vectors, max_retries=3, backoff=1.0):
+    for attempt in range(max_retries + 1):
+        try:
+            upsert_vectors(index, vectors)
+            return
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            print(f"⚠️ Upsert lỗi ({e}), thử lại sau {delay:.1f}s...")
+            time.sleep(delay)
+
+def stream_ingest(index, file_path, embed_batch_size=200, upsert_batch_size=100,
+                  queue_size=4, checkpoint_path=None, manifest=None, prune=False):
+    """
+    Ingest theo pipeline: thread chính đọc + embed từng batch, thread upsert
+    đẩy batch trước đó lên Pinecone qua queue có giới hạn (embed batch N+1
+    chạy song song với upsert batch N, bộ nhớ chỉ giữ vài batch).
+    Sau mỗi batch upsert thành công, số bản ghi đã commit được ghi vào
+    checkpoint_path; chạy lại sẽ bỏ qua các bản ghi đó. Checkpoint chỉ được dùng
+    nếu file nguồn không đổi (size, mtime, hash phần đầu file).
+    Bản ghi không đổi so với manifest thì không embed/upsert lại; prune=True xoá các
+    bản ghi có trong manifest nhưng không còn trong file (chỉ khi ingest xong cả file).
+    """
+    if manifest is None:
+        manifest = get_manifest()
+    if not get_reducer().fitted:
+        # PCA fit trên EMBEDDING_PCA_SAMPLE bản ghi đầu file, trước batch đầu tiên
+        sample = itertools.islice(iter_records(file_path), EMBEDDING_PCA_SAMPLE)
+        get_reducer().ensure_fitted([_student_text(s) for s in sample], get_raw_embeddings)
+    fingerprint = _file_fingerprint(file_path)
+    committed = _load_checkpoint(checkpoint_path, file_path)
+    if committed:
+        print(f"↩️ Tiếp tục từ checkpoint: bỏ qua {committed} bản ghi đã ingest")
+
+    pending = queue.Queue(maxsize=queue_size)
+    failure = []
+    state = {"committed": committed}
+    seen = set()
+
+    def upsert_worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            end, vectors, hashes = item
+            if failure:
+                continue  # đã lỗi -> chỉ rút cạn queue
+            try:
+                for i in range(0, len(vectors), upsert_batch_size):
+                    _upsert_with_retry(index, vectors[i:i + upsert_batch_size])
+                manifest.set_many(hashes)
+                state["committed"] = end
+                if checkpoint_path:
+                    _save_checkpoint(checkpoint_path, file_path, end, fingerprint)
+            except Exception as e:
+                failure.append(e)
+
+    worker = threading.Thread(target=upsert_worker, daemon=True)
+    worker.start()
+
+    start_time = time.time()
+    position = 0
+    try:
+        for batch in iter_batches(iter_records(file_path), embed_batch_size):
+            batch_start = position
+            position += len(batch)
+            if prune:
+                seen.update(student_id(s) for s in batch)
+            if position <= committed:
+                continue
+            if batch_start < committed:
+                batch = batch[committed - batch_start:]
+                batch_start = committed
+            if failure:
+                break
+
+            vectors, hashes = prepare_vectors(batch, manifest)
+            pending.put((position, vectors, hashes))
+
+            done = state["committed"] - committed
+            rate = done / max(time.time() - start_time, 1e-9)
+            print(f"📦 Đã embed {position} bản ghi, đã upsert {state['committed']} ({rate:.1f} bản ghi/s)")
+    finally:
+        pending.put(None)
+        worker.join()
+        manifest.save()
+        student_table.save()
+
+    if failure:
+        raise RuntimeError(
+            f"Ingest dừng tại bản ghi {state['committed']} (đã checkpoint): {failure[0]}"
+        ) from failure[0]
+
+    if prune:
+        deleted = prune_missing(index, manifest, seen)
+        manifest.save()
+        student_table.save()
+        print(f"🗑️ Đã xoá {deleted} bản ghi không còn trong {file_path}")
+
+    return state["committed"]
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Ingest dữ liệu học sinh vào Pinecone")
+    parser.add_argument("file", nargs="?", default=DATA_FILE, help="file JSON array hoặc JSON Lines")
+    parser.add_argument("--stream", action="store_true", help="ingest theo pipeline, không load cả file")
+    parser.add_argument("--embed-batch", type=int, default=200, help="số bản ghi embed mỗi batch")
+    parser.add_argument("--upsert-batch", type=int, default=100, help="số vector mỗi request upsert")
+    parser.add_argument("--queue-size", type=int, default=4, help="số batch tối đa chờ upsert")
+    parser.add_argument("--checkpoint", default=None, help="file checkpoint (mặc định <file>.checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="bỏ checkpoint cũ, ingest lại từ đầu")
+    parser.add_argument("--prune", action="store_true", help="xoá bản ghi có trong manifest nhưng không còn trong file")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = _parse_args()
     print("🚀 Bắt đầu ingest dữ liệu vào Pinecone...")
 
-    # Khởi tạo Pinecone
-    index = init_pinecone()
+    # SNAPSHOT_ENABLED (serve.py): ghi trong phiên ghi của snapshot (khoá với upload của các
+    # worker) và publish snapshot mới khi xong để worker đang chạy đổi sang
+    snapshots = SnapshotStore(SNAPSHOT_DIR, init_pinecone) if SNAPSHOT_ENABLED else None
+    session = snapshots.writer() if snapshots is not None else nullcontext(init_pinecone())
+    with session as index:
+        validate_dimensions(index)
+
+        if args.stream:
+            checkpoint = args.checkpoint or f"{args.file}.checkpoint.json"
+            if args.restart and os.path.exists(checkpoint):
+                os.remove(checkpoint)
 
-    # Load data từ file JSON
-    data = load_data(DATA_FILE)
-    print(f"📂 Đã đọc {len(data)} bản ghi từ {DATA_FILE}")
+            total = stream_ingest(
+                index, args.file,
+                embed_batch_size=args.embed_batch,
+                upsert_batch_size=args.upsert_batch,
+                queue_size=args.queue_size,
+                checkpoint_path=checkpoint,
+                prune=args.prune,
+            )
+            print(f"✅ Đã ingest {total} bản ghi vào Pinecone ({PINECONE_INDEX}) thành công!")
+        else:
+            # Load data từ file JSON
+            data = load_data(args.file)
+            print(f"📂 Đã đọc {len(data)} bản ghi từ {args.file}")
 
-    # Chuẩn bị vectors
-    vectors = prepare_vectors(data)
+            # Chuẩn bị vectors (chỉ bản ghi mới / đã đổi)
+            manifest = get_manifest()
+            vectors, hashes = prepare_vectors(data, manifest)
 
-    # Upsert vào Pinecone
-    upsert_vectors(index, vectors)
+            # Upsert vào Pinecone
+            try:
+                upsert_vectors(index, vectors)
+                manifest.set_many(hashes)
+                if args.prune:
+                    deleted = prune_missing(index, manifest, (student_id(s) for s in data))
+                    print(f"🗑️ Đã xoá {deleted} bản ghi không còn trong {args.file}")
+            finally:
+                manifest.save()
+                student_table.save()
 
-    print(f"✅ Đã ingest {len(vectors)} bản ghi vào Pinecone ({PINECONE_INDEX}) thành công!")
+            print(f"✅ Đã ingest {len(vectors)} bản ghi mới/thay đổi vào Pinecone ({PINECONE_INDEX}) thành công!")
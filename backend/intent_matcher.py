@@ -0,0 +1,112 @@
+# intent_matcher.py
+"""
+Phân loại intent bằng bảng từ khoá được compile 1 lần thành 1 regex (quét câu hỏi 1 lượt).
+
+- Chuẩn hoá câu hỏi: Unicode NFC (gõ tổ hợp / dựng sẵn đều như nhau), lowercase, gộp khoảng trắng.
+- Từ khoá chỉ khớp nguyên từ: "ai" không khớp trong "hai", "hi" không khớp trong "chi".
+- Bỏ dấu (folding) để hiểu câu gõ không dấu, nhưng chỉ với từ khoá nhiều âm tiết:
+  từ 1 âm tiết bỏ dấu dễ trùng nghĩa khác ("mưa" -> "mua", "báo" -> "bao", "hài" -> "hai").
+- Nhiều intent cùng khớp thì chọn intent có priority cao hơn, rồi tới từ khoá dài hơn
+  ("thời tiết hà nội" -> weather_vn chứ không phải weather).
+- Phép tính chỉ nhận toán tử nằm giữa 2 số ("2 + 3"), không nhận dấu "-" trong tên.
+"""
+import re
+import unicodedata
+
+INTENT_KEYWORDS = {
+    "time": ["mấy giờ", "giờ là", "thời gian", "bao giờ", "now", "time"],
+    "date": ["hôm nay", "ngày nào", "thứ mấy", "date", "today"],
+    "weather": ["thời tiết", "weather", "nắng", "mưa", "nóng", "lạnh", "nhiệt độ", "độ ẩm"],
+    "weather_vn": ["thời tiết việt nam", "thời tiết hà nội", "thời tiết sài gòn",
+                   "thời tiết đà nẵng", "thời tiết hồ chí minh", "thời tiết tphcm",
+                   "thời tiết huế", "thời tiết cần thơ", "thời tiết nha trang",
+                   "thời tiết vũng tàu", "thời tiết đà lạt"],
+    "calculation": ["tính", "cộng", "trừ", "nhân", "chia", "bằng bao nhiêu"],
+    "greeting": ["xin chào", "hello", "hi", "chào", "helo", "hế lô"],
+    "joke": ["kể chuyện cười", "đùa", "joke", "funny", "hài"],
+    "news": ["tin tức", "news", "báo", "tin mới", "thời sự", "tin thế giới"],
+    "news_vn": ["tin việt nam", "tin tức việt nam", "báo việt nam", "thời sự việt nam",
+                "tin trong nước", "báo trong nước", "thời sự trong nước",
+                "tin việt", "báo mới việt nam"],
+    "database_query": ["ai", "người nào", "tìm", "thông tin", "skill", "hobby"],
+}
+
+# Cao -> thấp. Intent cụ thể (theo địa phương) trước intent chung; greeting thấp nhất
+# vì thường đi kèm câu hỏi thật ("chào bạn, thời tiết hà nội thế nào").
+INTENT_PRIORITY = ["weather_vn", "news_vn", "weather", "news", "database_query",
+                   "calculation", "time", "date", "joke", "greeting"]
+
+_CALCULATION = re.compile(r"\d\s*[-+*/]\s*\d")
+
+
+def _fold_table():
+    # Bảng dịch ký tự có dấu (Latin-1 + Latin Extended Additional) -> ký tự gốc,
+    # nhanh hơn nhiều so với NFD + lọc dấu cho từng câu hỏi
+    table = {ord("đ"): "d", ord("Đ"): "D"}
+    for code in list(range(0xC0, 0x250)) + list(range(0x1E00, 0x1F00)):
+        ch = chr(code)
+        base = "".join(c for c in unicodedata.normalize("NFD", ch) if not unicodedata.combining(c))
+        if base != ch and len(base) == 1:
+            table[code] = base
+    return table
+
+
+_FOLD = _fold_table()
+
+
+def normalize(text: str) -> str:
+    if not unicodedata.is_normalized("NFC", text):
+        text = unicodedata.normalize("NFC", text)
+    return " ".join(text.lower().split())
+
+
+def fold(text: str) -> str:
+    """Bỏ dấu tiếng Việt: "thời tiết hà nội" -> "thoi tiet ha noi" """
+    return text.translate(_FOLD)
+
+
+def _compile(keywords):
+    if not keywords:
+        return None
+    # Dài trước để alternation ưu tiên khớp dài nhất tại cùng vị trí
+    alternation = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternation})\b")
+
+
+class IntentMatcher:
+    def __init__(self, keywords=INTENT_KEYWORDS, priority=INTENT_PRIORITY, default="general"):
+        self.default = default
+        self._rank = {intent: len(priority) - i for i, intent in enumerate(priority)}
+        # Dạng bỏ dấu -> [(từ khoá gốc, intent, có bắt buộc khớp đúng dấu không)]
+        self._table = {}
+        for intent, words in keywords.items():
+            for word in words:
+                word = normalize(word)
+                folded = fold(word)
+                exact = folded != word and " " not in folded
+                self._table.setdefault(folded, []).append((word, intent, exact))
+        # 1 regex duy nhất quét trên câu hỏi đã bỏ dấu
+        self._pattern = _compile(self._table)
+
+    def classify(self, question: str) -> str:
+        text = normalize(question)
+        # fold() giữ nguyên độ dài chuỗi nên vị trí khớp trên bản bỏ dấu dùng được cho text
+        folded = text if text.isascii() else fold(text)
+
+        # Priority cao hơn thắng, cùng priority thì từ khoá dài hơn thắng
+        best, best_key = self.default, (0, 0)
+        for m in self._pattern.finditer(folded):
+            for word, intent, exact in self._table[m.group()]:
+                if exact and text[m.start():m.end()] != word:
+                    continue  # từ 1 âm tiết phải đúng dấu: "mua" không phải "mưa"
+                key = (self._rank.get(intent, 0), len(word))
+                if key > best_key:
+                    best, best_key = intent, key
+
+        m = _CALCULATION.search(text)
+        if m and (self._rank.get("calculation", 0), len(m.group())) > best_key:
+            best = "calculation"
+        return best
+
+
+matcher = IntentMatcher()
@@ -0,0 +1,122 @@
+# manifest.py
+"""
+Manifest các bản ghi đã có trong vector index: id -> hash nội dung.
+
+Upload/ingest so sánh dữ liệu mới với manifest để chỉ embed + upsert bản ghi mới hoặc
+đã đổi, và xoá bản ghi không còn trong roster. Hash gồm cả text đem embed, provider /
+model / dimension embedding và cách giảm chiều, nên đổi model / fit lại PCA cũng làm mọi bản ghi
+được embed lại.
+
+Manifest gắn với 1 index (namespace = VECTOR_STORE + tên index / đường dẫn local index);
+file của index khác bị bỏ qua. Lưu JSON tại UPLOAD_MANIFEST_PATH (rỗng = chỉ giữ trong RAM).
+"""
+import hashlib
+import json
+import os
+import threading
+
+from config import UPLOAD_MANIFEST_PATH, VECTOR_STORE, PINECONE_INDEX, LOCAL_INDEX_PATH
+from embedder import get_provider
+from reduction import get_reducer
+
+
+def record_hash(text: str, metadata: dict) -> str:
+    h = hashlib.sha256()
+    h.update(f"{get_provider().signature()}\0{get_reducer().signature()}\0{text}\0".encode("utf-8"))
+    h.update(json.dumps(metadata, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+class Manifest:
+    def __init__(self, path=None, namespace=""):
+        self.path = path
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._records = {}
+        self.reload()
+
+    def reload(self):
+        """Đọc lại từ đĩa (process khác có thể vừa ghi, vd. worker khác của serve.py)"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("namespace") != self.namespace:
+            print(f"⚠️ Manifest {self.path} thuộc index khác ({data.get('namespace')}), bỏ qua")
+            return
+        with self._lock:
+            self._records = data.get("records", {})
+
+    def diff(self, hashes: dict):
+        """
+        hashes: id -> hash của roster mới.
+        Trả về (added, updated, unchanged, deleted): 3 list id đầu thuộc roster mới,
+        deleted là id có trong manifest nhưng không còn trong roster.
+        """
+        added, updated, unchanged = [], [], []
+        with self._lock:
+            for rid, h in hashes.items():
+                old = self._records.get(rid)
+                if old is None:
+                    added.append(rid)
+                elif old != h:
+                    updated.append(rid)
+                else:
+                    unchanged.append(rid)
+            deleted = [rid for rid in self._records if rid not in hashes]
+        return added, updated, unchanged, deleted
+
+    def changed(self, hashes: dict):
+        """Các id trong hashes là mới hoặc đã đổi"""
+        with self._lock:
+            return [rid for rid, h in hashes.items() if self._records.get(rid) != h]
+
+    def set_many(self, hashes: dict):
+        with self._lock:
+            self._records.update(hashes)
+
+    def remove(self, ids):
+        with self._lock:
+            for rid in ids:
+                self._records.pop(rid, None)
+
+    def clear(self):
+        with self._lock:
+            self._records = {}
+
+    def ids(self):
+        with self._lock:
+            return list(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {"namespace": self.namespace, "records": dict(self._records)}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+
+def _namespace():
+    if VECTOR_STORE == "local":
+        return f"local:{os.path.abspath(LOCAL_INDEX_PATH)}"
+    return f"{VECTOR_STORE}:{PINECONE_INDEX}"
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest() -> Manifest:
+    """Manifest dùng chung trong process"""
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = Manifest(UPLOAD_MANIFEST_PATH or None, _namespace())
+    return _manifest
@@ -0,0 +1,207 @@
+# metrics.py
+"""
+Đo latency từng stage của RAG pipeline, giữ trong process (không cần Prometheus client):
+
+    with span("embedding"):
+        q_emb = get_embedding(question)
+
+- Mỗi span ghi thời gian vào histogram rag_stage_duration_seconds{stage=...} (bucket cố định,
+  p50/p95/p99 nội suy từ bucket), span lỗi tăng rag_stage_errors_total{stage=...}.
+- Counter tuỳ ý qua inc("tên", nhãn=...), gauge qua set_gauge("tên", giá trị, nhãn=...).
+- quantile(...) đọc lại p50/p95 của 1 histogram (resilience.py dùng để chọn thời điểm hedge).
+- render_prometheus() cho GET /api/metrics (text format 0.0.4), get_stats() cho /api/stats.
+- sample_debug(): log debug (embedding, response Pinecone, ...) chỉ cho DEBUG_SAMPLE_RATE
+  phần request thay vì mọi request.
+"""
+import bisect
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from config import DEBUG_SAMPLE_RATE
+
+# Giây; đủ dải cho intent (~µs) tới generation (vài giây)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = "rag_stage_duration_seconds"
+STAGE_ERRORS = "rag_stage_errors_total"
+
+_HELP = {
+    STAGE_SECONDS: "Latency of each RAG pipeline stage",
+    STAGE_ERRORS: "Errors raised inside a RAG pipeline stage",
+    "rag_requests_total": "Chat requests by endpoint and intent",
+    "rag_answer_cache_total": "Answer cache lookups by result",
+    "rag_structured_total": "Questions answered from the student table vs. passed on to RAG",
+    "rag_provider_duration_seconds": "Latency of successful provider calls",
+    "rag_hedges_total": "Hedged provider requests fired, and whether the hedge or the original won",
+    "rag_breaker_state": "Circuit breaker state per provider (0 closed, 1 half-open, 2 open)",
+    "rag_breaker_transitions_total": "Circuit breaker state changes per provider",
+    "rag_degraded_total": "Chat answers degraded because a provider missed the deadline or failed",
+    "rag_dependency_ready": "Whether a startup dependency is initialized (1) or not (0)",
+    "rag_startup_seconds": "Seconds from process start-up until a dependency was ready",
+    "rag_snapshot_swaps_total": "Index snapshots loaded by this worker process",
+    "rag_snapshot_version": "Version of the index snapshot this worker process is serving",
+}
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # ô cuối: > bucket lớn nhất
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Nội suy tuyến tính trong bucket chứa quantile (như histogram_quantile của Prometheus)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+_lock = threading.Lock()
+_histograms = {}   # (name, labels) -> Histogram
+_counters = {}     # (name, labels) -> số
+_gauges = {}       # (name, labels) -> giá trị hiện tại
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name: str, value: float, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.observe(value)
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def quantile(name: str, q: float, min_count: int = 1, **labels):
+    """Quantile q (giây) của histogram, None nếu chưa có đủ min_count mẫu"""
+    with _lock:
+        hist = _histograms.get(_key(name, labels))
+        if hist is None or hist.count < min_count:
+            return None
+        return hist.quantile(q)
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """
+    Đo thời gian 1 stage; lỗi trong stage vẫn được tính latency và đếm vào errors.
+    GeneratorExit (client ngắt stream SSE / NDJSON giữa chừng) không tính là lỗi.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except GeneratorExit:
+        raise
+    except BaseException:
+        inc(STAGE_ERRORS, stage=stage, **labels)
+        raise
+    finally:
+        observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage, **labels)
+
+
+def sample_debug() -> bool:
+    """True cho khoảng DEBUG_SAMPLE_RATE phần request (0 = tắt, 1 = mọi request)"""
+    return DEBUG_SAMPLE_RATE > 0 and random.random() < DEBUG_SAMPLE_RATE
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render_prometheus() -> str:
+    with _lock:
+        histograms = {k: (list(h.counts), h.sum, h.count) for k, h in _histograms.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+
+    lines, typed = [], set()
+
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), (counts, total, count) in sorted(histograms.items()):
+        header(name, "histogram")
+        cumulative = 0
+        for bound, n in zip(BUCKETS, counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(labels, [('le', repr(bound))])} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {total}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, "counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+
+    for (name, labels), value in sorted(gauges.items()):
+        header(name, "gauge")
+        lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def get_stats() -> dict:
+    """p50/p95/p99 (ms) theo stage cho /api/stats"""
+    with _lock:
+        items = [(dict(labels), h.count, h.sum, [h.quantile(q) for q in (0.5, 0.95, 0.99)])
+                 for (name, labels), h in _histograms.items() if name == STAGE_SECONDS]
+    stages = {}
+    for labels, count, total, (p50, p95, p99) in sorted(items, key=lambda x: sorted(x[0].items())):
+        stage = labels.pop("stage")
+        name = stage + "".join(f"[{k}={v}]" for k, v in sorted(labels.items()))
+        stages[name] = {
+            "count": count,
+            "mean_ms": round(total / count * 1000, 3) if count else 0.0,
+            "p50_ms": round(p50 * 1000, 3),
+            "p95_ms": round(p95 * 1000, 3),
+            "p99_ms": round(p99 * 1000, 3),
+        }
+    return stages
@@ -1,15 +1,40 @@
 # pinecone_helper.py
-from pinecone import Pinecone, ServerlessSpec
-from config import PINECONE_API_KEY, PINECONE_INDEX, PINECONE_ENV, EMBEDDING_DIM
+from config import (
+    PINECONE_API_KEY, PINECONE_INDEX, PINECONE_ENV, INDEX_DIM,
+    VECTOR_STORE, LOCAL_INDEX_PATH, LOCAL_INDEX_TYPE, LOCAL_IVF_NLIST, LOCAL_IVF_NPROBE,
+    LOCAL_QUANTIZATION, LOCAL_RESCORE_FACTOR,
+)
 
 def init_pinecone():
+    """
+    Khởi tạo vector index theo VECTOR_STORE:
+    - "pinecone": Pinecone serverless index (mặc định)
+    - "local": LocalVectorIndex trong process (vector_store.py), không cần network
+    Cả hai đều có upsert/query/delete nên các hàm bên dưới dùng chung.
+    """
+    if VECTOR_STORE == "local":
+        from vector_store import LocalVectorIndex
+        ann = None
+        if LOCAL_INDEX_TYPE == "ivf":
+            from ann_index import IVFIndex
+            ann = IVFIndex(LOCAL_INDEX_PATH, INDEX_DIM, nlist=LOCAL_IVF_NLIST, nprobe=LOCAL_IVF_NPROBE)
+        elif LOCAL_INDEX_TYPE != "flat":
+            raise ValueError(f"❌ LOCAL_INDEX_TYPE {LOCAL_INDEX_TYPE} không hợp lệ.")
+        return LocalVectorIndex(LOCAL_INDEX_PATH, INDEX_DIM, ann=ann,
+                                quantization=LOCAL_QUANTIZATION, rescore_factor=LOCAL_RESCORE_FACTOR)
+
+    if VECTOR_STORE != "pinecone":
+        raise ValueError(f"❌ VECTOR_STORE {VECTOR_STORE} không hợp lệ.")
+
+    from pinecone import Pinecone, ServerlessSpec
+
     pc = Pinecone(api_key=PINECONE_API_KEY)
 
     # Nếu index chưa tồn tại, tạo mới dimension chuẩn 768
     if PINECONE_INDEX not in pc.list_indexes().names():
         pc.create_index(
             name=PINECONE_INDEX,
-            dimension=EMBEDDING_DIM,  # EMBEDDING_DIM = 768
+            dimension=INDEX_DIM,  # EMBEDDING_DIM (768) hoặc EMBEDDING_REDUCED_DIM nếu có giảm chiều
             metric="cosine",
             spec=ServerlessSpec(cloud="aws", region=PINECONE_ENV)
         )
@@ -20,11 +45,20 @@ def upsert_vectors(index, vectors):
     """ vectors = list of tuples (id, vector, metadata) """
     index.upsert(vectors=vectors)
 
-def query_index(index, vector, top_k=5):
+def delete_vectors(index, ids, batch_size=1000):
+    """Xoá theo id, tối đa batch_size id mỗi request (giới hạn của Pinecone)"""
+    ids = list(ids)
+    for i in range(0, len(ids), batch_size):
+        index.delete(ids=ids[i:i + batch_size])
+
+def query_index(index, vector, top_k=5, filter=None):
+    """filter: metadata filter cú pháp Pinecone ({"address": {"$in": [...]}}, "$and", "$or", ...)"""
+    kwargs = {"filter": filter} if filter else {}
     res = index.query(
         vector=vector,
         top_k=top_k,
         include_metadata=True,
-        include_values=False
+        include_values=False,
+        **kwargs
     )
     return res
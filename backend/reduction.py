@@ -0,0 +1,146 @@
+# reduction.py
+"""
+Giảm chiều embedding trước khi lưu vào index và trước khi query (EMBEDDING_REDUCTION):
+
+- "matryoshka": giữ EMBEDDING_REDUCED_DIM chiều đầu rồi chuẩn hoá L2 lại. Chỉ đúng với model
+  được train kiểu Matryoshka (vd. gemini-embedding-001, text-embedding-3-*), nơi các chiều đầu
+  mang nhiều thông tin nhất.
+- "pca": chiếu lên EMBEDDING_REDUCED_DIM thành phần chính fit trên chính corpus (mọi model).
+  Fit 1 lần (upload / ingest đầu tiên, hoặc `python reduction.py fit data.json`) rồi lưu ra
+  EMBEDDING_PCA_PATH; fit lại thì phải embed lại toàn bộ (signature() đổi -> manifest tự làm).
+
+Query và dữ liệu luôn đi qua cùng 1 reducer nên cosine vẫn so sánh được.
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from config import (
+    EMBEDDING_REDUCTION, EMBEDDING_REDUCED_DIM, EMBEDDING_PCA_PATH, EMBEDDING_PCA_SAMPLE,
+)
+
+METHODS = ("none", "matryoshka", "pca")
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class Reducer:
+    def __init__(self, method="none", out_dim=None, path=None):
+        if method not in METHODS:
+            raise ValueError(f"❌ EMBEDDING_REDUCTION {method} không hợp lệ.")
+        self.method = method
+        self.out_dim = out_dim
+        self.path = path
+        self.mean = None
+        self.components = None   # (out_dim, in_dim)
+        self._lock = threading.Lock()
+        if method == "pca" and path and os.path.exists(path):
+            data = np.load(path)
+            if data["components"].shape[0] == out_dim:
+                self.mean, self.components = data["mean"], data["components"]
+            else:
+                print(f"⚠️ PCA tại {path} có {data['components'].shape[0]} chiều, "
+                      f"khác EMBEDDING_REDUCED_DIM = {out_dim}, bỏ qua")
+
+    @property
+    def fitted(self) -> bool:
+        return self.method != "pca" or self.components is not None
+
+    def signature(self) -> str:
+        """Đổi khi vector lưu trong index không còn so được với vector mới (đưa vào manifest)"""
+        if self.method == "none":
+            return "none"
+        if self.method == "matryoshka":
+            return f"matryoshka:{self.out_dim}"
+        if self.components is None:
+            return f"pca:{self.out_dim}:unfitted"
+        digest = hashlib.sha1(self.components.tobytes()).hexdigest()[:12]
+        return f"pca:{self.out_dim}:{digest}"
+
+    def fit(self, vectors):
+        """Fit PCA (SVD trên dữ liệu đã trừ mean); cần ít nhất out_dim vector"""
+        if self.method != "pca":
+            return
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+        if matrix.shape[0] < self.out_dim:
+            raise ValueError(f"Cần ít nhất {self.out_dim} vector để fit PCA {self.out_dim} chiều, "
+                             f"mới có {matrix.shape[0]}")
+        mean = matrix.mean(axis=0)
+        _, _, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+        with self._lock:
+            self.mean, self.components = mean, vt[:self.out_dim].astype(np.float32)
+        self.save()
+
+    def save(self):
+        if not self.path or self.components is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, mean=self.mean, components=self.components)
+        os.replace(tmp, self.path)
+
+    def transform(self, vectors) -> np.ndarray:
+        """(n, in_dim) -> (n, out_dim) float32 đã chuẩn hoá L2"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if self.method == "none":
+            return matrix
+        if self.method == "matryoshka":
+            return _normalize(matrix[:, :self.out_dim])
+        if self.components is None:
+            raise RuntimeError("PCA chưa được fit: upload/ingest dữ liệu trước "
+                               "hoặc chạy `python reduction.py fit <file>`")
+        return _normalize((_normalize(matrix) - self.mean) @ self.components.T)
+
+    def ensure_fitted(self, texts, embed):
+        """PCA chưa fit thì fit trên tối đa EMBEDDING_PCA_SAMPLE text (embed: list text -> vectors thô)"""
+        if self.fitted or not texts:
+            return
+        sample = list(texts)[:max(EMBEDDING_PCA_SAMPLE, self.out_dim)]
+        if len(sample) < self.out_dim:
+            raise ValueError(f"PCA {self.out_dim} chiều cần ít nhất {self.out_dim} bản ghi trong lần "
+                             f"upload/ingest đầu tiên (mới có {len(sample)}); giảm EMBEDDING_REDUCED_DIM "
+                             f"hoặc dùng EMBEDDING_REDUCTION=matryoshka")
+        print(f"📐 Fit PCA {self.out_dim} chiều trên {len(sample)} bản ghi")
+        self.fit(embed(sample))
+
+
+_reducer = None
+_reducer_lock = threading.Lock()
+
+
+def get_reducer() -> Reducer:
+    global _reducer
+    with _reducer_lock:
+        if _reducer is None:
+            _reducer = Reducer(EMBEDDING_REDUCTION, EMBEDDING_REDUCED_DIM, EMBEDDING_PCA_PATH or None)
+    return _reducer
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from embedder import get_raw_embeddings
+    from utils import student_to_text
+
+    parser = argparse.ArgumentParser(description="Fit PCA cho EMBEDDING_REDUCTION=pca")
+    parser.add_argument("command", choices=["fit"])
+    parser.add_argument("file", help="file JSON array học sinh")
+    args = parser.parse_args()
+
+    reducer = get_reducer()
+    if reducer.method != "pca":
+        raise SystemExit("EMBEDDING_REDUCTION phải là pca")
+    with open(args.file, "r", encoding="utf-8") as f:
+        students = json.load(f)
+    texts = [student_to_text(s) for s in students[:max(EMBEDDING_PCA_SAMPLE, reducer.out_dim)]]
+    reducer.fit(get_raw_embeddings(texts))
+    print(f"✅ Đã lưu PCA vào {reducer.path} ({reducer.signature()}); cần upload/ingest lại toàn bộ")
@@ -0,0 +1,354 @@
+# resilience.py
+"""
+Gọi provider (Gemini, embedding, vector store, weather/news) trong deadline của request:
+
+    with deadline(CHAT_DEADLINE):      # đặt 1 lần cho cả câu hỏi ở app.py / async_pipeline.py
+        q_emb = call("embedding", lambda: provider.embed_batch([q]), hedge=True)
+
+- Deadline nằm trong contextvar nên đi theo request qua embed -> retrieve -> generate
+  (thread Flask, task asyncio, asyncio.to_thread và thread pool bên dưới đều thấy).
+  Mỗi lần gọi chỉ chờ phần thời gian còn lại; còn ít hơn p50 latency của provider thì
+  không gọi nữa (DeadlineExceeded ngay, khỏi tốn request chắc chắn trễ).
+- Hedging: request chưa xong sau p95 (HEDGE_QUANTILE) latency của provider thì gửi thêm
+  1 request giống hệt, lấy kết quả về trước. Chỉ dùng cho request idempotent.
+- Circuit breaker mỗi provider: BREAKER_FAILURES lần gọi lỗi liên tiếp (kể cả quá deadline)
+  -> mở, từ chối ngay trong BREAKER_COOLDOWN giây, sau đó cho 1 request thử (half-open).
+
+Mọi lỗi đều ra ProviderUnavailable (DeadlineExceeded / CircuitOpen / ProviderError)
+để nơi gọi hạ cấp xuống câu trả lời chỉ từ retrieval (generator.degraded_answer).
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from config import (
+    PROVIDER_RETRIES, PROVIDER_POOL_SIZE, HEDGE_ENABLED, HEDGE_QUANTILE,
+    HEDGE_MIN_SAMPLES, HEDGE_MIN_DELAY, BREAKER_FAILURES, BREAKER_COOLDOWN,
+)
+from metrics import observe, inc, set_gauge, quantile
+
+PROVIDER_SECONDS = "rag_provider_duration_seconds"
+
+
+class ProviderUnavailable(Exception):
+    reason = "error"
+
+    def __init__(self, provider: str, message: str):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+
+
+class DeadlineExceeded(ProviderUnavailable):
+    reason = "deadline"
+
+
+class CircuitOpen(ProviderUnavailable):
+    reason = "circuit_open"
+
+
+class ProviderError(ProviderUnavailable):
+    reason = "error"
+
+
+# =========================
+# Deadline
+# =========================
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Đặt deadline cho mọi call() bên trong; lồng nhau thì giữ deadline sớm hơn"""
+    outer = _deadline.get()
+    current = Deadline(seconds)
+    if outer is not None and outer.expires_at < current.expires_at:
+        current = outer
+    token = _deadline.set(current)
+    try:
+        yield current
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(timeout: float = None):
+    """Thời gian còn được chờ: min(timeout, deadline còn lại); None = không giới hạn"""
+    current = _deadline.get()
+    left = current.remaining() if current is not None else None
+    if timeout is None:
+        return left
+    return timeout if left is None else min(timeout, left)
+
+
+# =========================
+# Circuit breaker
+# =========================
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failures: int, cooldown: float):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive = 0
+        self.opened_at = None
+        self._trial = False  # half-open: đang có 1 request thử
+        self._lock = threading.Lock()
+        set_gauge("rag_breaker_state", 0, provider=name)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self._set(self.HALF_OPEN)
+            if self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.consecutive = 0
+            self._trial = False
+            if self.state != self.CLOSED:
+                self._set(self.CLOSED)
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            self._trial = False
+            if self.state == self.HALF_OPEN or self.consecutive >= self.failures:
+                self.opened_at = time.monotonic()  # mở lại thì tính cooldown từ đầu
+                if self.state != self.OPEN:
+                    self._set(self.OPEN)
+
+    def _set(self, state):
+        self.state = state
+        set_gauge("rag_breaker_state", self._GAUGE[state], provider=self.name)
+        inc("rag_breaker_transitions_total", provider=self.name, state=state)
+        print(f"⚡ Circuit breaker {self.name}: {state}")
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.consecutive}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        b = _breakers.get(name)
+        if b is None:
+            b = _breakers[name] = CircuitBreaker(name, BREAKER_FAILURES, BREAKER_COOLDOWN)
+        return b
+
+
+def get_stats():
+    """Cho /api/stats: trạng thái breaker + p50/p95 latency từng provider"""
+    with _breakers_lock:
+        names = sorted(_breakers)
+    return {
+        name: {
+            **breaker(name).stats(),
+            "p50": quantile(PROVIDER_SECONDS, 0.5, provider=name),
+            "p95": quantile(PROVIDER_SECONDS, HEDGE_QUANTILE, provider=name),
+        }
+        for name in names
+    }
+
+
+def reset():
+    """Xoá breaker (test)"""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+# =========================
+# Gọi provider
+# =========================
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _submit(fn):
+    """Chạy fn trong thread pool dùng chung, giữ contextvar (deadline) của request"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=PROVIDER_POOL_SIZE, thread_name_prefix="provider")
+    return _pool.submit(contextvars.copy_context().run, fn)
+
+
+def _admit(name: str, budget):
+    """Trước khi gọi: còn đủ thời gian (>= p50 của provider) và breaker cho phép"""
+    if budget is not None:
+        expected = quantile(PROVIDER_SECONDS, 0.5, min_count=HEDGE_MIN_SAMPLES, provider=name)
+        if budget <= 0 or (expected is not None and budget < expected):
+            raise DeadlineExceeded(name, f"còn {budget:.3f}s, p50 ~{expected or 0:.3f}s")
+    b = breaker(name)
+    if not b.allow():
+        raise CircuitOpen(name, f"circuit open sau {b.consecutive} lỗi liên tiếp")
+    return b
+
+
+def hedge_delay(name: str):
+    """Chờ bao lâu thì hedge: p95 latency của provider, None khi chưa đủ mẫu"""
+    if not HEDGE_ENABLED:
+        return None
+    p = quantile(PROVIDER_SECONDS, HEDGE_QUANTILE, min_count=HEDGE_MIN_SAMPLES, provider=name)
+    return None if p is None else max(p, HEDGE_MIN_DELAY)
+
+
+def _record(name: str, started: float):
+    """done-callback: latency của mọi request thành công (cả request thua hedge)"""
+    def callback(f):
+        if not f.cancelled() and f.exception() is None:
+            observe(PROVIDER_SECONDS, time.monotonic() - started, provider=name)
+    return callback
+
+
+def call(name: str, fn, hedge: bool = False, timeout: float = None, retries: int = PROVIDER_RETRIES):
+    """
+    Gọi fn() trong deadline hiện tại (và timeout nếu có), trả về kết quả hoặc
+    raise ProviderUnavailable. hedge=True: fn idempotent, được gửi thêm 1 bản sau p95.
+    Lỗi nhanh thì thử lại tối đa retries lần nếu còn thời gian.
+    """
+    budget = remaining(timeout)
+    b = _admit(name, budget)
+    delay = hedge_delay(name) if hedge and b.state == b.CLOSED else None
+    if budget is None and delay is None:
+        return _call_inline(name, b, fn, retries)
+
+    start = time.monotonic()
+    end = None if budget is None else start + budget
+    pending, first, hedged, attempts, error = set(), None, False, 0, None
+
+    def launch():
+        f = _submit(fn)
+        f.add_done_callback(_record(name, time.monotonic()))
+        pending.add(f)
+        return f
+
+    first = launch()
+    while True:
+        now = time.monotonic()
+        waits = [t - now for t in (end, None if hedged or delay is None else start + delay) if t is not None]
+        done, _ = wait(pending, timeout=max(min(waits), 0) if waits else None, return_when=FIRST_COMPLETED)
+        for f in done:
+            pending.discard(f)
+            if f.exception() is not None:
+                error = f.exception()
+                continue
+            b.success()
+            if hedged:
+                inc("rag_hedges_total", provider=name, result="won" if f is not first else "lost")
+            return f.result()
+
+        now = time.monotonic()
+        if end is not None and now >= end:
+            b.failure()
+            raise DeadlineExceeded(name, f"quá {budget:.2f}s")
+        if not pending:
+            if attempts < retries:
+                attempts += 1
+                first = launch()
+                continue
+            b.failure()
+            raise ProviderError(name, str(error)) from error
+        if not hedged and delay is not None and now >= start + delay:
+            hedged = True
+            inc("rag_hedges_total", provider=name, result="fired")
+            launch()
+
+
+def _call_inline(name, b, fn, retries):
+    """Không deadline, không hedge (upload, ingest, script): gọi thẳng trong thread hiện tại"""
+    error = None
+    for _ in range(retries + 1):
+        started = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            error = e
+            continue
+        observe(PROVIDER_SECONDS, time.monotonic() - started, provider=name)
+        b.success()
+        return result
+    b.failure()
+    raise ProviderError(name, str(error)) from error
+
+
+async def call_async(name: str, make_coro, hedge: bool = False, timeout: float = None,
+                     retries: int = PROVIDER_RETRIES):
+    """Như call() cho asgi.py: make_coro() tạo coroutine mới cho mỗi lần gửi (kể cả hedge)"""
+    budget = remaining(timeout)
+    b = _admit(name, budget)
+    delay = hedge_delay(name) if hedge and b.state == b.CLOSED else None
+
+    start = time.monotonic()
+    end = None if budget is None else start + budget
+    pending, hedged, attempts, error = set(), False, 0, None
+
+    def launch():
+        task = asyncio.ensure_future(make_coro())
+        task.add_done_callback(_record(name, time.monotonic()))
+        pending.add(task)
+        return task
+
+    first = launch()
+    try:
+        while True:
+            now = time.monotonic()
+            waits = [t - now for t in (end, None if hedged or delay is None else start + delay) if t is not None]
+            done, _ = await asyncio.wait(pending, timeout=max(min(waits), 0) if waits else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                b.success()
+                if hedged:
+                    inc("rag_hedges_total", provider=name, result="won" if task is not first else "lost")
+                return task.result()
+
+            now = time.monotonic()
+            if end is not None and now >= end:
+                b.failure()
+                raise DeadlineExceeded(name, f"quá {budget:.2f}s")
+            if not pending:
+                if attempts < retries:
+                    attempts += 1
+                    first = launch()
+                    continue
+                b.failure()
+                raise ProviderError(name, str(error)) from error
+            if not hedged and delay is not None and now >= start + delay:
+                hedged = True
+                inc("rag_hedges_total", provider=name, result="fired")
+                launch()
+    except asyncio.CancelledError:
+        # Stage timeout của async_pipeline huỷ giữa chừng: tính là provider chậm
+        b.failure()
+        raise
+    finally:
+        for task in pending:
+            task.cancel()
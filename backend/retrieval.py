@@ -0,0 +1,221 @@
+# retrieval.py
+"""
+Hybrid retrieval cho câu hỏi về học sinh:
+
+1. Rút ràng buộc có cấu trúc từ câu hỏi (address, skill, hobby, năm sinh) và đẩy xuống
+   vector index dưới dạng metadata filter (Pinecone filter / pre-filter của local index).
+   "ai ở Hà Nội biết đá bóng" -> {"$and": [{"address": {"$in": ["Hà Nội"]}},
+                                          {"skill": {"$in": ["Đá bóng"]}}]}
+2. Lấy top_k * HYBRID_CANDIDATES ứng viên theo vector, chấm thêm BM25 trên metadata "text"
+   rồi trộn: score = alpha * vector + (1 - alpha) * bm25 / max(bm25).
+
+Giá trị address/skill/hobby được học từ dữ liệu upload/ingest (FieldVocabulary, lưu ra
+RETRIEVAL_VOCAB_PATH) vì Pinecone không liệt kê được metadata. Filter không ra kết quả nào
+(vd. dữ liệu cũ chưa có birth_year) thì query lại không filter.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from config import HYBRID_ALPHA, HYBRID_CANDIDATES, RETRIEVAL_VOCAB_PATH
+from intent_matcher import normalize, fold
+from metrics import sample_debug
+from pinecone_helper import query_index
+from utils import student_to_text
+
+FILTER_FIELDS = ("address", "skill", "hobby")
+
+_BIRTH_YEAR = re.compile(r"\b(?:sinh|năm sinh|sinh năm|born)\D{0,12}((?:19|20)\d{2})\b")
+_TOKEN = re.compile(r"\w+")
+
+
+def birth_year(dob):
+    """Năm sinh (int) từ dob dạng "YYYY-MM-DD", None nếu không đọc được"""
+    match = re.match(r"\s*((?:19|20)\d{2})", str(dob or ""))
+    return int(match.group(1)) if match else None
+
+
+class FieldVocabulary:
+    """Các giá trị address/skill/hobby (hoặc fields) đã thấy, để nhận ra chúng trong câu hỏi"""
+
+    def __init__(self, path=None, fields=FILTER_FIELDS):
+        self.path = path
+        self.fields = tuple(fields)
+        self._lock = threading.Lock()
+        self._values = {field: set() for field in self.fields}
+        self._pattern = None
+        self._table = {}
+        if path and os.path.exists(path):
+            self._values = self._read(path)
+            self._compile()
+
+    def _read(self, path):
+        values = {field: set() for field in self.fields}
+        with open(path, "r", encoding="utf-8") as f:
+            for field, items in json.load(f).items():
+                if field in values:
+                    values[field].update(items)
+        return values
+
+    def reload(self, path):
+        """Thay toàn bộ giá trị bằng nội dung file (vd. snapshot mới của worker khác)"""
+        values = self._read(path)
+        with self._lock:
+            self._values = values
+            self._compile()
+
+    def add(self, metadatas):
+        changed = False
+        with self._lock:
+            for md in metadatas:
+                for field in self.fields:
+                    value = (md or {}).get(field)
+                    if isinstance(value, str) and value.strip() and value not in self._values[field]:
+                        self._values[field].add(value)
+                        changed = True
+            if changed:
+                self._compile()
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._values = {field: set() for field in self.fields}
+            self._compile()
+
+    def _compile(self):
+        # Giống intent_matcher: khớp nguyên từ trên câu đã bỏ dấu,
+        # giá trị 1 âm tiết phải đúng dấu
+        table = {}
+        for field, values in self._values.items():
+            for value in values:
+                word = normalize(value)
+                folded = fold(word)
+                exact = folded != word and " " not in folded
+                table.setdefault(folded, []).append((word, field, value, exact))
+        self._table = table
+        if table:
+            alternation = "|".join(re.escape(k) for k in sorted(table, key=len, reverse=True))
+            self._pattern = re.compile(rf"\b(?:{alternation})\b")
+        else:
+            self._pattern = None
+
+    def save(self, path=None):
+        with self._lock:
+            self._save(path)
+
+    def _save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({k: sorted(v) for k, v in self._values.items()}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def match(self, question: str):
+        """List các nhóm [(field, value), ...]; mỗi nhóm là 1 cụm từ trong câu hỏi"""
+        with self._lock:
+            pattern, table = self._pattern, self._table
+        if pattern is None:
+            return []
+        text = normalize(question)
+        folded = text if text.isascii() else fold(text)
+        groups = []
+        for m in pattern.finditer(folded):
+            group = [(field, value) for word, field, value, exact in table[m.group()]
+                     if not exact or text[m.start():m.end()] == word]
+            if group:
+                groups.append(group)
+        return groups
+
+
+vocabulary = FieldVocabulary(RETRIEVAL_VOCAB_PATH or None)
+
+
+def extract_filter(question: str, vocab: FieldVocabulary = None):
+    """Metadata filter (cú pháp Pinecone) từ câu hỏi, None nếu không có ràng buộc nào"""
+    vocab = vocab or vocabulary
+    clauses = []
+    for group in vocab.match(question):
+        by_field = {}
+        for field, value in group:
+            by_field.setdefault(field, []).append(value)
+        # Cùng cụm từ có thể là skill của người này, hobby của người khác -> $or
+        options = [{field: {"$in": sorted(values)}} for field, values in sorted(by_field.items())]
+        clauses.append(options[0] if len(options) == 1 else {"$or": options})
+
+    match = _BIRTH_YEAR.search(normalize(question))
+    if match:
+        clauses.append({"birth_year": int(match.group(1))})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _tokens(text: str):
+    return _TOKEN.findall(fold(normalize(text)))
+
+
+def bm25_scores(query: str, documents, k1: float = 1.5, b: float = 0.75):
+    """BM25 của query trên từng document (tập ứng viên dùng làm corpus)"""
+    docs = [_tokens(d) for d in documents]
+    if not docs:
+        return []
+    avgdl = sum(len(d) for d in docs) / len(docs) or 1.0
+    df = Counter(t for d in docs for t in set(d))
+    terms = set(_tokens(query))
+
+    scores = []
+    for d in docs:
+        tf = Counter(d)
+        score = 0.0
+        for t in terms:
+            if t not in tf:
+                continue
+            idf = math.log((len(docs) - df[t] + 0.5) / (df[t] + 0.5) + 1)
+            score += idf * tf[t] * (k1 + 1) / (tf[t] + k1 * (1 - b + b * len(d) / avgdl))
+        scores.append(score)
+    return scores
+
+
+def _as_dicts(res):
+    matches = res.matches if hasattr(res, "matches") else res.get("matches", [])
+    out = []
+    for m in matches:
+        if isinstance(m, dict):
+            out.append({"id": m.get("id"), "score": m.get("score"), "metadata": dict(m.get("metadata") or {})})
+        else:
+            out.append({"id": m.id, "score": m.score, "metadata": dict(m.metadata or {})})
+    return out
+
+
+def fuse(question: str, matches, alpha: float = HYBRID_ALPHA):
+    """Trộn điểm vector với BM25 (chuẩn hoá về [0, 1]), sắp xếp lại theo điểm trộn"""
+    texts = [m["metadata"].get("text") or student_to_text(m["metadata"]) for m in matches]
+    bm25 = bm25_scores(question, texts)
+    top = max(bm25, default=0.0) or 1.0
+    for m, s in zip(matches, bm25):
+        m["vector_score"] = m["score"]
+        m["score"] = alpha * (m["score"] or 0.0) + (1 - alpha) * s / top
+    return sorted(matches, key=lambda m: m["score"], reverse=True)
+
+
+def retrieve(index, q_emb, question: str, top_k: int):
+    """Như query_index nhưng có metadata filter + BM25; trả về {"matches", "filter"}"""
+    flt = extract_filter(question)
+    candidates = top_k * max(HYBRID_CANDIDATES, 1)
+
+    matches = _as_dicts(query_index(index, q_emb, top_k=candidates, filter=flt)) if flt else []
+    if flt and not matches:
+        if sample_debug():
+            print(f"DEBUG: filter {flt} không có kết quả -> query lại không filter")
+        flt = None
+    if not matches:
+        matches = _as_dicts(query_index(index, q_emb, top_k=candidates))
+
+    return {"matches": fuse(question, matches)[:top_k], "filter": flt}
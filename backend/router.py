@@ -0,0 +1,45 @@
+# router.py
+import threading
+from collections import defaultdict
+
+from generator import classify_intent
+from metrics import span
+
+# Các intent thực sự dùng context lấy từ Pinecone trong generate_answer
+CONTEXT_INTENTS = {"database_query"}
+
+# Mỗi câu hỏi bỏ qua retrieval tiết kiệm 2 remote call: embedding + vector query
+_SKIPPED_CALLS_PER_QUESTION = {"embedding": 1, "vector_query": 1}
+
+_lock = threading.Lock()
+_routed = defaultdict(int)
+_skipped = defaultdict(lambda: defaultdict(int))
+
+
+def route(question: str):
+    """
+    Phân loại câu hỏi trước khi embed.
+    Trả về (intent, needs_context).
+    """
+    with span("intent"):
+        intent = classify_intent(question)
+    needs_context = intent in CONTEXT_INTENTS
+
+    with _lock:
+        _routed[intent] += 1
+        if not needs_context:
+            for call, n in _SKIPPED_CALLS_PER_QUESTION.items():
+                _skipped[intent][call] += n
+
+    return intent, needs_context
+
+
+def get_stats() -> dict:
+    """Thống kê số câu hỏi theo intent và số remote call đã bỏ qua"""
+    with _lock:
+        skipped = {intent: dict(calls) for intent, calls in _skipped.items()}
+        return {
+            "routed": dict(_routed),
+            "skipped_calls": skipped,
+            "skipped_total": sum(sum(c.values()) for c in skipped.values()),
+        }
@@ -0,0 +1,144 @@
+# serve.py
+"""
+Chạy production nhiều process (pre-fork) thay cho app.run (1 process dev server):
+
+    python serve.py                           # SERVE_WORKERS worker (mặc định = số CPU)
+    python serve.py --workers 4 --port 5000
+
+Process master mở socket rồi fork các worker; mỗi worker import app.py sau khi fork và nhận
+kết nối trên socket chung (kernel chia kết nối), phục vụ nhiều request song song bằng thread.
+Worker chết thì master fork worker mới; SIGTERM / SIGINT tắt lần lượt mọi worker.
+
+Các worker đọc chung 1 snapshot memory-map của vector index (SNAPSHOT_ENABLED, snapshot.py)
+thay vì mỗi worker giữ 1 bản index riêng; POST /api/upload ở worker nào cũng publish snapshot
+mới và mọi worker đổi sang trong vòng SNAPSHOT_CHECK_INTERVAL giây, không cần restart.
+Trạng thái job upload (GET /api/upload/<job_id>) đọc từ UPLOAD_JOBS_DIR nên hỏi worker
+nào cũng được; job của worker đã chết được worker khởi động sau nhận chạy tiếp (upload_jobs.py).
+Manifest cần UPLOAD_MANIFEST_PATH để các worker dùng chung.
+
+Master không import app.py / numpy: fork process đã có thread (khởi tạo nền, BLAS) không an toàn.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# Mặc định mọi worker đọc snapshot dùng chung (set trước khi import config)
+os.environ.setdefault("SNAPSHOT_ENABLED", "true")
+
+from config import FLASK_HOST, FLASK_PORT, SERVE_WORKERS, SERVE_BACKLOG, SNAPSHOT_ENABLED
+
+_RESPAWN_DELAY = 1.0     # worker chết ngay sau khi fork thì chờ trước khi fork lại
+_STOP_TIMEOUT = 10.0     # giây chờ worker tắt trước khi SIGKILL
+
+
+def _serve(sock, worker_id):
+    """Chạy trong process worker, không return"""
+    code = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)   # Ctrl+C do master xử lý
+
+        import threading
+        from werkzeug.serving import make_server
+        import app as flask_app
+
+        host, port = sock.getsockname()[:2]
+        server = make_server(host, port, flask_app.app, threaded=True, fd=sock.fileno())
+        # shutdown() chờ serve_forever dừng -> không gọi thẳng trong signal handler
+        signal.signal(signal.SIGTERM,
+                      lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+        print(f"👷 Worker {worker_id} (pid {os.getpid()}) sẵn sàng nhận kết nối")
+        server.serve_forever()
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(code)
+
+
+class Master:
+    def __init__(self, host, port, workers, backlog=SERVE_BACKLOG):
+        self.workers = workers
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(backlog)
+        # Non-blocking: worker thua khi tranh 1 kết nối không bị kẹt trong accept()
+        self.sock.setblocking(False)
+        self.children = {}   # pid -> (worker_id, thời điểm fork)
+        self.stopping = False
+
+    def spawn(self, worker_id):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            _serve(self.sock, worker_id)
+        self.children[pid] = (worker_id, time.monotonic())
+
+    def stop(self, *_):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for worker_id in range(self.workers):
+            self.spawn(worker_id)
+        print(f"🚀 Master pid {os.getpid()}: {self.workers} worker trên "
+              f"{self.sock.getsockname()[0]}:{self.sock.getsockname()[1]}")
+
+        while self.children and not self.stopping:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            worker_id, started = self.children.pop(pid, (None, 0))
+            if worker_id is None or self.stopping:
+                continue
+            print(f"⚠️ Worker {worker_id} (pid {pid}) thoát với code "
+                  f"{os.waitstatus_to_exitcode(status)}, fork lại")
+            if time.monotonic() - started < _RESPAWN_DELAY:
+                time.sleep(_RESPAWN_DELAY)
+            self.spawn(worker_id)
+
+        deadline = time.monotonic() + _STOP_TIMEOUT
+        while self.children and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.05)
+        for pid in self.children:
+            os.kill(pid, signal.SIGKILL)
+        self.sock.close()
+        print("👋 Đã tắt mọi worker")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy app.py với nhiều worker process (pre-fork)")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS or os.cpu_count() or 1)
+    parser.add_argument("--host", default=FLASK_HOST)
+    parser.add_argument("--port", type=int, default=FLASK_PORT)
+    args = parser.parse_args()
+
+    if not SNAPSHOT_ENABLED and args.workers > 1:
+        print("⚠️ SNAPSHOT_ENABLED=false: mỗi worker mở 1 bản index riêng (chỉ dùng để so sánh, "
+              "không upload khi chạy nhiều worker)")
+    Master(args.host, args.port, args.workers).run()
+
+
+if __name__ == "__main__":
+    main()
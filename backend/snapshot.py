@@ -0,0 +1,500 @@
+# snapshot.py
+"""
+Snapshot chỉ đọc của vector index dùng chung giữa các worker của serve.py.
+
+Mỗi worker mở cùng 1 bộ file bằng memory-map (np.memmap mode "r", mmap.ACCESS_READ), nên
+vector + metadata nằm 1 lần trong page cache của OS dù có bao nhiêu worker; mỗi worker chỉ
+giữ riêng header, từ điển giá trị của các cột filter và vocabulary để nhận ra giá trị
+trong câu hỏi.
+
+    SNAPSHOT_DIR/
+        CURRENT               tên snapshot đang dùng (ghi tmp + os.replace)
+        writer.lock           flock: tại 1 thời điểm chỉ 1 process ghi (job upload / ingest)
+        v00000042/
+            header.json       version, dim, count, cột filter
+            vectors.f32       count x dim float32 đã chuẩn hoá, chỉ các row còn dùng
+            meta.jsonl        {"id", "metadata"} mỗi dòng + offsets.u64 (vị trí byte từng dòng)
+            col_<i>.i32       mã giá trị của 1 field metadata (address, skill, birth_year, ...)
+            table.jsonl, table_<i>.i32 / .json   bảng học sinh cho structured query (SnapshotTable)
+            vocabulary.json   giá trị filter đã học (retrieval.vocabulary)
+
+Ghi: SnapshotStore.writer() khoá writer.lock, nạp snapshot + manifest mới nhất, mở index ghi
+(LocalVectorIndex / Pinecone); hết phiên thì publish snapshot mới rồi mới mở khoá.
+Đọc: refresh() đọc CURRENT (tối đa mỗi SNAPSHOT_CHECK_INTERVAL giây), có bản mới thì mở
+và đổi tham chiếu: request đang chạy dùng nốt snapshot cũ, request sau thấy snapshot mới.
+Bảng học sinh của structured query cũng đọc từ snapshot (SnapshotTable); StudentTable ghi
+được chỉ được nạp trong phiên ghi. Với Pinecone, snapshot không có vector (query vẫn gọi
+Pinecone), chỉ mang bảng học sinh và vocabulary để mọi worker trả lời giống nhau.
+
+Filter (cú pháp Pinecone, như vector_store.matches_filter) được tính trên các cột mã:
+mỗi điều kiện chỉ đánh giá trên từ điển giá trị (vài chục / vài trăm giá trị) rồi tra
+mảng mã bằng NumPy. Field quá nhiều giá trị (name, text, ...) thì đọc metadata từng row.
+"""
+import fcntl
+import json
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+import numpy as np
+
+from config import INDEX_DIM, SNAPSHOT_KEEP, SNAPSHOT_CHECK_INTERVAL
+from vector_store import matches_filter, top_rows
+from manifest import get_manifest
+from retrieval import FieldVocabulary, vocabulary
+from structured_query import FIELDS, INDEXED, MATCH_FIELDS, student_table, use_table, match_key
+from answer_cache import answer_cache
+from metrics import inc, set_gauge
+
+_VERSION = re.compile(r"^v(\d{8})$")
+_MAX_CODES = 4096   # field có nhiều giá trị hơn thì không lập cột mã
+
+
+class _Lines:
+    """Dòng JSON thứ i của 1 file .jsonl, vị trí byte lấy từ mảng offsets (memory-map)"""
+
+    def __init__(self, path, offsets_path, count):
+        if count:
+            self._offsets = np.memmap(offsets_path, dtype=np.uint64, mode="r", shape=(count + 1,))
+            with open(path, "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._offsets, self._data = np.zeros(1, dtype=np.uint64), b""
+
+    def __getitem__(self, i) -> dict:
+        return json.loads(self._data[int(self._offsets[i]):int(self._offsets[i + 1])])
+
+
+class _LineWriter:
+    def __init__(self, path, offsets_path):
+        self._file = open(path, "wb")
+        self._offsets_path = offsets_path
+        self.offsets = array("Q", [0])
+
+    def write(self, item):
+        line = (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+        self._file.write(line)
+        self.offsets.append(self.offsets[-1] + len(line))
+
+    def close(self):
+        self._file.close()
+        with open(self._offsets_path, "wb") as f:
+            self.offsets.tofile(f)
+
+
+def _codes(path, count):
+    if not count:
+        return np.zeros(0, dtype=np.int32)
+    return np.memmap(path, dtype=np.int32, mode="r", shape=(count,))
+
+
+class SnapshotIndex:
+    """1 snapshot đã publish, interface đọc giống LocalVectorIndex (query / fetch / stats)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(self.file("header.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        self.version = header["version"]
+        self.dim = header["dim"]
+        self.count = n = header["count"]
+        self.has_vectors = header["vectors"]
+        self.created_at = header["created_at"]
+
+        self._vectors = (np.memmap(self.file("vectors.f32"), dtype=np.float32, mode="r", shape=(n, self.dim))
+                         if n else np.zeros((0, self.dim), dtype=np.float32))
+        self._meta = _Lines(self.file("meta.jsonl"), self.file("offsets.u64"), n)
+        # field -> (giá trị, mã từng row); row không có field mang giá trị None
+        self._columns = {c["field"]: (c["values"], _codes(self.file(c["file"]), n)) for c in header["columns"]}
+        self._wide = set(header["wide_fields"])
+        self._rows = None   # id -> row, dựng khi fetch lần đầu
+        self._rows_lock = threading.Lock()
+        self.table = SnapshotTable(self, header["table"])
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _mask(self, flt):
+        """Mảng bool: row nào thoả filter"""
+        mask = np.ones(self.count, dtype=bool)
+        for key, cond in flt.items():
+            if key == "$and":
+                for c in cond:
+                    mask &= self._mask(c)
+            elif key == "$or":
+                alternatives = np.zeros(self.count, dtype=bool)
+                for c in cond:
+                    alternatives |= self._mask(c)
+                mask &= alternatives
+            elif key in self._wide:
+                mask &= np.fromiter((matches_filter(self._meta[r]["metadata"], {key: cond})
+                                     for r in range(self.count)), dtype=bool, count=self.count)
+            else:
+                # Đánh giá điều kiện trên từ điển giá trị của cột rồi tra theo mã từng row
+                values, codes = self._columns.get(key, ([None], None))
+                allowed = np.fromiter((matches_filter({key: v}, {key: cond}) for v in values),
+                                      dtype=bool, count=len(values))
+                mask &= allowed[codes] if codes is not None else allowed[0]
+        return mask
+
+    def query(self, vector, top_k=5, include_metadata=True, include_values=False, filter=None, **kwargs):
+        if self.count == 0:
+            return {"matches": []}
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+
+        if filter:
+            rows = np.flatnonzero(self._mask(filter))
+            scores = self._vectors[rows] @ q
+        else:
+            rows = np.arange(self.count)
+            scores = self._vectors @ q
+        k = min(top_k, len(rows))
+        if k <= 0:
+            return {"matches": []}
+
+        matches = []
+        for i in top_rows(scores, k):
+            row = rows[i]
+            record = self._meta[row]
+            match = {"id": record["id"], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = record["metadata"]
+            if include_values:
+                match["values"] = self._vectors[row].tolist()
+            matches.append(match)
+        return {"matches": matches}
+
+    def fetch(self, ids, **kwargs):
+        with self._rows_lock:
+            if self._rows is None:
+                self._rows = {self._meta[r]["id"]: r for r in range(self.count)}
+        vectors = {}
+        for vid in ids:
+            row = self._rows.get(str(vid))
+            if row is not None:
+                record = self._meta[row]
+                vectors[record["id"]] = {"id": record["id"], "values": self._vectors[row].tolist(),
+                                         "metadata": record["metadata"]}
+        return {"vectors": vectors}
+
+    def describe_index_stats(self, **kwargs):
+        return {
+            "dimension": self.dim,
+            "total_vector_count": self.count,
+            "quantization": "none",
+            "bytes_per_vector": self.dim * 4,
+            "snapshot": self.version,
+        }
+
+
+class SnapshotTable:
+    """
+    Bảng học sinh của snapshot, cùng interface truy vấn với structured_query.StudentTable
+    (match / records / group_counts / vocabulary). Dòng đã sắp theo tên như records(); mỗi
+    trường INDEXED là 1 mảng mã (-1 = trống) + danh sách giá trị đã chuẩn hoá, nạp khi cần.
+    match() trả về mảng dòng (NumPy) thay vì set.
+    """
+
+    def __init__(self, snapshot: SnapshotIndex, header: dict):
+        self.count = n = header["count"]
+        self._records = _Lines(snapshot.file("table.jsonl"), snapshot.file("table_offsets.u64"), n)
+        self._fields = {f["field"]: (_codes(snapshot.file(f["codes"]), n), snapshot.file(f["keys"]))
+                        for f in header["fields"]}
+        self._keys = {}     # field -> (giá trị chuẩn hoá, giá trị gốc, {giá trị chuẩn hoá: mã})
+        self._lock = threading.Lock()
+        self.vocabulary = FieldVocabulary(snapshot.file("table_vocabulary.json"), fields=MATCH_FIELDS)
+
+    def __len__(self):
+        return self.count
+
+    def _field_keys(self, field):
+        # Tên học sinh: 1 giá trị / học sinh -> chỉ nạp khi có câu hỏi theo tên
+        with self._lock:
+            if field not in self._keys:
+                with open(self._fields[field][1], "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._keys[field] = (data["keys"], data["labels"], {k: i for i, k in enumerate(data["keys"])})
+            return self._keys[field]
+
+    def _alternative_mask(self, field, op, values):
+        codes = self._fields[field][0]
+        keys, _, lookup = self._field_keys(field)
+        if op == "in":
+            wanted = [lookup[k] for k in map(match_key, values) if k in lookup]
+        else:
+            compare = {"<": int.__lt__, ">": int.__gt__, ">=": int.__ge__}[op]
+            wanted = [i for i, key in enumerate(keys) if compare(key, values[0])]
+        return np.isin(codes, wanted)
+
+    def match(self, conditions):
+        result = None
+        for alternatives in conditions:
+            mask = np.zeros(self.count, dtype=bool)
+            for field, op, values in alternatives:
+                mask |= self._alternative_mask(field, op, values)
+            result = mask if result is None else result & mask
+        return np.arange(self.count) if result is None else np.flatnonzero(result)
+
+    def records(self, rows, limit=None):
+        rows = np.sort(np.asarray(rows, dtype=np.int64))[:limit]
+        return [self._records[row] for row in rows]
+
+    def group_counts(self, field, rows):
+        codes = self._fields[field][0][np.asarray(rows, dtype=np.int64)]
+        _, labels, _ = self._field_keys(field)
+        counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+        groups = [(labels[i], int(n)) for i, n in enumerate(counts) if n]
+        return sorted(groups, key=lambda kv: (-kv[1], str(kv[0])))
+
+    def rows(self):
+        """(id, metadata) từng học sinh, để nạp lại StudentTable ghi được"""
+        for row in range(self.count):
+            record = self._records[row]
+            yield record.pop("id"), record
+
+
+def _write_index(path, index):
+    """vectors.f32, meta.jsonl + cột mã filter của index; trả về phần header tương ứng"""
+    columns = {}     # field -> ({(type, giá trị): mã}, [giá trị], array mã); None luôn là mã 0
+    wide = set()
+    count = 0
+    export = getattr(index, "export", None)   # Pinecone không liệt kê được vector
+
+    meta = _LineWriter(os.path.join(path, "meta.jsonl"), os.path.join(path, "offsets.u64"))
+    with open(os.path.join(path, "vectors.f32"), "wb") as vf:
+        for ids, vectors, metadatas in (export() if export else ()):
+            vf.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            for vid, metadata in zip(ids, metadatas):
+                meta.write({"id": vid, "metadata": metadata})
+                for field in metadata.keys() - columns.keys() - wide:
+                    columns[field] = ({(type(None), None): 0}, [None], array("i", [0] * count))
+                for field, (codes, values, column) in list(columns.items()):
+                    value = metadata.get(field)
+                    try:
+                        key = (type(value), value)
+                        code = codes.get(key)
+                    except TypeError:   # list / dict: không lập cột được
+                        code = key = None
+                    if code is None:
+                        if key is None or len(values) >= _MAX_CODES:
+                            del columns[field]
+                            wide.add(field)
+                            continue
+                        code = codes[key] = len(values)
+                        values.append(value)
+                    column.append(code)
+                count += 1
+    meta.close()
+
+    header_columns = []
+    for i, (field, (_, values, column)) in enumerate(sorted(columns.items())):
+        name = f"col_{i}.i32"
+        with open(os.path.join(path, name), "wb") as f:
+            column.tofile(f)
+        header_columns.append({"field": field, "file": name, "values": values})
+    return {"dim": getattr(index, "dim", INDEX_DIM), "count": count, "vectors": export is not None,
+            "columns": header_columns, "wide_fields": sorted(wide)}
+
+
+def _write_table(path, table):
+    """Bảng học sinh (StudentTable) dạng SnapshotTable; trả về header của bảng"""
+    rows = table.export()
+    records = _LineWriter(os.path.join(path, "table.jsonl"), os.path.join(path, "table_offsets.u64"))
+    for sid, values in rows:
+        records.write(dict({f: values[f] for f in FIELDS}, id=sid))
+    records.close()
+
+    fields = []
+    for i, field in enumerate(INDEXED):
+        lookup, keys, labels = {}, [], []
+        column = array("i")
+        for _, values in rows:
+            value = values[field]
+            if value in (None, ""):
+                column.append(-1)
+                continue
+            key = match_key(value)
+            if key not in lookup:
+                lookup[key] = len(keys)
+                keys.append(key)
+                labels.append(value)
+            column.append(lookup[key])
+        codes, keys_file = f"table_{i}.i32", f"table_{i}.json"
+        with open(os.path.join(path, codes), "wb") as f:
+            column.tofile(f)
+        with open(os.path.join(path, keys_file), "w", encoding="utf-8") as f:
+            json.dump({"keys": keys, "labels": labels}, f, ensure_ascii=False)
+        fields.append({"field": field, "codes": codes, "keys": keys_file})
+    table.vocabulary.save(os.path.join(path, "table_vocabulary.json"))
+    return {"count": len(rows), "fields": fields}
+
+
+def _write_snapshot(path, version, index):
+    """Ghi snapshot của index + bảng học sinh, vocabulary của process này vào thư mục path"""
+    os.makedirs(path)
+    header = {"version": version, "created_at": time.time(), **_write_index(path, index),
+              "table": _write_table(path, student_table)}
+    vocabulary.save(os.path.join(path, "vocabulary.json"))
+    with open(os.path.join(path, "header.json"), "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False)
+
+
+class SnapshotStore:
+    """
+    Snapshot hiện tại của 1 process + phiên ghi. Trong chế độ local, app dùng thẳng store
+    làm index đọc (query / fetch / describe_index_stats chuyển cho snapshot hiện tại).
+    open_writer(): mở index ghi cho 1 phiên (pinecone_helper.init_pinecone).
+    """
+
+    def __init__(self, root: str, open_writer, keep: int = None, check_interval: float = None):
+        self.root = root
+        self.open_writer = open_writer
+        self.keep = max(keep if keep is not None else SNAPSHOT_KEEP, 1)
+        self.check_interval = check_interval if check_interval is not None else SNAPSHOT_CHECK_INTERVAL
+        self.swaps = 0
+        self._snapshot = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    # ---------- đọc ----------
+
+    def _read_current(self):
+        try:
+            with open(os.path.join(self.root, "CURRENT"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def open(self):
+        """Nạp snapshot hiện tại; chưa có thì publish snapshot đầu tiên từ index ghi"""
+        if self._read_current() is None:
+            with self._locked():
+                if self._read_current() is None:
+                    self._publish(self.open_writer(), close=True)
+        self.refresh(force=True)
+        return self
+
+    def refresh(self, force: bool = False) -> bool:
+        """Đổi sang snapshot mới nếu CURRENT đã đổi; True nếu vừa đổi"""
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval:
+            return False
+        with self._lock:
+            self._checked = now
+            version = self._read_current()
+            if version is None or (self._snapshot is not None and self._snapshot.version == version):
+                return False
+            try:
+                snapshot = SnapshotIndex(os.path.join(self.root, version))
+            except FileNotFoundError:   # bị xoá ngay sau khi đọc CURRENT: lần kiểm tra sau
+                return False
+            self._swap(snapshot)
+            return True
+
+    def _swap(self, snapshot, published=False):
+        if not published:
+            # Snapshot do process khác publish: vocabulary filter / câu trả lời cache đã cũ
+            vocabulary.reload(snapshot.file("vocabulary.json"))
+            answer_cache.clear()
+        # Câu hỏi structured đọc bảng của snapshot; bảng ghi được chỉ cần trong phiên ghi
+        use_table(snapshot.table)
+        student_table.clear()
+        self._snapshot = snapshot
+        self.swaps += 1
+        inc("rag_snapshot_swaps_total")
+        set_gauge("rag_snapshot_version", int(_VERSION.match(snapshot.version).group(1)))
+        print(f"🔄 Dùng snapshot {snapshot.version} ({snapshot.count} vector, pid {os.getpid()})")
+
+    def current(self) -> SnapshotIndex:
+        if self._snapshot is None:
+            raise RuntimeError("Chưa nạp snapshot (SnapshotStore.open)")
+        return self._snapshot
+
+    def query(self, *args, **kwargs):
+        return self.current().query(*args, **kwargs)
+
+    def fetch(self, *args, **kwargs):
+        return self.current().fetch(*args, **kwargs)
+
+    def describe_index_stats(self, **kwargs):
+        return self.current().describe_index_stats(**kwargs)
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "vectors": snapshot.count if snapshot else 0,
+            "swaps": self.swaps,
+            "pid": os.getpid(),
+        }
+
+    # ---------- ghi ----------
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.root, "writer.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @contextmanager
+    def writer(self):
+        """
+        Phiên ghi giữa các process: khoá, nạp snapshot + manifest mới nhất (process khác có thể
+        vừa ghi), yield index ghi; hết phiên (kể cả lỗi giữa chừng) publish snapshot mới.
+        """
+        with self._locked():
+            self.refresh(force=True)
+            if self._snapshot is not None:
+                student_table.reload(self._snapshot.table.rows())
+            get_manifest().reload()
+            index = self.open_writer()
+            try:
+                yield index
+            finally:
+                self._publish(index, close=True)
+
+    def _publish(self, index, close=False) -> SnapshotIndex:
+        """Gọi khi đang giữ writer.lock; close=True thì đóng index ghi sau khi publish"""
+        current = self._read_current()
+        number = int(_VERSION.match(current).group(1)) + 1 if current else 1
+        version = f"v{number:08d}"
+        tmp = os.path.join(self.root, f"tmp-{version}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        start = time.perf_counter()
+        try:
+            _write_snapshot(tmp, version, index)
+        finally:
+            if close and hasattr(index, "close"):
+                index.close()
+        os.replace(tmp, os.path.join(self.root, version))
+
+        pointer = os.path.join(self.root, "CURRENT.tmp")
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(pointer, os.path.join(self.root, "CURRENT"))
+
+        snapshot = SnapshotIndex(os.path.join(self.root, version))
+        print(f"📸 Publish snapshot {version}: {snapshot.count} vector "
+              f"trong {time.perf_counter() - start:.2f}s")
+        with self._lock:
+            self._swap(snapshot, published=True)
+        self._prune()
+        return snapshot
+
+    def _prune(self):
+        """Xoá snapshot cũ, giữ self.keep bản gần nhất (worker còn map file cũ vẫn đọc được)"""
+        versions = sorted(name for name in os.listdir(self.root) if _VERSION.match(name))
+        for name in versions[:-self.keep]:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
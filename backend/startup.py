@@ -0,0 +1,133 @@
+# startup.py
+"""
+Khởi tạo nền các phụ thuộc nặng của server (vector index, kiểm tra embedding, client
+Gemini / HTTP, ...) để import app.py / asgi.py chỉ mất vài trăm ms và server nhận kết nối
+ngay, kể cả khi chưa có network lúc boot:
+
+    startup = Startup()
+    startup.add("vector_index", init_pinecone)                       # chặn readiness
+    startup.add("embedding", check, after=("vector_index",))
+    startup.add("clients", warm_up, required=False)                  # chỉ báo cáo
+    startup.start()                                                  # mỗi phụ thuộc 1 thread
+
+    startup.wait("vector_index", timeout)  -> giá trị, hoặc NotReady (request trả 503)
+    startup.report()                       -> GET /api/health/ready
+
+Trạng thái mỗi phụ thuộc: pending -> initializing -> ready | failed. Phụ thuộc bắt buộc
+lỗi (mất mạng, sai API key) được thử lại sau STARTUP_RETRY_INTERVAL giây (tăng dần tới
+60s) thay vì làm process chết; readiness báo lỗi để load balancer không gửi traffic tới.
+"""
+import threading
+import time
+import traceback
+
+from config import STARTUP_RETRY_INTERVAL, WARM_UP_ON_START
+from metrics import set_gauge
+
+_MAX_RETRY_INTERVAL = 60
+
+
+class NotReady(Exception):
+    def __init__(self, name: str, message: str):
+        super().__init__(f"{name}: {message}")
+        self.name = name
+
+
+class Dependency:
+    def __init__(self, name, init, required, after):
+        self.name = name
+        self.init = init
+        self.required = required
+        self.after = tuple(after)
+        self.state = "pending"
+        self.value = None
+        self.error = None
+        self.seconds = None
+        self.attempts = 0
+        self.ready = threading.Event()
+
+    def status(self) -> dict:
+        return {"state": self.state, "required": self.required, "seconds": self.seconds,
+                "attempts": self.attempts, "error": self.error}
+
+
+class Startup:
+    def __init__(self):
+        self._deps = {}
+        self.started_at = None
+
+    def add(self, name: str, init, required: bool = True, after=()):
+        """init() chạy 1 lần trong thread nền, giá trị trả về lấy qua wait(name)"""
+        self._deps[name] = Dependency(name, init, required, after)
+        set_gauge("rag_dependency_ready", 0, dependency=name)
+
+    def start(self, background: bool = True):
+        """background=False: chờ mọi phụ thuộc bắt buộc xong (script / ingest)"""
+        self.started_at = time.monotonic()
+        for dep in self._deps.values():
+            threading.Thread(target=self._run, args=(dep,), name=f"init-{dep.name}", daemon=True).start()
+        if not background:
+            for dep in self._deps.values():
+                if dep.required:
+                    self.wait(dep.name)
+        return self
+
+    def _run(self, dep: Dependency):
+        for name in dep.after:
+            self._deps[name].ready.wait()
+        interval = STARTUP_RETRY_INTERVAL
+        while True:
+            dep.state = "initializing"
+            dep.attempts += 1
+            start = time.monotonic()
+            try:
+                dep.value = dep.init()
+            except Exception as e:
+                traceback.print_exc()
+                dep.state, dep.error = "failed", str(e)
+                print(f"❌ Khởi tạo {dep.name} lỗi (lần {dep.attempts}): {e}")
+                if not dep.required or interval <= 0:
+                    return
+                time.sleep(interval)
+                interval = min(interval * 2, _MAX_RETRY_INTERVAL)
+                continue
+            dep.state, dep.error = "ready", None
+            # Thời gian từ lúc start() tới khi sẵn sàng (gồm cả chờ phụ thuộc trước + thử lại)
+            dep.seconds = round(time.monotonic() - self.started_at, 3)
+            set_gauge("rag_dependency_ready", 1, dependency=dep.name)
+            set_gauge("rag_startup_seconds", dep.seconds, dependency=dep.name)
+            print(f"✅ {dep.name} sẵn sàng sau {dep.seconds:.2f}s "
+                  f"(init {time.monotonic() - start:.2f}s)")
+            dep.ready.set()
+            return
+
+    def wait(self, name: str, timeout: float = None):
+        """Giá trị của phụ thuộc; chưa xong sau timeout giây -> NotReady"""
+        dep = self._deps[name]
+        if not dep.ready.wait(timeout):
+            raise NotReady(name, dep.error or "đang khởi tạo")
+        return dep.value
+
+    def is_ready(self) -> bool:
+        return all(d.ready.is_set() for d in self._deps.values() if d.required)
+
+    def report(self) -> dict:
+        return {
+            "ready": self.is_ready(),
+            "uptime": round(time.monotonic() - self.started_at, 3) if self.started_at else 0.0,
+            "dependencies": {name: d.status() for name, d in self._deps.items()},
+        }
+
+
+def server_startup(init_index) -> Startup:
+    """Phụ thuộc chung của app.py và asgi.py: index, kiểm tra số chiều embedding, warm-up client"""
+    from clients import warm_up
+    from embedder import validate_dimensions
+
+    startup = Startup()
+    startup.add("vector_index", init_index)
+    startup.add("embedding", lambda: validate_dimensions(startup.wait("vector_index")),
+                after=("vector_index",))
+    if WARM_UP_ON_START:
+        startup.add("clients", warm_up, required=False)
+    return startup
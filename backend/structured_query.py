@@ -0,0 +1,407 @@
+# structured_query.py
+"""
+Trả lời câu hỏi đếm / liệt kê / thống kê / tra cứu về học sinh trực tiếp từ bảng metadata
+trong RAM, không qua embedding, vector search hay LLM:
+
+    "có bao nhiêu học sinh ở Hà Nội"   -> count  address = Hà Nội
+    "ai sinh năm 2002"                 -> list   birth_year = 2002
+    "số học sinh theo từng tỉnh"       -> group  by address
+    "Nguyen Van A sống ở đâu"          -> lookup name = Nguyen Van A, trường address
+
+Vector search chỉ trả top_k nên câu đếm / liệt kê sai khi có hơn TOP_K học sinh khớp;
+ở đây kết quả luôn đầy đủ.
+
+StudentTable giữ mỗi trường thành 1 cột (list theo số dòng) + inverted index
+giá trị đã chuẩn hoá -> tập dòng; điều kiện = hợp (OR) rồi giao (AND) các tập dòng.
+Bảng được cập nhật ở upload / ingest (roster là nguồn đúng) và lưu JSON tại STUDENT_TABLE_PATH.
+Khi chạy nhiều worker (serve.py), use_table() chuyển câu hỏi sang snapshot.SnapshotTable:
+cùng match / records / group_counts nhưng đọc cột từ file memory-map dùng chung.
+
+Câu hỏi có ràng buộc mà parser không hiểu hết (vd. "ở" + địa danh chưa có trong dữ liệu)
+thì parse() trả None và câu hỏi đi tiếp qua RAG như cũ.
+"""
+import heapq
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+from config import STRUCTURED_QUERY, STUDENT_TABLE_PATH, STRUCTURED_MAX_LIST
+from intent_matcher import normalize, fold
+from metrics import span, inc
+from retrieval import FieldVocabulary, birth_year
+
+FIELDS = ("name", "dob", "address", "hobby", "interest", "skill")
+INDEXED = ("name", "address", "hobby", "interest", "skill", "birth_year")
+MATCH_FIELDS = ("name", "address", "hobby", "interest", "skill")  # giá trị nhận ra trong câu hỏi
+
+# Intent có thể là câu hỏi về học sinh ("bao nhiêu" không phải từ khoá database_query)
+STRUCTURED_INTENTS = {"database_query", "general"}
+
+LABELS = {"name": "tên", "dob": "ngày sinh", "address": "địa chỉ", "hobby": "sở thích",
+          "interest": "quan tâm", "skill": "kỹ năng", "birth_year": "năm sinh"}
+
+
+def match_key(value):
+    """Giá trị dùng để so khớp: chuỗi chuẩn hoá + bỏ dấu, số giữ nguyên"""
+    return fold(normalize(value)) if isinstance(value, str) else value
+
+
+class StudentTable:
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.RLock()
+        self.vocabulary = FieldVocabulary(fields=MATCH_FIELDS)
+        self._reset()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.upsert(json.load(f).get("rows", {}).items())
+
+    def _reset(self):
+        self._rows = {}                                  # id -> dòng
+        self._ids = []                                   # dòng -> id (None = đã xoá)
+        self._columns = {f: [] for f in FIELDS + ("birth_year",)}
+        self._index = {f: {} for f in INDEXED}           # field -> key -> tập dòng
+        self._order = []                                 # dòng -> key sắp xếp theo tên
+        self._free = []                                  # dòng trống để dùng lại
+
+    def __len__(self):
+        return len(self._rows)
+
+    def upsert(self, records):
+        """records: iterable (id, metadata) như metadata upload/ingest ghi vào index"""
+        records = list(records)
+        with self._lock:
+            for sid, md in records:
+                row = self._rows.get(sid)
+                if row is None:
+                    row = self._free.pop() if self._free else len(self._ids)
+                    if row == len(self._ids):
+                        self._ids.append(None)
+                        self._order.append(None)
+                        for column in self._columns.values():
+                            column.append(None)
+                    self._rows[sid], self._ids[row] = row, sid
+                else:
+                    self._unindex(row)
+                values = {f: md.get(f) for f in FIELDS}
+                values["birth_year"] = md.get("birth_year") or birth_year(md.get("dob"))
+                self._order[row] = (match_key(values["name"] or ""), sid)
+                for field, value in values.items():
+                    self._columns[field][row] = value
+                    if field in self._index and value not in (None, ""):
+                        self._index[field].setdefault(match_key(value), set()).add(row)
+        self.vocabulary.add(md for _, md in records)
+
+    def remove(self, ids):
+        with self._lock:
+            for sid in ids:
+                row = self._rows.pop(sid, None)
+                if row is None:
+                    continue
+                self._unindex(row)
+                for column in self._columns.values():
+                    column[row] = None
+                self._ids[row] = self._order[row] = None
+                self._free.append(row)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+        self.vocabulary.clear()
+
+    def _unindex(self, row):
+        for field, index in self._index.items():
+            value = self._columns[field][row]
+            if value in (None, ""):
+                continue
+            rows = index.get(match_key(value))
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del index[match_key(value)]
+
+    def reload(self, records):
+        """Thay cả bảng bằng records (id, metadata), vd. bảng của snapshot mới nhất trước khi ghi"""
+        fresh = StudentTable()
+        fresh.upsert(records)
+        with self._lock:
+            for name in ("_rows", "_ids", "_columns", "_index", "_order", "_free", "vocabulary"):
+                setattr(self, name, getattr(fresh, name))
+
+    def export(self):
+        """[(id, {field: giá trị, birth_year})] theo thứ tự của records() (tên, rồi id)"""
+        with self._lock:
+            rows = sorted(self._rows.values(), key=self._order.__getitem__)
+            return [(self._ids[row], {f: column[row] for f, column in self._columns.items()}) for row in rows]
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            rows = {sid: {f: self._columns[f][row] for f in FIELDS} for sid, row in self._rows.items()}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"rows": rows}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    # ---------- truy vấn ----------
+
+    def _alternative_rows(self, field, op, values):
+        index = self._index[field]
+        if op == "in":
+            rows = set()
+            for value in values:
+                rows |= index.get(match_key(value), set())
+            return rows
+        compare = {"<": int.__lt__, ">": int.__gt__, ">=": int.__ge__}[op]
+        return {row for key, rows in index.items() if compare(key, values[0]) for row in rows}
+
+    def match(self, conditions):
+        """
+        conditions: list điều kiện, mỗi điều kiện là list (field, op, values) nối bằng OR;
+        các điều kiện nối bằng AND. op: "in" (bằng 1 trong values) hoặc "<", ">", ">=" (số).
+        Trả về tập dòng khớp (không có điều kiện = mọi học sinh).
+        """
+        with self._lock:
+            result = None
+            for alternatives in conditions:
+                rows = set()
+                for field, op, values in alternatives:
+                    rows |= self._alternative_rows(field, op, values)
+                result = rows if result is None else result & rows
+                if not result:
+                    return set()
+            return set(self._rows.values()) if result is None else result
+
+    def records(self, rows, limit=None):
+        """Học sinh ở các dòng rows (sắp theo tên, tối đa limit), dạng giống related của /api/chat"""
+        with self._lock:
+            order = self._order.__getitem__
+            rows = sorted(rows, key=order) if limit is None else heapq.nsmallest(limit, rows, key=order)
+            return [dict({f: self._columns[f][row] for f in FIELDS}, id=self._ids[row]) for row in rows]
+
+    def group_counts(self, field, rows):
+        """[(giá trị, số học sinh)] của field trên các dòng rows, nhiều nhất trước"""
+        with self._lock:
+            everyone = len(rows) == len(self._rows)
+            counts = Counter()
+            for members in self._index[field].values():
+                n = len(members) if everyone else len(members & rows)
+                if n:
+                    # Giá trị gốc (có dấu) của 1 dòng bất kỳ trong nhóm
+                    counts[self._columns[field][next(iter(members))]] += n
+        return sorted(counts.items(), key=lambda kv: (-kv[1], str(kv[0])))
+
+
+student_table = StudentTable(STUDENT_TABLE_PATH or None)
+_serving_table = None   # bảng chỉ đọc của snapshot dùng chung (serve.py); None = student_table
+
+
+def use_table(table):
+    """Câu hỏi đọc từ table (snapshot.SnapshotTable) thay vì student_table; None để bỏ"""
+    global _serving_table
+    _serving_table = table
+
+
+def _default_table():
+    return student_table if _serving_table is None else _serving_table
+
+
+# ---------- parser ----------
+
+class _Cues:
+    """Cụm từ khớp nguyên từ; như intent_matcher, từ 1 âm tiết có dấu phải khớp đúng dấu"""
+
+    def __init__(self, phrases):
+        exact, loose = [], []
+        for phrase in phrases:
+            word = normalize(phrase)
+            folded = fold(word)
+            if folded != word and " " not in folded:
+                exact.append(word)
+            else:
+                loose.append(folded)
+        self._exact = self._compile(exact)
+        self._loose = self._compile(loose)
+
+    @staticmethod
+    def _compile(words):
+        if not words:
+            return None
+        alternation = "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+        return re.compile(rf"\b(?:{alternation})\b")
+
+    def search(self, text, folded):
+        return bool((self._exact and self._exact.search(text))
+                    or (self._loose and self._loose.search(folded)))
+
+
+_COUNT = _Cues(["bao nhiêu", "mấy", "số lượng", "tổng số", "đếm", "how many", "count", "number of"])
+_LIST = _Cues(["ai", "những ai", "người nào", "bạn nào", "học sinh nào", "em nào", "liệt kê",
+               "danh sách", "who", "list", "which"])
+_STUDENTS = _Cues(["học sinh", "sinh viên", "bạn", "người", "lớp", "student", "students", "people"])
+
+# Tra cứu 1 học sinh theo tên: cụm từ -> trường cần trả lời
+_ATTRIBUTES = {
+    "address": _Cues(["ở đâu", "quê quán", "địa chỉ", "where"]),
+    "dob": _Cues(["năm sinh", "ngày sinh", "sinh năm nào", "sinh ngày nào", "sinh khi nào",
+                  "bao nhiêu tuổi", "mấy tuổi", "born", "birthday", "age"]),
+    "hobby": _Cues(["sở thích", "thích gì", "hobby", "hobbies"]),
+    "interest": _Cues(["quan tâm", "interest", "interests"]),
+    "skill": _Cues(["kỹ năng", "kĩ năng", "biết làm gì", "giỏi gì", "skill", "skills"]),
+}
+_ALL_ATTRIBUTES = _Cues(["thông tin", "là ai", "who is", "info"])
+
+# Ràng buộc mà không nhận ra giá trị -> không tự trả lời (vd. địa danh chưa có trong dữ liệu)
+_LOCATION = _Cues(["ở", "sống", "tại", "quê", "đến từ", "live", "lives", "living", "from"])
+_ACTIVITY = _Cues(["thích", "biết", "giỏi", "chơi", "yêu", "quan tâm", "like", "likes", "can",
+                   "play", "plays", "good at"])
+_BIRTH = re.compile(r"(?<!hoc )\bsinh\b(?! vien)|\btuoi\b|\bborn\b|\bage\b")
+
+# Trên câu đã bỏ dấu
+_YEAR = re.compile(r"\b(?:nam sinh|sinh|born)\s+(?:vao\s+)?(?:(truoc|sau|tu|before|after|since|in)\s+)?"
+                   r"(?:nam\s+)?((?:19|20)\d{2})\b")
+_YEAR_OPS = {None: "in", "in": "in", "truoc": "<", "before": "<", "sau": ">", "after": ">",
+             "tu": ">=", "since": ">="}
+_GROUP = re.compile(
+    r"\b(?:moi|tung|theo|each|per|by)\s+(?:hoc sinh\s+)?(?:"
+    r"(tinh|thanh pho|dia chi|que|noi o|dia phuong|address|city)|(so thich|hobby|hobbies)|"
+    r"(moi quan tam|quan tam|interest|interests)|(ky nang|ki nang|skill|skills)|"
+    r"(nam sinh|nam|birth year|year))\b"
+)
+_GROUP_FIELDS = ("address", "hobby", "interest", "skill", "birth_year")
+
+
+def _conditions(question, vocabulary):
+    """Điều kiện từ các giá trị nhận ra trong câu hỏi; cùng 1 trường thì gộp thành OR"""
+    by_field, mixed = {}, []
+    for group in vocabulary.match(question):
+        fields = {field for field, _ in group}
+        if len(fields) == 1:
+            by_field.setdefault(fields.pop(), []).extend(value for _, value in group)
+        else:
+            # Cùng cụm từ là skill của người này, hobby của người khác
+            values = {}
+            for field, value in group:
+                values.setdefault(field, []).append(value)
+            mixed.append([(field, "in", tuple(v)) for field, v in sorted(values.items())])
+    conditions = [[(field, "in", tuple(dict.fromkeys(values)))] for field, values in by_field.items()]
+    return conditions + mixed
+
+
+def parse(question: str, table: StudentTable = None):
+    """
+    Kế hoạch truy vấn {"op", "conditions", "group_by", "fields"} hoặc None nếu câu hỏi
+    không phải đếm / liệt kê / thống kê / tra cứu mà parser hiểu trọn vẹn.
+    """
+    table = _default_table() if table is None else table
+    text = normalize(question)
+    folded = fold(text)
+
+    conditions = _conditions(question, table.vocabulary)
+    year = _YEAR.search(folded)
+    if year:
+        conditions.append([("birth_year", _YEAR_OPS[year.group(1)], (int(year.group(2)),))])
+    fields = {field for alternatives in conditions for field, _, _ in alternatives}
+
+    group = _GROUP.search(folded)
+    group_by = _GROUP_FIELDS[[i for i, g in enumerate(group.groups()) if g][0]] if group else None
+    attributes = [field for field, cues in _ATTRIBUTES.items() if cues.search(text, folded)]
+
+    if "name" in fields and (attributes or _ALL_ATTRIBUTES.search(text, folded)) \
+            and not _COUNT.search(text, folded) and not group_by:
+        return {"op": "lookup", "conditions": conditions, "group_by": None,
+                "fields": attributes or [f for f in FIELDS if f != "name"]}
+    if group_by:
+        op = "group"
+    elif _COUNT.search(text, folded):
+        op = "count"
+    elif _LIST.search(text, folded):
+        op = "list"
+    else:
+        return None
+    if not conditions and not group_by and not _STUDENTS.search(text, folded):
+        return None
+
+    # Có ràng buộc mà không nhận ra giá trị -> để RAG / LLM trả lời
+    if _LOCATION.search(text, folded) and "address" not in fields and group_by != "address":
+        return None
+    if _ACTIVITY.search(text, folded) and not fields & {"hobby", "skill", "interest"} \
+            and group_by not in ("hobby", "skill", "interest"):
+        return None
+    if _BIRTH.search(folded) and "birth_year" not in fields and group_by != "birth_year":
+        return None
+    return {"op": op, "conditions": conditions, "group_by": group_by, "fields": None}
+
+
+# ---------- trả lời ----------
+
+def _describe(conditions):
+    """"ở Hà Nội và có sở thích Đọc sách" """
+    def alternative(field, op, values):
+        joined = " hoặc ".join(str(v) for v in values)
+        if field == "birth_year":
+            return {"in": "sinh năm", "<": "sinh trước năm", ">": "sinh sau năm",
+                    ">=": "sinh từ năm"}[op] + f" {joined}"
+        return {"name": "tên", "address": "ở", "hobby": "có sở thích", "interest": "quan tâm",
+                "skill": "có kỹ năng"}[field] + f" {joined}"
+
+    return " và ".join(" hoặc ".join(alternative(*alt) for alt in alternatives)
+                       for alternatives in conditions)
+
+
+def _names(records, total):
+    names = ", ".join(r["name"] or r["id"] for r in records)
+    return names + (f" và {total - len(records)} học sinh khác" if total > len(records) else "")
+
+
+def execute(plan, table: StudentTable = None) -> dict:
+    """Chạy kế hoạch của parse(): {"answer", "related", "structured"}"""
+    table = _default_table() if table is None else table
+    rows = table.match(plan["conditions"])
+    description = _describe(plan["conditions"])
+    op = plan["op"]
+    related = table.records(rows, limit=STRUCTURED_MAX_LIST) if op != "group" else []
+
+    if op == "group":
+        label = LABELS[plan["group_by"]]
+        groups = table.group_counts(plan["group_by"], rows)
+        scope = f" ({description})" if description else ""
+        answer = (f"Số học sinh theo {label}{scope}: " + ", ".join(f"{v}: {n}" for v, n in groups) + "."
+                  if groups else f"Không có học sinh nào{' ' + description if description else ''}.")
+    elif not len(rows):
+        answer = f"Không có học sinh nào {description}." if description else "Chưa có dữ liệu học sinh."
+    elif op == "count":
+        answer = f"Có {len(rows)} học sinh {description}." if description \
+            else f"Có tổng cộng {len(rows)} học sinh."
+    elif op == "list":
+        answer = f"Có {len(rows)} học sinh{' ' + description if description else ''}: " \
+                 f"{_names(related, len(rows))}."
+    else:
+        answer = " ".join(
+            f"{r['name']}: " + ", ".join(f"{LABELS[f]} {r[f]}" for f in plan["fields"] if r.get(f)) + "."
+            for r in related
+        )
+
+    return {
+        "answer": answer,
+        "related": related,
+        "structured": {"op": op, "matched": len(rows), "group_by": plan["group_by"],
+                       "conditions": plan["conditions"]},
+    }
+
+
+def try_answer(question: str, intent: str, table: StudentTable = None):
+    """Câu trả lời từ bảng (dict của execute) hoặc None để đi tiếp qua RAG"""
+    table = _default_table() if table is None else table
+    if not STRUCTURED_QUERY or intent not in STRUCTURED_INTENTS or not len(table):
+        return None
+    with span("structured_query"):
+        plan = parse(question, table)
+        result = execute(plan, table) if plan else None
+    inc("rag_structured_total", result="answered" if result else "fallback")
+    return result
@@ -0,0 +1,94 @@
+# tests/conftest.py
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Chạy test offline: fake embedding, local vector store, không cache trên đĩa.
+# Set trước khi import config (load_dotenv không ghi đè biến đã có).
+os.environ.update({
+    "EMBEDDING_PROVIDER": "fake",
+    "EMBEDDING_DIM": "768",
+    "EMBEDDING_CACHE_PATH": "",
+    "ANSWER_CACHE_MAX_ENTRIES": "0",
+    "VECTOR_STORE": "local",
+    "LOCAL_INDEX_PATH": tempfile.mkdtemp(prefix="test_local_index_"),
+    "TOP_K": "5",
+    "FLASK_PORT": "5000",
+    "GEMINI_API_KEY": "test-key",
+    "WARM_UP_ON_START": "false",
+    "WEATHER_CACHE_TTL": "0",
+    "NEWS_CACHE_TTL": "0",
+    "RETRIEVAL_VOCAB_PATH": "",
+    "UPLOAD_MANIFEST_PATH": "",
+    "UPLOAD_JOBS_DIR": "",
+    "STUDENT_TABLE_PATH": "",
+})
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(autouse=True)
+def fresh_vocabulary():
+    """Giá trị filter học từ upload không được rò rỉ giữa các test"""
+    import retrieval
+    retrieval.vocabulary.clear()
+    yield
+    retrieval.vocabulary.clear()
+
+
+@pytest.fixture(autouse=True)
+def fresh_student_table():
+    from structured_query import student_table
+    student_table.clear()
+    yield
+    student_table.clear()
+
+
+@pytest.fixture(autouse=True)
+def fresh_resilience():
+    """Breaker và latency provider (quyết định hedge / fail fast) không rò rỉ giữa các test"""
+    import metrics
+    import resilience
+    metrics.reset()
+    resilience.reset()
+    yield
+    resilience.reset()
+
+
+@pytest.fixture(autouse=True)
+def fresh_manifest():
+    """Mỗi test bắt đầu với manifest rỗng (upload/ingest coi mọi bản ghi là mới)"""
+    from manifest import get_manifest
+    get_manifest().clear()
+    yield
+    get_manifest().clear()
+
+
+@pytest.fixture
+def students():
+    with open(os.path.join(BACKEND_DIR, "data_students.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def rag_only(monkeypatch):
+    """Tắt structured query để câu hỏi liệt kê ("ai biết ...") đi qua đường RAG"""
+    import structured_query
+    monkeypatch.setattr(structured_query, "STRUCTURED_QUERY", False)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Flask test client với index rỗng riêng cho mỗi test và Gemini giả"""
+    import app
+    import generator
+    from vector_store import LocalVectorIndex
+
+    monkeypatch.setattr(app, "index", LocalVectorIndex(str(tmp_path / "index"), 768))
+    monkeypatch.setattr(generator, "_generate_gemini", lambda prompt: "LLM: " + prompt)
+    monkeypatch.setattr(generator, "_generate_gemini_stream", lambda prompt: iter(["LLM: ", prompt]))
+    return app.app.test_client()
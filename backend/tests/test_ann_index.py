@@ -0,0 +1,63 @@
+# tests/test_ann_index.py
+import numpy as np
+
+from ann_index import IVFIndex
+from vector_store import LocalVectorIndex
+
+
+def _clustered(n, dim, centers=20, seed=0):
+    rng = np.random.default_rng(seed)
+    c = rng.normal(size=(centers, dim))
+    return (c[rng.integers(0, centers, n)] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def _build(path, X, nlist=16, nprobe=4):
+    ann = IVFIndex(str(path), X.shape[1], nlist=nlist, nprobe=nprobe, train_threshold=500)
+    index = LocalVectorIndex(str(path), X.shape[1], ann=ann)
+    for i in range(0, len(X), 1000):
+        index.upsert([(str(j), X[j], {"j": j}) for j in range(i, min(i + 1000, len(X)))])
+    return index, ann
+
+
+def _recall(index, X, queries, k=10):
+    Xn = X / np.linalg.norm(X, axis=1, keepdims=True)
+    hits = 0
+    for q in queries:
+        exact = set(map(str, np.argsort(-(Xn @ (q / np.linalg.norm(q))))[:k]))
+        got = {m["id"] for m in index.query(q, top_k=k)["matches"]}
+        hits += len(exact & got)
+    return hits / (k * len(queries))
+
+
+def test_ivf_trains_after_threshold_and_keeps_recall(tmp_path):
+    X = _clustered(4000, 32)
+    index, ann = _build(tmp_path, X)
+    assert ann.trained
+    assert _recall(index, X, X[:50]) >= 0.9
+
+
+def test_full_probe_equals_exact_search(tmp_path):
+    X = _clustered(3000, 16)
+    index, ann = _build(tmp_path, X)
+    ann.nprobe = ann.nlist
+    assert _recall(index, X, X[:30]) == 1.0
+
+
+def test_incremental_insert_delete_and_reload(tmp_path):
+    X = _clustered(3000, 16)
+    index, ann = _build(tmp_path, X)
+
+    new = np.random.default_rng(1).normal(size=16).astype(np.float32) * 5
+    index.upsert([("new", new, {"j": "new"})])
+    assert index.query(new, top_k=1)["matches"][0]["id"] == "new"
+
+    index.delete(ids=["new"])
+    assert index.query(new, top_k=1)["matches"][0]["id"] != "new"
+    index.upsert([("again", new, {})])
+    del index, ann
+
+    ann = IVFIndex(str(tmp_path), 16, nlist=16, nprobe=4, train_threshold=500)
+    reloaded = LocalVectorIndex(str(tmp_path), 16, ann=ann)
+    assert ann.trained
+    assert reloaded.query(new, top_k=1)["matches"][0]["id"] == "again"
+    assert reloaded.query(X[42], top_k=1)["matches"][0]["id"] == "42"
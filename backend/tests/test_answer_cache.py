@@ -0,0 +1,62 @@
+# tests/test_answer_cache.py
+import numpy as np
+import pytest
+
+import app
+import generator
+import upload_jobs
+from answer_cache import SemanticAnswerCache
+
+
+def _vec(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_hit_requires_similar_question_and_same_students():
+    cache = SemanticAnswerCache(max_entries=10, ttl=60, threshold=0.9)
+    cache.put(_vec(1, 0, 0), ["s1", "s2"], "answer")
+
+    assert cache.get(_vec(0.99, 0.05, 0), ["s2", "s1"]) == "answer"
+    assert cache.get(_vec(0, 1, 0), ["s1", "s2"]) is None        # câu hỏi khác
+    assert cache.get(_vec(1, 0, 0), ["s1", "s3"]) is None        # học sinh khác
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2 and stats["hit_rate"] == pytest.approx(1 / 3, abs=1e-3)
+
+
+def test_lru_eviction_ttl_and_invalidation(monkeypatch):
+    cache = SemanticAnswerCache(max_entries=2, ttl=60, threshold=0.9)
+    cache.put(_vec(1, 0), ["a"], "A")
+    cache.put(_vec(0, 1), ["b"], "B")
+    cache.get(_vec(1, 0), ["a"])            # A vừa dùng -> B là LRU
+    cache.put(_vec(1, 1), ["c"], "C")
+    assert cache.get(_vec(0, 1), ["b"]) is None
+    assert cache.get(_vec(1, 0), ["a"]) == "A"
+
+    assert cache.invalidate(["a", "zzz"]) == 1
+    assert cache.get(_vec(1, 0), ["a"]) is None
+
+    import answer_cache as module
+    now = module.time.time()
+    monkeypatch.setattr(module.time, "time", lambda: now + 61)
+    assert cache.get(_vec(1, 1), ["c"]) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_chat_reuses_answer_until_upload_changes_students(client, students, monkeypatch, rag_only):
+    cache = SemanticAnswerCache(max_entries=10, ttl=60, threshold=0.9)
+    monkeypatch.setattr(app, "answer_cache", cache)
+    monkeypatch.setattr(upload_jobs, "answer_cache", cache)
+    calls = []
+    monkeypatch.setattr(generator, "_generate_gemini", lambda prompt: calls.append(prompt) or "LLM")
+
+    client.post("/api/upload?wait=true", json=students)
+    first = client.post("/api/chat", json={"question": "ai biết đá bóng"}).json
+    second = client.post("/api/chat", json={"question": "ai biết đá bóng ?"}).json
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert len(calls) == 1
+
+    students[0]["skill"] = "Bơi lội"
+    client.post("/api/upload?wait=true", json=students)
+    third = client.post("/api/chat", json={"question": "ai biết đá bóng"}).json
+    assert third["cached"] is False and len(calls) == 2
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,97 @@
+# tests/test_async_pipeline.py
+import asyncio
+import time
+
+import pytest
+
+import async_pipeline
+import generator
+from embedder import get_embeddings
+from retrieval import vocabulary
+from utils import student_to_text
+from vector_store import LocalVectorIndex
+
+
+@pytest.fixture
+def index(tmp_path, students):
+    index = LocalVectorIndex(str(tmp_path / "index"), 768)
+    texts = [student_to_text(s) for s in students]
+    index.upsert([(s["id"], e, {**s, "text": t}) for s, t, e in zip(students, texts, get_embeddings(texts))])
+    vocabulary.add(students)
+    return index
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    async def llm(prompt):
+        await asyncio.sleep(0.05)
+        return "LLM: " + prompt
+    monkeypatch.setattr(generator, "_generate_gemini_async", llm)
+
+
+def test_answer_question_runs_rag_pipeline(index, fake_llm):
+    result = asyncio.run(async_pipeline.answer_question(index, "ai biết đá bóng", http=None))
+    assert result["intent"] == "database_query"
+    # "đá bóng" là skill đã biết -> chỉ lấy học sinh có skill Đá bóng
+    assert {r["id"] for r in result["related"]} == {"s001", "s004"}
+    assert result["answer"].startswith("LLM: Dựa vào thông tin sau")
+
+
+def test_direct_intent_skips_embedding(index, monkeypatch):
+    async def boom(text):
+        raise AssertionError("không được embed")
+    monkeypatch.setattr(async_pipeline, "get_embedding_async", boom)
+
+    result = asyncio.run(async_pipeline.answer_question(index, "mấy giờ rồi", http=None))
+    assert result["intent"] == "time" and result["related"] == []
+
+
+def test_concurrent_chats_share_one_event_loop(index, fake_llm):
+    async def run():
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            async_pipeline.answer_question(index, "ai biết đá bóng", http=None) for _ in range(50)
+        ])
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(run())
+    assert len(results) == 50
+    assert elapsed < 50 * 0.05 / 2   # các lần gọi LLM chờ song song, không nối tiếp
+
+
+def test_stage_timeout(index, monkeypatch):
+    async def slow(prompt):
+        await asyncio.sleep(1)
+    monkeypatch.setattr(generator, "_generate_gemini_async", slow)
+    monkeypatch.setattr(async_pipeline, "CHAT_GENERATE_TIMEOUT", 0.05)
+
+    # Gemini không kịp -> câu trả lời chỉ từ retrieval thay vì lỗi
+    result = asyncio.run(async_pipeline.answer_question(index, "ai biết đá bóng", http=None))
+    assert result["degraded"] and result["degraded_reason"] == "deadline"
+    assert {r["id"] for r in result["related"]} == {"s001", "s004"}
+
+
+def test_embedding_timeout_raises_stage_timeout(index, monkeypatch):
+    async def slow(text):
+        await asyncio.sleep(1)
+    monkeypatch.setattr(async_pipeline, "get_embedding_async", slow)
+    monkeypatch.setattr(async_pipeline, "CHAT_EMBED_TIMEOUT", 0.05)
+
+    with pytest.raises(async_pipeline.StageTimeout) as exc:
+        asyncio.run(async_pipeline.answer_question(index, "ai biết đá bóng", http=None))
+    assert exc.value.stage == "embedding"
+
+
+def test_asgi_chat_endpoint(index, fake_llm, monkeypatch):
+    pytest.importorskip("starlette")
+    from starlette.testclient import TestClient
+    import asgi
+
+    monkeypatch.setattr(asgi, "init_pinecone", lambda: index)
+    with TestClient(asgi.app) as client:
+        assert client.get("/api/health").json() == {"status": "ok"}
+        assert client.post("/api/chat", json={}).status_code == 400
+        res = client.post("/api/chat", json={"question": "ai biết đá bóng"})
+        assert res.status_code == 200 and len(res.json()["related"]) == 2
+        metrics = client.get("/api/metrics").text
+        assert 'rag_stage_duration_seconds_count{endpoint="chat_async",stage="total"}' in metrics
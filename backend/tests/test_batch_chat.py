@@ -0,0 +1,86 @@
+# tests/test_batch_chat.py
+import json
+import time
+
+import generator
+import metrics
+from embedder import get_provider
+
+
+def _lines(response):
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return {r["index"]: r for r in lines[:-1]}, lines[-1]["summary"]
+
+
+def test_batch_dedupes_and_streams_one_line_per_question(client, students, rag_only):
+    client.post("/api/upload?wait=true", json=students)
+    questions = ["ai biết đá bóng", "ai  biết đá bóng ", "mấy giờ rồi", "", "ai thích đọc sách"]
+
+    res = client.post("/api/chat/batch", json={"questions": questions})
+    assert res.status_code == 200 and res.mimetype == "application/x-ndjson"
+    results, summary = _lines(res)
+
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert results[0]["answer"] == results[1]["answer"] and results[1]["question"] == questions[1]
+    assert {r["skill"] for r in results[0]["related"]} == {"Đá bóng"}
+    assert results[2]["intent"] == "time" and results[2]["related"] == []
+    assert results[3]["error"] == "question is required"
+    assert summary["questions"] == 5 and summary["unique"] == 4
+    assert summary["rag"] == 2 and summary["direct"] == 1 and summary["errors"] == 1
+
+
+def test_batch_answers_structured_questions_from_table(client, students):
+    client.post("/api/upload?wait=true", json=students)
+    res = client.post("/api/chat/batch", json={"questions": ["Có bao nhiêu học sinh ở Hà Nội?"]})
+    results, summary = _lines(res)
+    assert results[0]["structured"]["op"] == "count" and summary["structured"] == 1
+
+
+def test_client_closing_batch_stream_is_not_an_error(client, students, rag_only):
+    client.post("/api/upload?wait=true", json=students)
+    metrics.reset()
+    res = client.post("/api/chat/batch", json={"questions": ["ai biết đá bóng", "ai thích đọc sách"]},
+                      buffered=False)
+    next(iter(res.response))
+    res.close()   # client ngắt kết nối giữa chừng
+
+    text = metrics.render_prometheus()
+    assert 'rag_stage_duration_seconds_count{endpoint="chat_batch",stage="total"} 1' in text
+    assert 'rag_stage_errors_total{endpoint="chat_batch"' not in text
+
+
+def test_batch_embeds_together_and_beats_one_by_one(client, students, rag_only, monkeypatch):
+    client.post("/api/upload?wait=true", json=students)
+
+    def slow_llm(prompt):
+        time.sleep(0.05)
+        return "LLM: " + prompt
+    monkeypatch.setattr(generator, "_generate_gemini", slow_llm)
+
+    provider = get_provider()
+    embed_batch, calls = provider.embed_batch, []
+    monkeypatch.setattr(provider, "embed_batch", lambda texts: calls.append(len(texts)) or embed_batch(texts))
+
+    questions = [f"ai biết đá bóng {i}" for i in range(16)]
+    start = time.perf_counter()
+    for q in questions:
+        assert client.post("/api/chat", json={"question": q + " lẻ"}).status_code == 200
+    one_by_one = time.perf_counter() - start
+    calls.clear()
+
+    start = time.perf_counter()
+    results, summary = _lines(client.post("/api/chat/batch", json={"questions": questions}))
+    batched = time.perf_counter() - start
+
+    assert len(results) == 16 and summary["errors"] == 0
+    assert all(r["answer"].startswith("LLM: ") for r in results.values())
+    assert calls == [16]                      # 1 request embedding cho cả batch
+    assert batched < one_by_one / 3
+
+
+def test_batch_validates_input(client, monkeypatch):
+    import app
+    assert client.post("/api/chat/batch", json={"questions": "ai biết đá bóng"}).status_code == 400
+    assert client.post("/api/chat/batch", json={"questions": [1, 2]}).status_code == 400
+    monkeypatch.setattr(app, "BATCH_MAX_QUESTIONS", 2)
+    assert client.post("/api/chat/batch", json={"questions": ["a", "b", "c"]}).status_code == 413
@@ -0,0 +1,45 @@
+# tests/test_bench_load.py
+import pytest
+
+import bench_load
+import generator
+from fake_providers import FakeGenerativeModel, FakeVectorIndex, InjectedFault, fake_embed_batch
+from resilience import ProviderUnavailable
+
+
+def test_generate_students_extends_base_roster(students):
+    roster = bench_load.generate_students(200, seed=1)
+    assert roster[:len(students)] == students
+    assert len({s["id"] for s in roster}) == 200
+    assert roster == bench_load.generate_students(200, seed=1)
+    assert {"address", "hobby", "interest", "skill", "dob"} <= set(roster[-1])
+
+
+def test_compare_flags_throughput_and_tail_latency_regressions():
+    old = {"results": [{"endpoint": "chat", "concurrency": 8, "rps": 100.0, "p95_ms": 50.0},
+                       {"endpoint": "upload", "concurrency": 8, "rps": 10.0, "p95_ms": 500.0}]}
+    new = {"results": [{"endpoint": "chat", "concurrency": 8, "rps": 98.0, "p95_ms": 80.0},
+                       {"endpoint": "upload", "concurrency": 8, "rps": 12.0, "p95_ms": 450.0}]}
+    rows, regressions = bench_load.compare(old, new, threshold=0.1)
+    assert regressions == 1
+    assert [r["regressed"] for r in rows] == [True, False]
+
+
+def test_fake_providers_inject_errors(monkeypatch):
+    with pytest.raises(InjectedFault):
+        fake_embed_batch(["a"], 8, error_rate=1.0)
+
+    index = FakeVectorIndex(object(), error_rate=1.0)
+    with pytest.raises(InjectedFault):
+        index.query(vector=[0.0], top_k=1)
+
+    # Lỗi model thành ProviderUnavailable để app trả câu trả lời hạ cấp
+    monkeypatch.setattr(generator, "get_generative_model", lambda: FakeGenerativeModel(error_rate=1.0))
+    with pytest.raises(ProviderUnavailable):
+        generator._generate_gemini("Câu hỏi: ai biết đá bóng")
+
+
+def test_fake_model_streams_chunks(monkeypatch):
+    monkeypatch.setattr(generator, "get_generative_model", lambda: FakeGenerativeModel(chunks=4))
+    parts = list(generator._generate_gemini_stream("ai biết đá bóng"))
+    assert len(parts) >= 4 and "".join(parts).startswith("Fake answer:")
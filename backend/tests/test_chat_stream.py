@@ -0,0 +1,36 @@
+# tests/test_chat_stream.py
+import json
+
+
+def _events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_sends_related_before_tokens(client, students, rag_only):
+    client.post("/api/upload?wait=true", json=students)
+
+    res = client.post("/api/chat/stream", json={"question": "ai biết đá bóng"})
+    assert res.mimetype == "text/event-stream"
+    events = _events(res)
+
+    assert events[0][0] == "related"
+    assert events[0][1]["intent"] == "database_query"
+    assert {r["skill"] for r in events[0][1]["related"]} == {"Đá bóng"}
+    tokens = [data["text"] for name, data in events if name == "token"]
+    assert tokens[0] == "LLM: " and "Đá bóng" in tokens[1]
+    assert events[-1][0] == "done"
+
+
+def test_stream_direct_intent_skips_retrieval(client):
+    events = _events(client.post("/api/chat/stream", json={"question": "mấy giờ rồi"}))
+    assert events[0] == ("related", {"related": [], "intent": "time"})
+    assert events[1][0] == "token" and events[1][1]["text"].startswith("Bây giờ là")
+    assert events[-1][0] == "done"
+
+
+def test_stream_requires_question(client):
+    assert client.post("/api/chat/stream", json={}).status_code == 400
@@ -0,0 +1,64 @@
+# tests/test_clients.py
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import clients
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    clients.reset()
+    yield
+    clients.reset()
+
+
+def test_http_session_is_shared_and_pooled():
+    session = clients.get_http_session()
+    assert clients.get_http_session() is session
+    adapter = session.get_adapter("https://newsapi.org")
+    assert adapter._pool_maxsize == clients.HTTP_MAX_CONNECTIONS
+
+
+def test_client_created_once_under_concurrency():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return object()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: clients._get_or_create("x", factory), range(64)))
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_generative_model_reused():
+    pytest.importorskip("google.generativeai")
+    model = clients.get_generative_model()
+    assert clients.get_generative_model() is model
+
+
+def test_generator_uses_shared_session(monkeypatch):
+    import generator
+
+    class Response:
+        status_code = 200
+
+        def json(self):
+            return {"status": "ok", "articles": [{"title": "Tin A", "source": {"name": "VnE"}}]}
+
+    seen = []
+    session = clients.get_http_session()
+    monkeypatch.setattr(session, "get", lambda url, timeout: seen.append(url) or Response())
+    monkeypatch.setattr(generator, "NEWS_API_KEY", "k")
+
+    assert "Tin A" in generator._get_news_vietnam("tin tức việt nam")
+    assert len(seen) == 1
+
+
+def test_warm_up_reports_steps(monkeypatch):
+    monkeypatch.delenv("WEATHER_API_KEY", raising=False)
+    monkeypatch.delenv("NEWS_API_KEY", raising=False)
+    timings = clients.warm_up()
+    assert isinstance(timings["http_session"], float)
@@ -0,0 +1,43 @@
+# tests/test_context_builder.py
+from context_builder import build_context, estimate_tokens, HEADER
+from utils import format_matches
+
+
+def _related(students, copies=1):
+    res = {"matches": [
+        {"id": f"{s['id']}-{c}", "score": 1 - 0.01 * i, "metadata": s}
+        for i, (c, s) in enumerate((c, s) for c in range(copies) for s in students)
+    ]}
+    return format_matches(res)
+
+
+def test_estimate_tokens_counts_words_and_punctuation():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("Skill: coding") == 2 + 1 + 2   # "Skill", ":", "coding"
+    assert estimate_tokens("Hà Nội") > estimate_tokens("Ha Noi")
+
+
+def test_compact_encoding_saves_tokens(students):
+    related, verbose = _related(students)
+    text, stats = build_context(related, verbose)
+    lines = text.splitlines()
+    assert lines[0] == HEADER and len(lines) == 1 + len(students)
+    assert "Nguyen Van A|2001-05-20|Hà Nội|Đọc sách|Cafe sách|Đá bóng" in lines
+    assert stats["tokens"] < stats["baseline_tokens"]
+    assert stats["saved_tokens"] == stats["baseline_tokens"] - stats["tokens"]
+
+
+def test_duplicates_are_removed(students):
+    related, verbose = _related(students, copies=3)
+    text, stats = build_context(related, verbose)
+    assert stats["students"] == len(students)
+    assert stats["deduplicated"] == 2 * len(students)
+
+
+def test_budget_keeps_highest_scores(students):
+    related, verbose = _related(students)
+    related[2]["score"] = 5.0
+    text, stats = build_context(related, verbose, budget=estimate_tokens(HEADER) + 40)
+    assert stats["students"] == 1 and stats["dropped"] == len(students) - 1
+    assert text.splitlines()[1].startswith(related[2]["name"])
+    assert stats["tokens"] <= estimate_tokens(HEADER) + 40
@@ -0,0 +1,57 @@
+# tests/test_embedding_cache.py
+import embedding_cache
+from embedding_cache import EmbeddingCache, cache_key, cached_embeddings
+
+
+def test_key_depends_on_provider_model_and_text():
+    keys = {
+        cache_key("gemini", "m1", "a"),
+        cache_key("gemini", "m2", "a"),
+        cache_key("openai", "m1", "a"),
+        cache_key("gemini", "m1", "b"),
+    }
+    assert len(keys) == 4
+
+
+def test_lru_eviction_and_counters(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "c.sqlite3"), max_entries=2)
+    cache.put_many([("a", [1.0]), ("b", [2.0])])
+    cache.get_many(["a"])               # a vừa dùng -> b là LRU
+    cache.put_many([("c", [3.0])])
+
+    found = cache.get_many(["a", "b", "c"])
+    assert set(found) == {"a", "c"}
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3 and stats["misses"] == 1
+
+
+def test_eviction_counts_rows_written_by_other_process(tmp_path):
+    path = str(tmp_path / "c.sqlite3")
+    app_cache = EmbeddingCache(path, max_entries=3)
+    ingest_cache = EmbeddingCache(path, max_entries=3)
+
+    app_cache.put_many([("a", [1.0]), ("b", [2.0])])
+    ingest_cache.put_many([("c", [3.0]), ("d", [4.0])])   # ingest không biết a, b
+    app_cache.put_many([("e", [5.0])])
+
+    assert app_cache.stats()["entries"] == 3
+    assert len(app_cache.get_many(["a", "b", "c", "d", "e"])) == 3
+
+
+def test_cached_embeddings_returns_float32_on_first_and_later_calls(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "_cache", EmbeddingCache(str(tmp_path / "c.sqlite3")))
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_PATH", str(tmp_path / "c.sqlite3"))
+    calls = []
+
+    def compute(texts):
+        calls.append(list(texts))
+        return [[0.1, 1 / 3] for _ in texts]
+
+    first = cached_embeddings("fake", "m", ["x", "x", "y"], compute)
+    second = cached_embeddings("fake", "m", ["x", "y"], compute)
+
+    assert calls == [["x", "y"]]
+    assert first[0] == first[1] == second[0] == second[1]
+    assert first[0] != [0.1, 1 / 3]   # đã làm tròn float32
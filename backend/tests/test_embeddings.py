@@ -0,0 +1,125 @@
+# tests/test_embeddings.py
+import threading
+
+import pytest
+
+import config
+import embedder
+from utils import embed_in_batches
+from vector_store import LocalVectorIndex
+
+
+def _fake_batch(batch):
+    return [[float(t)] for t in batch]
+
+
+def test_embed_in_batches_keeps_order_across_workers():
+    texts = [str(i) for i in range(1000)]
+    vectors = embed_in_batches(texts, _fake_batch, batch_size=7, max_workers=8)
+    assert vectors == [[float(i)] for i in range(1000)]
+
+
+def test_embed_in_batches_retries_failed_batch():
+    calls = {"n": 0}
+    lock = threading.Lock()
+
+    def flaky(batch):
+        with lock:
+            calls["n"] += 1
+            if calls["n"] <= 2:
+                raise IOError("rate limited")
+        return _fake_batch(batch)
+
+    assert embed_in_batches(["1", "2"], flaky, batch_size=10, max_retries=3, backoff=0) == [[1.0], [2.0]]
+    assert calls["n"] == 3
+
+
+def test_embed_in_batches_gives_up_after_max_retries():
+    def broken(batch):
+        raise IOError("down")
+
+    with pytest.raises(IOError):
+        embed_in_batches(["1"], broken, max_retries=1, backoff=0)
+
+
+@pytest.mark.parametrize("kwargs", [{"batch_size": 0}, {"max_workers": 0}, {"max_retries": -1}])
+def test_embed_in_batches_rejects_invalid_settings(kwargs):
+    with pytest.raises(ValueError):
+        embed_in_batches(["1"], _fake_batch, **kwargs)
+
+
+def test_fake_provider_matches_index_dimension():
+    assert embedder.get_provider().signature() == f"fake:fake:{config.EMBEDDING_DIM}"
+    assert len(embedder.get_embeddings(["Nguyen Van A"])[0]) == config.EMBEDDING_DIM
+    assert len(embedder.get_embedding("Nguyen Van A")) == config.EMBEDDING_DIM
+
+
+class _Data:
+    def __init__(self, index, embedding):
+        self.index, self.embedding = index, embedding
+
+
+class _FakeOpenAI:
+    def __init__(self, dim):
+        self.dim, self.calls = dim, []
+        self.embeddings = self
+
+    def create(self, input, model, **kwargs):
+        self.calls.append((model, kwargs))
+        # Trả ngược thứ tự: provider phải sắp lại theo index
+        return type("R", (), {"data": [_Data(i, [float(i)] * self.dim) for i in reversed(range(len(input)))]})
+
+
+def test_openai_provider_requests_configured_dimension(monkeypatch):
+    client = _FakeOpenAI(8)
+    monkeypatch.setattr(embedder, "get_openai_client", lambda: client)
+    provider = embedder.OpenAIProvider("text-embedding-3-small", 8)
+    assert provider.embed_batch(["a", "b"]) == [[0.0] * 8, [1.0] * 8]
+    assert client.calls == [("text-embedding-3-small", {"dimensions": 8})]
+
+
+def test_provider_rejects_wrong_dimension(monkeypatch):
+    monkeypatch.setattr(embedder, "get_openai_client", lambda: _FakeOpenAI(1536))
+    with pytest.raises(ValueError, match="1536"):
+        embedder.OpenAIProvider("text-embedding-3-small", 768).embed_batch(["a"])
+
+
+def test_gemini_provider_requests_configured_dimension(monkeypatch):
+    calls = []
+
+    class FakeGenai:
+        @staticmethod
+        def embed_content(model, content, output_dimensionality):
+            calls.append((model, output_dimensionality))
+            return {"embedding": [[0.5] * output_dimensionality for _ in content]}
+
+    monkeypatch.setattr(embedder, "get_genai", lambda: FakeGenai)
+    vectors = embedder.GeminiProvider("models/gemini-embedding-001", 16).embed_batch(["a", "b", "c"])
+    assert [len(v) for v in vectors] == [16, 16, 16]
+    assert calls == [("models/gemini-embedding-001", 16)]
+
+
+def test_validate_dimensions_accepts_matching_index(tmp_path):
+    embedder.validate_dimensions(LocalVectorIndex(str(tmp_path / "ok"), config.INDEX_DIM))
+
+
+def test_validate_dimensions_rejects_mismatched_index(tmp_path):
+    with pytest.raises(RuntimeError, match="1536"):
+        embedder.validate_dimensions(LocalVectorIndex(str(tmp_path / "bad"), 1536))
+
+
+def test_validate_dimensions_rejects_provider_with_other_dimension(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedder, "_provider", embedder.FakeProvider("fake", 384))
+    with pytest.raises(RuntimeError, match="384"):
+        embedder.validate_dimensions(LocalVectorIndex(str(tmp_path / "ok"), config.INDEX_DIM))
+
+
+def test_validate_dimensions_only_warns_when_provider_is_unreachable(tmp_path, monkeypatch):
+    def down(texts):
+        raise ConnectionError("offline")
+
+    provider = embedder.FakeProvider("fake", config.EMBEDDING_DIM)
+    monkeypatch.setattr(provider, "embed_batch", down)
+    monkeypatch.setattr(embedder, "_provider", provider)
+    monkeypatch.setattr(embedder, "EMBEDDING_MAX_RETRIES", 0)
+    embedder.validate_dimensions(LocalVectorIndex(str(tmp_path / "ok"), config.INDEX_DIM))
@@ -0,0 +1,95 @@
+# tests/test_ingest.py
+import json
+import os
+
+import pytest
+
+import ingest
+
+
+def _students(n):
+    return [
+        {"id": f"s{i}", "name": f"Student {i}", "dob": "2001-01-01", "address": "Hà Nội",
+         "hobby": "Đọc sách", "interest": "Cafe", "skill": "Đá bóng"}
+        for i in range(n)
+    ]
+
+
+class FakeIndex:
+    def __init__(self, fail_after=None):
+        self.ids = []
+        self.fail_after = fail_after
+
+    def upsert(self, vectors):
+        if self.fail_after is not None and len(self.ids) >= self.fail_after:
+            raise IOError("pinecone unavailable")
+        self.ids += [v[0] for v in vectors]
+
+    def delete(self, ids=None):
+        self.deleted = list(ids)
+
+
+@pytest.fixture(autouse=True)
+def no_upsert_backoff(monkeypatch):
+    monkeypatch.setattr(ingest._upsert_with_retry, "__defaults__", (1, 0.0))
+
+
+@pytest.mark.parametrize("fmt", ["array", "jsonl"])
+def test_iter_records_across_chunk_boundaries(tmp_path, fmt):
+    data = _students(50)
+    path = tmp_path / f"data.{fmt}"
+    if fmt == "array":
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    else:
+        path.write_text("\n".join(json.dumps(d, ensure_ascii=False) for d in data), encoding="utf-8")
+
+    assert list(ingest.iter_records(str(path), chunk_size=13)) == data
+
+
+def test_resume_from_checkpoint_after_failure(tmp_path):
+    path = tmp_path / "data.jsonl"
+    path.write_text("\n".join(json.dumps(d) for d in _students(250)), encoding="utf-8")
+    checkpoint = str(tmp_path / "ck.json")
+
+    first = FakeIndex(fail_after=100)
+    with pytest.raises(RuntimeError):
+        ingest.stream_ingest(first, str(path), embed_batch_size=50, upsert_batch_size=25,
+                             checkpoint_path=checkpoint)
+    with open(checkpoint) as f:
+        assert json.load(f)["committed"] == 100
+
+    second = FakeIndex()
+    total = ingest.stream_ingest(second, str(path), embed_batch_size=50, upsert_batch_size=25,
+                                 checkpoint_path=checkpoint)
+    assert total == 250
+    assert second.ids[0] == "s100"
+    assert set(first.ids) | set(second.ids) == {f"s{i}" for i in range(250)}
+
+
+def test_checkpoint_ignored_when_source_file_changes(tmp_path):
+    path = tmp_path / "data.jsonl"
+    path.write_text("\n".join(json.dumps(d) for d in _students(100)), encoding="utf-8")
+    checkpoint = str(tmp_path / "ck.json")
+    ingest.stream_ingest(FakeIndex(), str(path), embed_batch_size=50, checkpoint_path=checkpoint)
+
+    new_data = _students(120)
+    new_data[0]["name"] = "Someone else"
+    path.write_text("\n".join(json.dumps(d) for d in new_data), encoding="utf-8")
+    os.utime(path, (1, 1))
+
+    index = FakeIndex()
+    ingest.stream_ingest(index, str(path), embed_batch_size=50, checkpoint_path=checkpoint)
+    # Checkpoint bị bỏ qua (đọc lại từ đầu), nhưng chỉ bản ghi đổi / mới được upsert lại
+    assert sorted(index.ids) == sorted(["s0"] + [f"s{i}" for i in range(100, 120)])
+
+
+def test_stream_ingest_prune_deletes_missing_records(tmp_path):
+    path = tmp_path / "data.jsonl"
+    path.write_text("\n".join(json.dumps(d) for d in _students(30)), encoding="utf-8")
+    ingest.stream_ingest(FakeIndex(), str(path), embed_batch_size=10)
+
+    path.write_text("\n".join(json.dumps(d) for d in _students(25)), encoding="utf-8")
+    index = FakeIndex()
+    ingest.stream_ingest(index, str(path), embed_batch_size=10, prune=True)
+    assert index.ids == []
+    assert sorted(index.deleted) == [f"s{i}" for i in range(25, 30)]
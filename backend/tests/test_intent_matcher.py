@@ -0,0 +1,36 @@
+# tests/test_intent_matcher.py
+import unicodedata
+
+import pytest
+
+from bench_intent import load_cases, accuracy
+from intent_matcher import matcher, fold
+
+
+def test_labelled_set_accuracy():
+    assert accuracy(matcher.classify, load_cases()) >= 0.95
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("thời tiết hà nội", "weather_vn"),          # cụ thể hơn "thời tiết"
+    ("thoi tiet ha noi", "weather_vn"),          # gõ không dấu
+    ("hai bạn học cùng lớp", "general"),         # "ai" chỉ khớp nguyên từ
+    ("chi tiết lớp học", "general"),             # "hi" chỉ khớp nguyên từ
+    ("mua sách ở đâu", "general"),               # "mua" không phải "mưa"
+    ("Nguyễn Văn A - lớp 10", "general"),        # "-" không phải phép tính
+    ("12 - 5 bằng mấy", "calculation"),
+    ("chào bạn, ai biết đá bóng?", "database_query"),
+])
+def test_word_boundaries_priority_and_folding(question, intent):
+    assert matcher.classify(question) == intent
+
+
+def test_decomposed_unicode_is_normalized():
+    question = unicodedata.normalize("NFD", "Thời tiết Đà Nẵng")
+    assert matcher.classify(question) == "weather_vn"
+
+
+def test_fold_keeps_length():
+    text = "thời tiết đà nẵng"
+    assert fold(text) == "thoi tiet da nang"
+    assert len(fold(text)) == len(text)
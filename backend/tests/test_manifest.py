@@ -0,0 +1,64 @@
+# tests/test_manifest.py
+import json
+
+import app
+import upload_jobs
+from manifest import Manifest
+from utils import student_id
+
+
+def _upload(client, payload):
+    res = client.post("/api/upload?wait=true", json=payload)
+    assert res.status_code == 200
+    job = res.get_json()
+    return {k: job[k] for k in ("status", "total", "added", "updated", "unchanged", "deleted")}
+
+
+def test_student_id_is_stable_without_explicit_id():
+    a = {"name": "Nguyen Van A", "dob": "2001-05-20"}
+    b = {"name": " nguyen  van a ", "dob": "2001-05-20", "hobby": "Đọc sách"}
+    assert student_id(a) == student_id(b)
+    assert student_id(a).startswith("stu_")
+    assert student_id({"id": "s001", "name": "x"}) == "s001"
+
+
+def test_reupload_only_embeds_changed_records(client, students, monkeypatch):
+    assert _upload(client, students) == {
+        "status": "done", "total": 4, "added": 4, "updated": 0, "unchanged": 0, "deleted": 0,
+    }
+
+    embedded = []
+    real = upload_jobs.get_embeddings
+    monkeypatch.setattr(upload_jobs, "get_embeddings", lambda texts: embedded.extend(texts) or real(texts))
+
+    # Đổi thứ tự + sửa 1 học sinh: id không đổi, chỉ học sinh bị sửa được embed lại
+    changed = list(reversed(students))
+    changed[0] = dict(changed[0], hobby="Chơi cờ")
+    res = _upload(client, changed)
+    assert (res["added"], res["updated"], res["unchanged"], res["deleted"]) == (0, 1, 3, 0)
+    assert len(embedded) == 1 and "Chơi cờ" in embedded[0]
+    assert app.index.fetch([changed[0]["id"]])["vectors"]
+
+
+def test_upload_prunes_missing_students_unless_disabled(client, students):
+    _upload(client, students)
+
+    res = _upload(client, {"students": students[1:], "prune": False})
+    assert res["deleted"] == 0
+    assert students[0]["id"] in app.index.fetch([students[0]["id"]])["vectors"]
+
+    res = _upload(client, students[1:])
+    assert (res["unchanged"], res["deleted"]) == (3, 1)
+    assert students[0]["id"] not in app.index.fetch([students[0]["id"]])["vectors"]
+
+
+def test_manifest_ignores_file_of_other_namespace(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    m = Manifest(path, "local:/a")
+    m.set_many({"s1": "h1"})
+    m.save()
+
+    assert Manifest(path, "local:/a").diff({"s1": "h1", "s2": "h2"}) == (["s2"], [], ["s1"], [])
+    assert len(Manifest(path, "pinecone:other")) == 0
+    with open(path) as f:
+        assert json.load(f)["namespace"] == "local:/a"
@@ -0,0 +1,75 @@
+# tests/test_metrics.py
+import pytest
+
+import metrics
+from metrics import Histogram, span
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    hist = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in [0.005] * 50 + [0.05] * 45 + [0.5] * 5:
+        hist.observe(value)
+    assert hist.quantile(0.5) == pytest.approx(0.01)
+    assert 0.01 < hist.quantile(0.95) <= 0.1
+    assert 0.1 < hist.quantile(0.99) <= 1.0
+
+
+def test_span_counts_errors_and_still_records_latency():
+    with pytest.raises(ValueError):
+        with span("vector_query"):
+            raise ValueError("pinecone down")
+
+    text = metrics.render_prometheus()
+    assert 'rag_stage_errors_total{stage="vector_query"} 1' in text
+    assert 'rag_stage_duration_seconds_count{stage="vector_query"} 1' in text
+    assert 'rag_stage_duration_seconds_bucket{stage="vector_query",le="+Inf"} 1' in text
+
+
+def test_closed_stream_is_not_a_stage_error():
+    def stream():
+        with span("generation"):
+            yield "chunk"
+            yield "chunk"
+
+    chunks = stream()
+    next(chunks)
+    chunks.close()   # client ngắt kết nối -> GeneratorExit trong span
+
+    text = metrics.render_prometheus()
+    assert "rag_stage_errors_total" not in text
+    assert 'rag_stage_duration_seconds_count{stage="generation"} 1' in text
+
+
+def test_chat_records_stage_latency_and_metrics_endpoint(client, students, capsys, rag_only):
+    client.post("/api/upload?wait=true", json=students)
+    capsys.readouterr()
+    client.post("/api/chat", json={"question": "ai biết đá bóng"})
+
+    # DEBUG_SAMPLE_RATE mặc định 0: không in embedding / response Pinecone
+    assert "DEBUG" not in capsys.readouterr().out
+
+    latency = client.get("/api/stats").json["latency"]
+    for stage in ("intent", "embedding", "vector_query", "context", "generation", "total[endpoint=chat]"):
+        assert latency[stage]["count"] == 1
+        assert latency[stage]["p50_ms"] <= latency[stage]["p99_ms"]
+
+    res = client.get("/api/metrics")
+    assert res.mimetype == "text/plain"
+    body = res.get_data(as_text=True)
+    assert "# TYPE rag_stage_duration_seconds histogram" in body
+    assert 'rag_requests_total{endpoint="chat",intent="database_query"} 1' in body
+    assert 'rag_answer_cache_total{result="miss"} 1' in body
+
+
+def test_debug_logging_is_sampled(client, students, capsys, monkeypatch, rag_only):
+    monkeypatch.setattr(metrics, "DEBUG_SAMPLE_RATE", 1.0)
+    client.post("/api/upload?wait=true", json=students)
+    client.post("/api/chat", json={"question": "ai biết đá bóng"})
+    assert "DEBUG: raw Pinecone response" in capsys.readouterr().out
@@ -0,0 +1,84 @@
+# tests/test_quantization.py
+import numpy as np
+import pytest
+
+import embedder
+import reduction
+from reduction import Reducer
+from vector_store import LocalVectorIndex
+
+
+def _data(n=500, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim))
+    X = (centers[rng.integers(0, 20, n)] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+    return X, (X[:20] + 0.05 * rng.normal(size=(20, dim))).astype(np.float32)
+
+
+def test_matryoshka_truncates_and_renormalizes():
+    out = Reducer("matryoshka", 2).transform([[3.0, 4.0, 100.0], [0.0, 0.0, 1.0]])
+    assert out.shape == (2, 2)
+    np.testing.assert_allclose(out[0], [0.6, 0.8])
+    np.testing.assert_allclose(out[1], [0.0, 0.0])
+
+
+def test_pca_fit_save_and_reload(tmp_path):
+    X, _ = _data()
+    path = str(tmp_path / "pca.npz")
+    pca = Reducer("pca", 16, path)
+    assert not pca.fitted
+    with pytest.raises(RuntimeError):
+        pca.transform(X)
+    pca.fit(X)
+
+    reloaded = Reducer("pca", 16, path)
+    assert reloaded.fitted and reloaded.signature() == pca.signature() != "pca:16:unfitted"
+    out = reloaded.transform(X[:3])
+    assert out.shape == (3, 16)
+    np.testing.assert_allclose(np.linalg.norm(out, axis=1), 1.0, rtol=1e-5)
+    assert not Reducer("pca", 8, path).fitted  # khác số chiều -> bỏ qua file
+
+
+def test_ensure_fitted_needs_enough_records():
+    pca = Reducer("pca", 16)
+    with pytest.raises(ValueError):
+        pca.ensure_fitted(["a"] * 5, lambda texts: np.ones((len(texts), 64)))
+    X, _ = _data()
+    pca.ensure_fitted([str(i) for i in range(len(X))], lambda texts: X[:len(texts)])
+    assert pca.fitted
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_quantized_index_matches_exact_search_after_rescoring(tmp_path, quantization):
+    X, queries = _data()
+    exact = LocalVectorIndex(str(tmp_path / "exact"), X.shape[1])
+    quant = LocalVectorIndex(str(tmp_path / "quant"), X.shape[1], quantization=quantization, rescore_factor=4)
+    for index in (exact, quant):
+        index.upsert([(str(i), X[i], {}) for i in range(len(X))])
+
+    for q in queries:
+        a = exact.query(q, top_k=5, include_metadata=False)["matches"]
+        b = quant.query(q, top_k=5, include_metadata=False)["matches"]
+        assert [m["id"] for m in a] == [m["id"] for m in b]
+        # Sau khi chấm lại bằng float32 thì điểm trùng với exact
+        np.testing.assert_allclose([m["score"] for m in a], [m["score"] for m in b], rtol=1e-5)
+
+    stats = quant.describe_index_stats()
+    assert stats["bytes_per_vector"] == {"float16": 128, "int8": 68}[quantization]
+
+
+def test_quantized_copy_is_rebuilt_on_reload(tmp_path):
+    X, queries = _data()
+    path = str(tmp_path / "index")
+    LocalVectorIndex(path, X.shape[1]).upsert([(str(i), X[i], {}) for i in range(len(X))])
+
+    reopened = LocalVectorIndex(path, X.shape[1], quantization="int8", rescore_factor=0)
+    top = reopened.query(queries[0], top_k=1, include_metadata=False)["matches"][0]
+    assert top["id"] == "0"
+
+
+def test_embedder_applies_reduction(monkeypatch):
+    monkeypatch.setattr(reduction, "_reducer", Reducer("matryoshka", 64))
+    assert len(embedder.get_embedding("ai biết đá bóng")) == 64
+    assert [len(v) for v in embedder.get_embeddings(["a", "b"])] == [64, 64]
+    assert len(embedder.get_raw_embeddings(["a"])[0]) == 768
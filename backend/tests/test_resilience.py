@@ -0,0 +1,132 @@
+# tests/test_resilience.py
+import time
+
+import pytest
+
+import app
+import generator
+import resilience
+from embedder import get_provider
+from fake_providers import FakeGenerativeModel
+from metrics import observe, render_prometheus
+from resilience import (
+    CircuitBreaker, call, deadline, remaining, DeadlineExceeded, CircuitOpen, ProviderError,
+    PROVIDER_SECONDS,
+)
+
+# Bản thật, trước khi fixture client thay bằng LLM giả
+_real_generate_gemini = generator._generate_gemini
+
+
+def _warm(name, seconds, n=20):
+    """Đủ mẫu latency để resilience tính p50 / p95 cho provider"""
+    for _ in range(n):
+        observe(PROVIDER_SECONDS, seconds, provider=name)
+
+
+def test_deadline_nests_and_keeps_earliest():
+    assert remaining() is None
+    with deadline(5):
+        assert 4.9 < remaining() <= 5
+        assert remaining(1) == 1
+        with deadline(60):
+            assert remaining() <= 5
+    assert remaining() is None
+
+
+def test_breaker_opens_and_recovers_through_half_open():
+    b = CircuitBreaker("test", failures=2, cooldown=0.05)
+    b.failure()
+    assert b.allow()
+    b.failure()
+    assert b.state == "open" and not b.allow()
+
+    time.sleep(0.06)
+    assert b.allow()            # 1 request thử
+    assert not b.allow()        # các request khác vẫn bị từ chối
+    b.success()
+    assert b.state == "closed" and b.allow()
+    assert 'rag_breaker_state{provider="test"} 0' in render_prometheus()
+
+
+def test_call_retries_then_opens_circuit(monkeypatch):
+    monkeypatch.setattr(resilience, "BREAKER_FAILURES", 2)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("lỗi tạm thời")
+        return "ok"
+
+    assert call("flaky", flaky) == "ok"
+
+    def down():
+        raise RuntimeError("down")
+
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            call("down", down)
+    with pytest.raises(CircuitOpen):
+        call("down", lambda: "không được gọi")
+
+
+def test_call_stops_at_deadline_and_fails_fast():
+    start = time.perf_counter()
+    with deadline(0.05), pytest.raises(DeadlineExceeded):
+        call("slow", lambda: time.sleep(0.5))
+    assert time.perf_counter() - start < 0.3
+
+    # p50 của provider lớn hơn thời gian còn lại -> không gọi
+    _warm("slow", 1.0)
+    with deadline(0.2), pytest.raises(DeadlineExceeded):
+        call("slow", lambda: pytest.fail("không được gọi"))
+
+
+def test_hedge_fires_after_p95_and_first_result_wins():
+    _warm("hedged", 0.01)
+    calls = []
+
+    def request():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)  # request đầu rơi vào đuôi latency
+            return "slow"
+        return "fast"
+
+    start = time.perf_counter()
+    with deadline(2):
+        assert call("hedged", request, hedge=True) == "fast"
+    assert time.perf_counter() - start < 0.3
+    text = render_prometheus()
+    assert 'rag_hedges_total{provider="hedged",result="fired"} 1' in text
+    assert 'rag_hedges_total{provider="hedged",result="won"} 1' in text
+
+
+def test_chat_degrades_to_related_students_when_gemini_is_slow(client, students, rag_only, monkeypatch):
+    client.post("/api/upload?wait=true", json=students)
+    monkeypatch.setattr(generator, "_generate_gemini", _real_generate_gemini)
+    monkeypatch.setattr(generator, "get_generative_model", lambda: FakeGenerativeModel(latency_ms=1000))
+    monkeypatch.setattr(app, "CHAT_DEADLINE", 0.3)
+
+    start = time.perf_counter()
+    body = client.post("/api/chat", json={"question": "ai biết đá bóng"}).get_json()
+    assert time.perf_counter() - start < 0.8
+    assert body["degraded"] and body["degraded_reason"] == "deadline"
+    assert {r["skill"] for r in body["related"]} == {"Đá bóng"}
+    assert all(r["name"] in body["answer"] for r in body["related"])
+    assert 'rag_degraded_total{provider="gemini",reason="deadline"} 1' in render_prometheus()
+
+
+def test_chat_returns_503_when_embedding_circuit_is_open(client, monkeypatch):
+    monkeypatch.setattr(resilience, "BREAKER_FAILURES", 1)
+
+    def down(texts):
+        raise RuntimeError("embedding down")
+    monkeypatch.setattr(get_provider(), "embed_batch", down)
+
+    first = client.post("/api/chat", json={"question": "ai thích đọc sách"})
+    assert first.status_code == 503 and first.get_json()["reason"] == "error"
+    second = client.post("/api/chat", json={"question": "ai thích âm nhạc"})
+    assert second.status_code == 503 and second.get_json()["reason"] == "circuit_open"
+    assert client.get("/api/stats").get_json()["providers"]["embedding"]["state"] == "open"
@@ -0,0 +1,67 @@
+# tests/test_retrieval.py
+import pytest
+
+import retrieval
+from embedder import get_embedding, get_embeddings
+from retrieval import FieldVocabulary, extract_filter, bm25_scores, retrieve
+from utils import student_to_text
+from vector_store import LocalVectorIndex, matches_filter
+
+
+@pytest.fixture
+def vocab(students):
+    vocab = FieldVocabulary()
+    vocab.add(students)
+    return vocab
+
+
+@pytest.fixture
+def index(tmp_path, students):
+    index = LocalVectorIndex(str(tmp_path / "index"), 768)
+    texts = [student_to_text(s) for s in students]
+    index.upsert([
+        (s["id"], e, {**s, "text": t, "birth_year": retrieval.birth_year(s["dob"])})
+        for s, t, e in zip(students, texts, get_embeddings(texts))
+    ])
+    retrieval.vocabulary.add(students)
+    return index
+
+
+def test_extract_filter_address_and_skill(vocab):
+    assert extract_filter("ai ở Hà Nội biết đá bóng", vocab) == {"$and": [
+        {"address": {"$in": ["Hà Nội"]}},
+        {"skill": {"$in": ["Đá bóng"]}},
+    ]}
+    # gõ không dấu vẫn nhận ra giá trị nhiều âm tiết
+    assert extract_filter("ai o ha noi", vocab) == {"address": {"$in": ["Hà Nội"]}}
+
+
+def test_extract_filter_birth_year_and_none(vocab):
+    assert extract_filter("ai sinh năm 2001", vocab) == {"birth_year": 2001}
+    assert extract_filter("kể tên các bạn", vocab) is None
+
+
+def test_local_index_filter_operators():
+    md = {"address": "Hà Nội", "birth_year": 2001}
+    assert matches_filter(md, {"address": "Hà Nội"})
+    assert matches_filter(md, {"$and": [{"address": {"$in": ["Hà Nội"]}}, {"birth_year": {"$gte": 2000}}]})
+    assert matches_filter(md, {"$or": [{"address": "Huế"}, {"birth_year": 2001}]})
+    assert not matches_filter(md, {"address": {"$nin": ["Hà Nội"]}})
+    assert not matches_filter({}, {"birth_year": {"$gt": 1990}})
+
+
+def test_retrieve_pushes_filter_down(index):
+    res = retrieve(index, get_embedding("ai ở Hà Nội biết đá bóng"), "ai ở Hà Nội biết đá bóng", top_k=5)
+    assert {m["id"] for m in res["matches"]} == {"s001", "s004"}
+    assert all(m["metadata"]["address"] == "Hà Nội" for m in res["matches"])
+
+
+def test_retrieve_drops_filter_without_results(index, capsys):
+    res = retrieve(index, get_embedding("ai sinh năm 1990"), "ai sinh năm 1990", top_k=5)
+    assert res["filter"] is None and len(res["matches"]) == 4
+    assert "DEBUG" not in capsys.readouterr().out   # chỉ in khi request được sample (DEBUG_SAMPLE_RATE)
+
+
+def test_bm25_prefers_documents_with_query_terms():
+    scores = bm25_scores("vẽ tranh", ["Skill: Vẽ tranh", "Skill: Đá bóng", "Hobby: Đọc sách"])
+    assert scores[0] > 0 and scores[1] == scores[2] == 0
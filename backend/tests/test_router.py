@@ -0,0 +1,31 @@
+# tests/test_router.py
+import pytest
+
+import router
+
+
+@pytest.mark.parametrize("question, intent, needs_context", [
+    ("mấy giờ rồi", "time", False),
+    ("xin chào", "greeting", False),
+    ("kể chuyện cười đi", "joke", False),
+    ("ai biết đá bóng", "database_query", True),
+])
+def test_route_classifies_before_retrieval(question, intent, needs_context):
+    assert router.route(question) == (intent, needs_context)
+
+
+def test_stats_count_skipped_remote_calls_per_intent():
+    before = router.get_stats()
+
+    router.route("mấy giờ rồi")
+    router.route("mấy giờ rồi")
+    router.route("ai biết đá bóng")
+
+    after = router.get_stats()
+    skipped_time = after["skipped_calls"]["time"]
+    prev_time = before["skipped_calls"].get("time", {})
+    assert skipped_time["embedding"] - prev_time.get("embedding", 0) == 2
+    assert skipped_time["vector_query"] - prev_time.get("vector_query", 0) == 2
+    assert after["skipped_calls"].get("database_query") is None
+    assert after["routed"]["database_query"] - before["routed"].get("database_query", 0) == 1
+    assert after["skipped_total"] - before["skipped_total"] == 4
@@ -0,0 +1,168 @@
+# tests/test_snapshot.py
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+import requests
+
+import snapshot as snapshot_module
+import structured_query
+from snapshot import SnapshotStore
+from structured_query import StudentTable, parse, execute
+from upload_jobs import UploadJobs
+from vector_store import LocalVectorIndex
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+@pytest.fixture(autouse=True)
+def serving_table(monkeypatch):
+    """Store mở snapshot gọi use_table(): trả lại student_table cho các test khác"""
+    monkeypatch.setattr(structured_query, "_serving_table", None)
+
+
+def _fill(index, n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    cities = ["Hà Nội", "Đà Nẵng", "Huế", "TP HCM"]
+    vectors = []
+    for i in range(n):
+        metadata = {"name": f"Học sinh {i}", "address": cities[i % 4], "birth_year": 2000 + i % 6}
+        if i % 3:
+            metadata["skill"] = ["Đá bóng", "Vẽ"][i % 2]
+        vectors.append((f"s{i}", rng.normal(size=index.dim), metadata))
+    index.upsert(vectors)
+    index.delete(ids=["s0", "s7"])
+
+
+FILTERS = [
+    None,
+    {"address": {"$in": ["Hà Nội", "Huế"]}},
+    {"$and": [{"skill": {"$in": ["Vẽ"]}}, {"birth_year": 2003}]},
+    {"$or": [{"skill": {"$nin": ["Vẽ", "Đá bóng"]}}, {"birth_year": {"$gte": 2004}}]},
+    {"name": "Học sinh 42"},           # field nhiều giá trị: đọc metadata từng row
+    {"hobby": {"$ne": "Đọc sách"}},    # field không có trong dữ liệu
+]
+
+
+def test_snapshot_answers_like_local_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_module, "_MAX_CODES", 50)
+    index = LocalVectorIndex(str(tmp_path / "index"), 32)
+    _fill(index)
+    store = SnapshotStore(str(tmp_path / "snapshots"), lambda: index).open()
+    assert store.describe_index_stats()["total_vector_count"] == 298
+
+    q = np.random.default_rng(1).normal(size=32)
+    for flt in FILTERS:
+        expected = index.query(q, top_k=10, filter=flt)["matches"]
+        got = store.query(q, top_k=10, filter=flt)["matches"]
+        assert [m["id"] for m in got] == [m["id"] for m in expected], flt
+        assert [m["metadata"] for m in got] == [m["metadata"] for m in expected]
+        assert np.allclose([m["score"] for m in got], [m["score"] for m in expected], atol=1e-5)
+    assert store.fetch(["s5", "s0"]) == index.fetch(["s5", "s0"])
+
+
+QUESTIONS = [
+    "Có bao nhiêu học sinh ở Hà Nội?",
+    "lớp có bao nhiêu học sinh",
+    "ai sinh năm 2002",
+    "học sinh nào sinh trước năm 2001",
+    "ai ở Hà Nội có sở thích Đọc sách",
+    "số học sinh theo từng tỉnh",
+    "Nguyen Van A sống ở đâu",
+    "ai có sở thích Âm nhạc ở Đà Nẵng",
+]
+
+
+def test_snapshot_table_answers_like_student_table(students, tmp_path, monkeypatch):
+    roster = [(s["id"], s) for s in students]
+    roster += [(f"h{i}", {"name": f"Hoang Van {i}", "dob": "2002-01-01", "address": "Hà Nội"}) for i in range(10)]
+    expected, published = StudentTable(), StudentTable()
+    expected.upsert(roster)
+    published.upsert(roster)
+    monkeypatch.setattr(snapshot_module, "student_table", published)
+
+    store = SnapshotStore(str(tmp_path / "snapshots"), lambda: LocalVectorIndex(str(tmp_path / "index"), 8)).open()
+    table = store.current().table
+    assert len(table) == len(roster) and len(published) == 0   # process đọc không giữ bản copy
+    for question in QUESTIONS:
+        plan = parse(question, expected)
+        assert parse(question, table) == plan, question
+        assert execute(plan, table) == execute(plan, expected), question
+
+
+def test_upload_publishes_snapshot_and_other_workers_swap(client, students, tmp_path, monkeypatch):
+    import app
+
+    root = str(tmp_path / "snapshots")
+    writer = SnapshotStore(root, lambda: LocalVectorIndex(str(tmp_path / "index"), 768), keep=2,
+                           check_interval=0).open()
+    monkeypatch.setattr(app, "snapshots", writer)
+    monkeypatch.setattr(app, "index", writer)
+    monkeypatch.setattr(app, "upload_jobs", UploadJobs(lambda: writer, session=writer.writer))
+    other = SnapshotStore(root, None, check_interval=0).open()   # như 1 worker khác
+    before = other.current()
+
+    assert client.post("/api/upload?wait=true", json=students).status_code == 200
+    assert writer.current().version == "v00000002" and writer.current().count == len(students)
+    assert other.refresh() and other.current().version == "v00000002"
+    # Request đang giữ snapshot cũ vẫn đọc được, snapshot mới có đủ vector
+    assert before.count == 0 and before.query([1.0] * 768)["matches"] == []
+    q = app.get_embedding("ai biết đá bóng")
+    assert other.query(q, top_k=3) == writer.query(q, top_k=3)
+    assert not other.refresh()
+
+    # Roster mới (prune) -> snapshot mới, bảng học sinh nạp lại theo snapshot
+    client.post("/api/upload?wait=true", json=students[:2])
+    assert other.refresh() and other.current().count == 2
+    assert client.post("/api/chat", json={"question": "Có bao nhiêu học sinh?"}).get_json()["structured"]["matched"] == 2
+    assert sorted(n for n in os.listdir(root) if n.startswith("v")) == ["v00000002", "v00000003"]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_serve_workers_share_snapshot(tmp_path, students):
+    port = _free_port()
+    env = dict(os.environ, LOCAL_INDEX_PATH=str(tmp_path / "index"), SNAPSHOT_DIR=str(tmp_path / "snapshots"),
+               UPLOAD_JOBS_DIR=str(tmp_path / "jobs"), UPLOAD_MANIFEST_PATH=str(tmp_path / "manifest.json"),
+               SNAPSHOT_CHECK_INTERVAL="0", FLASK_HOST="127.0.0.1")
+    proc = subprocess.Popen([sys.executable, "serve.py", "--workers", "2", "--port", str(port)], cwd=BACKEND_DIR,
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if requests.get(f"{base}/api/health/ready", timeout=1).ok:
+                    break
+            except requests.RequestException:
+                pass
+            assert time.monotonic() < deadline and proc.poll() is None
+            time.sleep(0.05)
+
+        job = requests.post(f"{base}/api/upload", json=students, timeout=10).json()
+        while requests.get(f"{base}{job['status_url']}", timeout=5).json()["status"] != "done":
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+        # Worker nào nhận request cũng đã đổi sang snapshot có dữ liệu vừa upload
+        workers = {}
+        for _ in range(200):
+            stats = requests.get(f"{base}/api/stats", timeout=5).json()["snapshot"]
+            workers[stats["pid"]] = stats
+            if len(workers) == 2:
+                break
+        assert len(workers) == 2
+        assert all(s["vectors"] == len(students) for s in workers.values())
+        assert len({s["version"] for s in workers.values()}) == 1
+    finally:
+        proc.terminate()
+        proc.wait(timeout=15)
+    assert proc.returncode == 0
@@ -0,0 +1,85 @@
+# tests/test_startup.py
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import startup as startup_module
+from startup import Startup, NotReady
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def test_dependencies_start_in_order_and_retry_failures(monkeypatch):
+    monkeypatch.setattr(startup_module, "STARTUP_RETRY_INTERVAL", 0.01)
+    attempts = []
+
+    def flaky_index():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("network down")
+        return "index"
+
+    seen = []
+    s = Startup()
+    s.add("vector_index", flaky_index)
+    s.add("embedding", lambda: seen.append(s.wait("vector_index")), after=("vector_index",))
+    s.add("clients", lambda: 1 / 0, required=False)
+    s.start(background=False)
+
+    assert s.wait("vector_index") == "index" and seen == ["index"]
+    report = s.report()
+    assert report["ready"]   # phụ thuộc không bắt buộc lỗi không chặn readiness
+    assert report["dependencies"]["vector_index"]["attempts"] == 3
+    assert report["dependencies"]["clients"]["state"] == "failed"
+
+
+def test_wait_times_out_while_initializing():
+    release = threading.Event()
+    s = Startup()
+    s.add("vector_index", release.wait)
+    s.start()
+    with pytest.raises(NotReady):
+        s.wait("vector_index", timeout=0.05)
+    assert s.report()["dependencies"]["vector_index"]["state"] == "initializing"
+    release.set()
+    assert s.wait("vector_index", timeout=5) is True
+
+
+def test_import_app_is_lazy_and_works_without_gemini_key():
+    env = dict(os.environ)
+    env.pop("GEMINI_API_KEY", None)
+    code = ("import sys, app; "
+            "assert 'google.generativeai' not in sys.modules; "
+            "assert 'openai' not in sys.modules; "
+            "app.startup.wait('vector_index', 10)")
+    subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, check=True,
+                   capture_output=True, timeout=60)
+
+
+def test_live_and_ready_endpoints(client, monkeypatch):
+    import app
+
+    app.startup.wait("embedding", 10)
+    assert client.get("/api/health/live").status_code == 200
+    res = client.get("/api/health/ready")
+    assert res.status_code == 200 and res.get_json()["dependencies"]["vector_index"]["state"] == "ready"
+
+    # Index chưa khởi tạo xong: readiness 503, chat RAG trả 503 sau STARTUP_WAIT_TIMEOUT
+    release = threading.Event()
+    pending = Startup()
+    pending.add("vector_index", release.wait)
+    pending.start()
+    monkeypatch.setattr(app, "startup", pending)
+    monkeypatch.setattr(app, "index", None)
+    monkeypatch.setattr(app, "STARTUP_WAIT_TIMEOUT", 0.05)
+
+    assert client.get("/api/health/ready").status_code == 503
+    assert client.get("/api/health/live").status_code == 200
+    res = client.post("/api/chat", json={"question": "ai thích đọc sách"})
+    assert res.status_code == 503 and res.get_json()["dependency"] == "vector_index"
+    # Câu hỏi không cần index vẫn được trả lời
+    assert client.post("/api/chat", json={"question": "mấy giờ rồi"}).status_code == 200
+    release.set()
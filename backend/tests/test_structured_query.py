@@ -0,0 +1,108 @@
+# tests/test_structured_query.py
+import pytest
+
+import config
+from structured_query import StudentTable, parse, execute, try_answer
+
+
+def _roster(students, extra_in_hanoi=10):
+    """Roster mẫu + thêm học sinh ở Hà Nội để số kết quả vượt TOP_K"""
+    roster = list(students)
+    for i in range(extra_in_hanoi):
+        roster.append({"id": f"h{i:02d}", "name": f"Hoang Van {i}", "dob": "2002-01-0%d" % (i % 9 + 1),
+                       "address": "Hà Nội", "hobby": "Bơi lội", "interest": "Du lịch", "skill": "Nấu ăn"})
+    return roster
+
+
+@pytest.fixture
+def table(students):
+    table = StudentTable()
+    table.upsert((s["id"], s) for s in _roster(students))
+    return table
+
+
+def _ask(table, question):
+    plan = parse(question, table)
+    return execute(plan, table) if plan else None
+
+
+def test_count_is_exact_beyond_top_k(table):
+    result = _ask(table, "Có bao nhiêu học sinh ở Hà Nội?")
+    assert result["structured"]["matched"] == 12 > config.TOP_K
+    assert result["answer"] == "Có 12 học sinh ở Hà Nội."
+
+
+def test_unaccented_question_and_total_count(table):
+    assert _ask(table, "co bao nhieu hoc sinh o ha noi")["structured"]["matched"] == 12
+    assert _ask(table, "lớp có bao nhiêu học sinh")["answer"] == "Có tổng cộng 14 học sinh."
+
+
+def test_list_by_birth_year(table):
+    result = _ask(table, "ai sinh năm 2002")
+    assert result["structured"]["op"] == "list"
+    assert result["structured"]["matched"] == 11
+    assert "Tran Thi Huong" in result["answer"]
+    assert _ask(table, "học sinh nào sinh trước năm 2001")["answer"].startswith("Có 1 học sinh sinh trước năm 2001")
+
+
+def test_filters_combine_with_and(table):
+    result = _ask(table, "ai ở Hà Nội có sở thích Đọc sách")
+    assert [r["name"] for r in result["related"]] == ["Nguyen Van A"]
+
+
+def test_group_by_field(table):
+    result = _ask(table, "số học sinh theo từng tỉnh")
+    assert result["structured"]["op"] == "group"
+    assert result["answer"] == "Số học sinh theo địa chỉ: Hà Nội: 12, Thái Nguyên: 1, Đà Nẵng: 1."
+
+
+def test_lookup_by_name(table):
+    result = _ask(table, "Nguyen Van A sống ở đâu")
+    assert result["structured"]["op"] == "lookup"
+    assert result["answer"] == "Nguyen Van A: địa chỉ Hà Nội."
+
+
+def test_no_match_and_unresolved_constraints(table):
+    assert _ask(table, "ai có sở thích Âm nhạc ở Đà Nẵng")["answer"] == \
+        "Không có học sinh nào có sở thích Âm nhạc và ở Đà Nẵng."
+    # Địa danh chưa có trong dữ liệu / câu hỏi mở -> để RAG trả lời
+    assert parse("có bao nhiêu học sinh ở Cần Thơ", table) is None
+    assert parse("ai thích chơi cờ vua", table) is None
+    assert parse("kể về lớp mình đi", table) is None
+
+
+def test_upsert_reindexes_and_remove_frees_rows(table):
+    table.upsert([("s001", {"name": "Nguyen Van A", "dob": "2001-05-20", "address": "Đà Nẵng"})])
+    assert _ask(table, "có bao nhiêu học sinh ở Hà Nội")["structured"]["matched"] == 11
+    table.remove(["s001", "s003"])
+    assert len(table) == 12
+    assert _ask(table, "có bao nhiêu học sinh ở Đà Nẵng")["answer"] == "Không có học sinh nào ở Đà Nẵng."
+
+
+def test_table_persists(tmp_path, students):
+    path = str(tmp_path / "table.json")
+    table = StudentTable(path)
+    table.upsert((s["id"], s) for s in students)
+    table.save()
+    reloaded = StudentTable(path)
+    assert _ask(reloaded, "ai ở Hà Nội")["structured"]["matched"] == 2
+
+
+def test_only_student_intents_are_answered(table):
+    assert try_answer("có bao nhiêu học sinh ở Hà Nội", "general", table) is not None
+    assert try_answer("thời tiết Hà Nội bao nhiêu độ", "weather_vn", table) is None
+    assert try_answer("có bao nhiêu học sinh", "general", StudentTable()) is None
+
+
+def test_chat_answers_from_table_without_llm(client, students):
+    res = client.post("/api/upload?wait=true", json=_roster(students))
+    assert res.status_code == 200
+
+    body = client.post("/api/chat", json={"question": "có bao nhiêu học sinh ở Hà Nội"}).json
+    assert body["answer"] == "Có 12 học sinh ở Hà Nội."
+    assert body["structured"]["op"] == "count"
+    assert len(body["related"]) == 12
+
+    # Câu hỏi mở vẫn qua RAG + LLM
+    body = client.post("/api/chat", json={"question": "tìm thông tin bạn thích đọc sách"}).json
+    assert body["answer"].startswith("LLM: ")
@@ -0,0 +1,94 @@
+# tests/test_upload_jobs.py
+import json
+import os
+
+import app
+import upload_jobs
+from manifest import get_manifest
+from upload_jobs import UploadJobs
+
+
+def test_upload_returns_job_id_and_status_reports_progress(client, students):
+    res = client.post("/api/upload", json=students)
+    assert res.status_code == 202
+    body = res.get_json()
+    assert body["status_url"] == f"/api/upload/{body['job_id']}"
+
+    app.upload_jobs.wait(body["job_id"], timeout=10)
+    job = client.get(body["status_url"]).get_json()
+    assert job["status"] == "done"
+    assert (job["total"], job["processed"], job["added"], job["failed"]) == (4, 4, 4, 0)
+    assert job["records_per_sec"] > 0
+    assert client.get("/api/upload/missing").status_code == 404
+
+
+def test_failed_records_are_reported_and_skipped(client, students, monkeypatch):
+    real = upload_jobs.get_embeddings
+
+    def flaky(texts):
+        if any("Nguyen Van A" in t for t in texts):
+            raise IOError("embedding provider down")
+        return real(texts)
+
+    monkeypatch.setattr(upload_jobs, "get_embeddings", flaky)
+    job = client.post("/api/upload?wait=true", json=students).get_json()
+    assert job["status"] == "done"
+    assert (job["added"], job["failed"]) == (3, 1)
+    assert job["failures"] == [{"id": "s001", "error": "embedding provider down"}]
+
+
+class FakeIndex:
+    def __init__(self):
+        self.ids = []
+
+    def upsert(self, vectors):
+        self.ids += [v[0] for v in vectors]
+
+
+def _students(n):
+    return [{"id": f"s{i}", "name": f"Student {i}", "dob": "2001-01-01"} for i in range(n)]
+
+
+def test_job_resumes_after_restart_from_last_committed_batch(tmp_path):
+    store = str(tmp_path / "jobs")
+    students = _students(50)
+
+    # Giả lập process chết giữa job: payload + trạng thái "running" đã lưu,
+    # manifest đã ghi 2 batch đầu
+    jobs = UploadJobs(lambda: FakeIndex(), store)
+    jobs._enqueue = lambda job_id: None
+    job_id = jobs.submit(students)["id"]
+    records = upload_jobs.build_records(students[:20])
+    get_manifest().set_many({sid: r[3] for sid, r in records.items()})
+    with open(os.path.join(store, f"{job_id}.state.json")) as f:
+        state = json.load(f)
+    state.update(status="running", added=20, processed=20)
+    with open(os.path.join(store, f"{job_id}.state.json"), "w") as f:
+        json.dump(state, f)
+    jobs._release(job_id)   # process chết -> kernel nhả khoá job
+
+    index = FakeIndex()
+    restarted = UploadJobs(lambda: index, store, workers=1, batch_size=10)
+    assert restarted.resume() == [job_id]
+    job = restarted.wait(job_id, timeout=10)
+    assert job["status"] == "done"
+    assert index.ids == [f"s{i}" for i in range(20, 50)]
+    assert (job["added"], job["unchanged"], job["processed"]) == (50, 0, 50)
+    assert not os.path.exists(os.path.join(store, f"{job_id}.payload.json"))
+
+
+def test_resume_skips_jobs_owned_by_a_live_process(tmp_path):
+    store = str(tmp_path / "jobs")
+    owner = UploadJobs(lambda: FakeIndex(), store)
+    owner._enqueue = lambda job_id: None   # job đang chạy ở process khác
+    job_id = owner.submit(_students(5))["id"]
+    assert owner.get(job_id)["owner"] == os.getpid()
+
+    other = UploadJobs(lambda: FakeIndex(), store, workers=1)
+    assert other.resume() == []
+    assert other.get(job_id)["status"] == "queued"   # đọc trạng thái từ file
+
+    owner._release(job_id)
+    assert other.resume() == [job_id]
+    assert other.wait(job_id, timeout=10)["status"] == "done"
+    assert UploadJobs(lambda: FakeIndex(), store).resume() == []
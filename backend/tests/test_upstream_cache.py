@@ -0,0 +1,91 @@
+# tests/test_upstream_cache.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from upstream_cache import UpstreamCache
+
+
+def test_fresh_hit_skips_upstream():
+    cache = UpstreamCache(ttl=60)
+    calls = []
+    fetch = lambda: calls.append(1) or {"temp": 30}
+
+    assert cache.get("Hanoi", fetch) == {"temp": 30}
+    assert cache.get("Hanoi", fetch) == {"temp": 30}
+    assert cache.get("Da Nang", fetch) == {"temp": 30}
+    assert len(calls) == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = UpstreamCache(ttl=60)
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(2)
+        return "sunny"
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        futures = [pool.submit(cache.get, "Hanoi", fetch) for _ in range(16)]
+        time.sleep(0.1)
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert results == ["sunny"] * 16
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 15
+
+
+def test_stale_served_while_refreshing(monkeypatch):
+    cache = UpstreamCache(ttl=10, stale_ttl=100)
+    cache.get("news", lambda: "old")
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 20)
+    refreshed = threading.Event()
+
+    def fetch():
+        refreshed.set()
+        return "new"
+
+    assert cache.get("news", fetch) == "old"
+    assert refreshed.wait(2)
+    for _ in range(100):
+        if cache.get("news", fetch) == "new":
+            break
+        time.sleep(0.01)
+    assert cache.stats()["stale_hits"] >= 1 and cache.stats()["refreshes"] == 1
+
+
+def test_errors_are_not_cached():
+    cache = UpstreamCache(ttl=60)
+
+    def broken():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        cache.get("Hanoi", broken)
+    assert cache.get("Hanoi", lambda: "ok") == "ok"
+    assert cache.stats()["errors"] == 1
+
+
+def test_async_misses_are_coalesced():
+    cache = UpstreamCache(ttl=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "rain"
+
+    async def main():
+        return await asyncio.gather(*[cache.get_async("Hue", fetch) for _ in range(10)])
+
+    assert asyncio.run(main()) == ["rain"] * 10
+    assert len(calls) == 1
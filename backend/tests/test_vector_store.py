@@ -0,0 +1,78 @@
+# tests/test_vector_store.py
+import threading
+
+import numpy as np
+
+from vector_store import LocalVectorIndex
+
+
+def _random_vectors(n, dim, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def test_query_returns_exact_top_k_in_score_order(tmp_path):
+    X = _random_vectors(2000, 16)
+    index = LocalVectorIndex(str(tmp_path), 16)
+    index.upsert([(f"v{i}", X[i], {"i": i}) for i in range(len(X))])
+
+    res = index.query(X[7], top_k=5)
+    ids = [m["id"] for m in res["matches"]]
+    scores = [m["score"] for m in res["matches"]]
+
+    Xn = X / np.linalg.norm(X, axis=1, keepdims=True)
+    expected = np.argsort(-(Xn @ Xn[7]))[:5]
+    assert ids == [f"v{i}" for i in expected]
+    assert scores == sorted(scores, reverse=True)
+    assert res["matches"][0]["metadata"] == {"i": 7}
+
+
+def test_delete_and_upsert_overwrite(tmp_path):
+    X = _random_vectors(10, 8)
+    index = LocalVectorIndex(str(tmp_path), 8)
+    index.upsert([(f"v{i}", X[i], {"i": i}) for i in range(10)])
+
+    index.delete(ids=["v3"])
+    assert index.query(X[3], top_k=1)["matches"][0]["id"] != "v3"
+
+    index.upsert([("v4", X[3], {"i": "moved"})])
+    top = index.query(X[3], top_k=1)["matches"][0]
+    assert top["id"] == "v4" and top["metadata"] == {"i": "moved"}
+    assert index.describe_index_stats()["total_vector_count"] == 9
+
+
+def test_persists_and_reloads(tmp_path):
+    X = _random_vectors(1500, 8)  # vượt _MIN_CAPACITY -> phải grow file
+    index = LocalVectorIndex(str(tmp_path), 8)
+    index.upsert([(f"v{i}", X[i], {"i": i}) for i in range(1500)])
+    index.delete(ids=["v0"])
+    del index
+
+    reloaded = LocalVectorIndex(str(tmp_path), 8)
+    assert reloaded.describe_index_stats()["total_vector_count"] == 1499
+    top = reloaded.query(X[1200], top_k=1)["matches"][0]
+    assert top["id"] == "v1200" and top["metadata"] == {"i": 1200}
+
+
+def test_query_consistent_during_concurrent_upserts(tmp_path):
+    X = _random_vectors(200, 8)
+    index = LocalVectorIndex(str(tmp_path), 8)
+    index.upsert([(f"v{i}", X[i], {"owner": f"v{i}"}) for i in range(200)])
+
+    stop = threading.Event()
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            vid = f"v{i % 200}"
+            index.upsert([(vid, X[(i * 7) % 200], {"owner": vid})])
+            i += 1
+
+    t = threading.Thread(target=writer)
+    t.start()
+    try:
+        for j in range(300):
+            for m in index.query(X[j % 200], top_k=5)["matches"]:
+                assert m["metadata"]["owner"] == m["id"]
+    finally:
+        stop.set()
+        t.join()
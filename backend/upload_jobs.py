@@ -0,0 +1,339 @@
+# upload_jobs.py
+"""
+Upload roster chạy nền theo job thay vì giữ 1 HTTP request suốt quá trình embed + upsert.
+
+- POST /api/upload ghi payload ra đĩa (UPLOAD_JOBS_DIR) rồi trả job_id ngay.
+- 1 thread chạy lần lượt từng job (2 roster không được diff/prune xen kẽ trên cùng manifest);
+  trong 1 job, các batch UPLOAD_BATCH_SIZE bản ghi được embed + upsert song song trên
+  pool UPLOAD_WORKERS thread.
+- Batch lỗi thì thử lại từng bản ghi: bản ghi vẫn lỗi được ghi vào "failures", job chạy tiếp.
+- Trạng thái job (tiến độ, tốc độ, lỗi) được lưu cạnh payload. Khởi động lại thì job
+  queued/running được chạy tiếp: manifest đã ghi các batch upsert xong, nên chỉ còn
+  các bản ghi chưa commit được embed lại.
+- Nhiều process dùng chung UPLOAD_JOBS_DIR (worker của serve.py): process chạy job giữ
+  flock trên <job_id>.lock (pid ghi ở "owner"), kernel tự nhả khi process chết. resume()
+  ở process nào cũng chỉ nhận job mồ côi (khoá được), không chạy lại job process khác đang chạy.
+- session (tuỳ chọn) bọc mỗi job: vd. snapshot.SnapshotStore.writer khoá ghi giữa các
+  worker của serve.py và publish snapshot mới khi job xong.
+"""
+import json
+import os
+import queue
+import re
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+try:
+    import fcntl
+except ImportError:   # Windows: không chạy nhiều process (serve.py), không cần khoá job
+    fcntl = None
+
+from config import INDEX_DIM
+from embedder import get_embeddings, get_raw_embeddings
+from reduction import get_reducer
+from pinecone_helper import upsert_vectors, delete_vectors
+from manifest import get_manifest, record_hash
+from retrieval import vocabulary, birth_year
+from answer_cache import answer_cache
+from structured_query import student_table
+from utils import student_to_text, student_id
+
+MAX_FAILURES = 100      # số lỗi từng bản ghi giữ lại trong trạng thái job
+_SAVE_INTERVAL = 1.0    # giây giữa 2 lần ghi manifest / trạng thái job xuống đĩa
+
+
+def student_metadata(s, text):
+    metadata = {
+        "name": s.get("name"),
+        "dob": s.get("dob"),
+        "address": s.get("address"),
+        "hobby": s.get("hobby"),
+        "interest": s.get("interest"),
+        "skill": s.get("skill"),
+        "text": text
+    }
+    year = birth_year(s.get("dob"))
+    if year is not None:
+        metadata["birth_year"] = year  # để filter theo năm sinh
+    return metadata
+
+
+def build_records(students):
+    """id -> (student, text, metadata, hash); trùng id thì bản ghi sau thắng"""
+    records = {}
+    for s in students:
+        text = student_to_text(s)
+        metadata = student_metadata(s, text)
+        records[student_id(s)] = (s, text, metadata, record_hash(text, metadata))
+    return records
+
+
+class UploadJobs:
+    def __init__(self, get_index, store_dir=None, workers=2, batch_size=50, session=None):
+        self.get_index = get_index
+        # session() -> context manager trả về index ghi cho 1 job
+        self.session = session or (lambda: nullcontext(self.get_index()))
+        self.store_dir = store_dir
+        self.batch_size = batch_size
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="upload")
+        self._lock = threading.Lock()
+        self._jobs = {}          # job_id -> trạng thái
+        self._payloads = {}      # job_id -> payload (khi không lưu ra đĩa)
+        self._done = {}          # job_id -> threading.Event
+        self._claims = {}        # job_id -> file <job_id>.lock đang giữ flock
+        self._queue = queue.Queue()
+        self._runner = None
+
+    # ---------- lưu trữ ----------
+
+    def _path(self, job_id, suffix):
+        return os.path.join(self.store_dir, f"{job_id}.{suffix}.json")
+
+    def _write(self, path, data):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _persist(self, job):
+        if self.store_dir:
+            with self._lock:
+                state = dict(job, failures=list(job["failures"]))
+            self._write(self._path(job["id"], "state"), state)
+
+    def _read_state(self, job_id):
+        with open(self._path(job_id, "state"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _claim(self, job_id):
+        """Nhận job cho process này; False nếu process khác (còn sống) đang giữ job"""
+        if not self.store_dir or fcntl is None:
+            return True
+        lock = open(os.path.join(self.store_dir, f"{job_id}.lock"), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+        self._claims[job_id] = lock
+        return True
+
+    def _release(self, job_id):
+        lock = self._claims.pop(job_id, None)
+        if lock is not None:
+            lock.close()   # đóng file = nhả flock
+
+    def _load_payload(self, job_id):
+        if not self.store_dir:
+            return self._payloads[job_id]
+        with open(self._path(job_id, "payload"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _drop_payload(self, job_id):
+        self._payloads.pop(job_id, None)
+        if self.store_dir:
+            try:
+                os.remove(self._path(job_id, "payload"))
+            except FileNotFoundError:
+                pass
+
+    # ---------- API ----------
+
+    def submit(self, students, prune=True):
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id, "status": "queued", "prune": prune,
+            "total": len(students), "processed": 0,
+            "added": 0, "updated": 0, "unchanged": 0, "deleted": 0, "failed": 0,
+            "failures": [], "records_per_sec": 0.0, "error": None,
+            "created_at": time.time(), "started_at": None, "finished_at": None,
+            "owner": os.getpid(),
+        }
+        payload = {"students": students, "prune": prune}
+        if self.store_dir:
+            os.makedirs(self.store_dir, exist_ok=True)
+            self._claim(job_id)   # khoá trước khi ghi trạng thái: resume() ở process khác bỏ qua
+            self._write(self._path(job_id, "payload"), payload)
+        else:
+            self._payloads[job_id] = payload
+        with self._lock:
+            self._jobs[job_id] = job
+            self._done[job_id] = threading.Event()
+        self._persist(job)
+        self._enqueue(job_id)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job, failures=list(job["failures"]))
+        # Job do process khác nhận (worker khác của serve.py): đọc trạng thái đã lưu
+        if self.store_dir and re.fullmatch(r"[0-9a-f]{32}", job_id):
+            try:
+                return self._read_state(job_id)
+            except FileNotFoundError:
+                pass
+        return None
+
+    def wait(self, job_id, timeout=None):
+        event = self._done.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+        return self.get(job_id)
+
+    def resume(self):
+        """
+        Nạp job đã lưu; job chưa xong (queued/running) mà không process nào giữ khoá
+        (process chạy job đã chết) được nhận và xếp hàng chạy tiếp
+        """
+        if not self.store_dir or not os.path.isdir(self.store_dir):
+            return []
+        resumed = []
+        for name in sorted(os.listdir(self.store_dir)):
+            if not name.endswith(".state.json"):
+                continue
+            job_id = name[:-len(".state.json")]
+            with self._lock:
+                if job_id in self._jobs:
+                    continue
+            job = self._read_state(job_id)
+            unfinished = job["status"] in ("queued", "running")
+            if unfinished:
+                if not self._claim(job_id):
+                    continue   # process khác đang chạy, get() đọc trạng thái từ file
+                # Đọc lại sau khi khoá: chủ cũ có thể vừa chạy xong
+                job = self._read_state(job_id)
+                unfinished = job["status"] in ("queued", "running")
+                if not unfinished:
+                    self._release(job_id)
+            with self._lock:
+                self._jobs[job_id] = job
+                self._done[job_id] = threading.Event()
+            if unfinished:
+                job["status"], job["owner"] = "queued", os.getpid()
+                resumed.append(job_id)
+            else:
+                self._done[job_id].set()
+        for job_id in sorted(resumed, key=lambda j: self._jobs[j]["created_at"]):
+            print(f"↩️ Tiếp tục upload job {job_id}")
+            self._enqueue(job_id)
+        return resumed
+
+    # ---------- xử lý ----------
+
+    def _enqueue(self, job_id):
+        self._queue.put(job_id)
+        with self._lock:
+            if self._runner is None or not self._runner.is_alive():
+                self._runner = threading.Thread(target=self._run_forever, daemon=True)
+                self._runner.start()
+
+    def _run_forever(self):
+        while True:
+            job_id = self._queue.get()
+            job = self._jobs[job_id]
+            try:
+                with self.session() as index:
+                    self._run(job, index)
+                job["status"] = "done"
+            except Exception as e:
+                traceback.print_exc()
+                job["status"], job["error"] = "failed", str(e)
+            job["finished_at"] = time.time()
+            self._persist(job)
+            if job["status"] == "done":
+                self._drop_payload(job_id)
+            self._release(job_id)
+            self._done[job_id].set()
+
+    def _run(self, job, index):
+        payload = self._load_payload(job["id"])
+        # PCA phải fit trước khi tính hash (hash gồm signature của reducer)
+        get_reducer().ensure_fitted([student_to_text(s) for s in payload["students"]], get_raw_embeddings)
+        records = build_records(payload["students"])
+        manifest = get_manifest()
+
+        added, updated, unchanged, deleted = manifest.diff({sid: r[3] for sid, r in records.items()})
+        if not job["prune"]:
+            deleted = []
+        # Bảng cho structured query chỉ cần metadata (không cần embed) -> cập nhật ngay cả roster
+        student_table.upsert((sid, r[2]) for sid, r in records.items())
+        student_table.remove(deleted)
+        student_table.save()
+        changed = added + updated
+        # Chạy tiếp sau restart: bản ghi đã commit ở lần trước giờ nằm trong unchanged
+        committed_before = job["added"] + job["updated"]
+        with self._lock:
+            job["status"], job["started_at"] = "running", time.time()
+            job["total"] = len(records)
+            job["unchanged"] = max(len(unchanged) - committed_before, 0)
+            job["failed"], job["failures"] = 0, []
+            job["processed"] = len(unchanged)
+        self._persist(job)
+        print(f"📦 Upload job {job['id']}: {len(changed)} bản ghi cần embed, "
+              f"{len(unchanged)} không đổi, {len(deleted)} cần xoá")
+
+        added = set(added)
+        state = {"last_save": time.time(), "embedded": 0}
+        try:
+            batches = [changed[i:i + self.batch_size] for i in range(0, len(changed), self.batch_size)]
+            for _ in self._pool.map(lambda b: self._process_batch(job, b, records, added, state, index),
+                                    batches):
+                pass
+            if deleted:
+                delete_vectors(index, deleted)
+                manifest.remove(deleted)
+                answer_cache.invalidate(deleted)
+                job["deleted"] = len(deleted)
+        finally:
+            manifest.save()
+
+    def _upsert(self, ids, records, index):
+        embeddings = get_embeddings([records[sid][1] for sid in ids])
+        for emb in embeddings:
+            if len(emb) != INDEX_DIM:
+                raise ValueError("Embedding dimension mismatch")
+        upsert_vectors(index, [(sid, emb, records[sid][2]) for sid, emb in zip(ids, embeddings)])
+
+    def _process_batch(self, job, ids, records, added, state, index):
+        ok, failures = list(ids), []
+        try:
+            self._upsert(ids, records, index)
+        except Exception as e:
+            print(f"⚠️ Batch lỗi ({e}), thử lại từng bản ghi...")
+            ok = []
+            for sid in ids:
+                try:
+                    self._upsert([sid], records, index)
+                    ok.append(sid)
+                except Exception as err:
+                    failures.append({"id": sid, "error": str(err)})
+
+        manifest = get_manifest()
+        manifest.set_many({sid: records[sid][3] for sid in ok})
+        vocabulary.add(records[sid][0] for sid in ok)
+        # Câu trả lời cache có dùng học sinh vừa thay đổi -> không còn đúng
+        answer_cache.invalidate(ok)
+
+        now = time.time()
+        with self._lock:
+            n_added = sum(1 for sid in ok if sid in added)
+            job["added"] += n_added
+            job["updated"] += len(ok) - n_added
+            job["failed"] += len(failures)
+            job["failures"] = (job["failures"] + failures)[:MAX_FAILURES]
+            job["processed"] += len(ids)
+            state["embedded"] += len(ids)
+            job["records_per_sec"] = round(state["embedded"] / max(now - job["started_at"], 1e-9), 1)
+            save = now - state["last_save"] >= _SAVE_INTERVAL
+            if save:
+                state["last_save"] = now
+        if save:
+            manifest.save()
+            self._persist(job)
+
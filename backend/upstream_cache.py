@@ -0,0 +1,165 @@
+# upstream_cache.py
+"""
+Cache kết quả weatherapi.com / newsapi.org dùng chung cả process.
+
+- Key: thành phố đã chuẩn hoá (weather) hoặc query tin tức (news), TTL riêng từng nguồn.
+- Single-flight: nhiều request cùng lúc miss cùng 1 key chỉ gây ra 1 lần gọi upstream,
+  các request còn lại chờ kết quả của lần gọi đó.
+- Stale-while-revalidate: hết TTL nhưng chưa quá ttl + stale_ttl thì trả ngay dữ liệu cũ
+  và refresh nền; refresh lỗi thì tiếp tục dùng dữ liệu cũ tới khi hết hạn hẳn.
+Lỗi khi gọi upstream không được cache.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from config import WEATHER_CACHE_TTL, NEWS_CACHE_TTL, UPSTREAM_STALE_TTL
+
+
+class UpstreamCache:
+    def __init__(self, ttl: float, stale_ttl: float = 0.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (value, fetched_at), thứ tự LRU
+        self._inflight = {}             # key -> Future (đường sync)
+        self._tasks = {}                # key -> asyncio.Task (đường async)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0     # refresh nền khi trả dữ liệu stale
+        self.errors = 0
+
+    def _check(self, key):
+        """("fresh" | "stale" | "miss", value); gọi khi đang giữ lock"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return "fresh", value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                return "stale", value
+            del self._entries[key]
+        return "miss", None
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # ---------- sync (app.py) ----------
+
+    def get(self, key, fetch):
+        """Giá trị cho key; fetch() chỉ được gọi khi cần lấy mới từ upstream"""
+        if self.ttl <= 0:
+            return fetch()
+
+        with self._lock:
+            state, value = self._check(key)
+            if state == "fresh":
+                return value
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            if state == "stale":
+                if leader:
+                    self.refreshes += 1
+                    threading.Thread(target=self._refresh, args=(key, fetch, future), daemon=True).start()
+                return value
+            if leader:
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            self._refresh(key, fetch, future)
+        return future.result()
+
+    def _refresh(self, key, fetch, future):
+        try:
+            value = fetch()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self.errors += 1
+            future.set_exception(e)
+            return
+        self._store(key, value)
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(value)
+
+    # ---------- async (asgi.py) ----------
+
+    async def get_async(self, key, fetch):
+        """Như get nhưng fetch là hàm trả về coroutine"""
+        if self.ttl <= 0:
+            return await fetch()
+
+        # Không có await giữa lúc kiểm tra và tạo task nên các coroutine
+        # trên cùng event loop không thể cùng tạo task cho 1 key
+        with self._lock:
+            state, value = self._check(key)
+            if state == "fresh":
+                return value
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = asyncio.ensure_future(self._refresh_async(key, fetch))
+                # Refresh nền không ai await -> tự lấy exception để không bị log cảnh báo
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                if state == "miss":
+                    self.misses += 1
+                else:
+                    self.refreshes += 1
+            elif state == "miss":
+                self.coalesced += 1
+
+        if state == "stale":
+            return value
+        return await asyncio.shield(task)
+
+    async def _refresh_async(self, key, fetch):
+        try:
+            value = await fetch()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            self._tasks.pop(key, None)
+        self._store(key, value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.stale_hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "refreshes": self.refreshes,
+                "errors": self.errors,
+                "upstream_saved_rate": round(1 - (self.misses + self.refreshes) / total, 4) if total else 0.0,
+            }
+
+
+weather_cache = UpstreamCache(WEATHER_CACHE_TTL, UPSTREAM_STALE_TTL)
+news_cache = UpstreamCache(NEWS_CACHE_TTL, UPSTREAM_STALE_TTL)
+
+
+def get_stats():
+    return {"weather": weather_cache.stats(), "news": news_cache.stats()}
@@ -1,4 +1,10 @@
 # utils.py
+import hashlib
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
 def student_to_text(student: dict) -> str:
     # student expected to have keys name,dob,address,hobby,interest,skill
     parts = [
@@ -10,3 +16,85 @@ def student_to_text(student: dict) -> str:
         f"Skill: {student.get('skill','')}"
     ]
     return ". ".join([p for p in parts if p]) + "."
+
+
+def student_id(student: dict) -> str:
+    """
+    ID ổn định cho 1 học sinh: dùng "id" có sẵn, nếu không thì hash từ tên + ngày sinh
+    (không phụ thuộc vị trí trong file, nên đổi thứ tự bản ghi không đổi ID).
+    """
+    if student.get("id"):
+        return str(student["id"])
+    name = " ".join(str(student.get("name") or "").lower().split())
+    key = f"{name}|{student.get('dob') or ''}"
+    return "stu_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def format_matches(res):
+    """
+    Chuyển kết quả query (Pinecone hoặc local index) thành
+    (related: list dict học sinh, documents_text: context cho prompt).
+    """
+    matches = res.matches if hasattr(res, "matches") else res.get("matches", [])
+
+    docs = []
+    related = []
+    for m in matches:
+        md = m.metadata if hasattr(m, "metadata") else m.get("metadata", {})
+        s = {
+            "id": m.id if hasattr(m, "id") else m.get("id"),
+            "score": m.score if hasattr(m, "score") else m.get("score"),
+            "name": md.get("name"),
+            "dob": md.get("dob"),
+            "address": md.get("address"),
+            "hobby": md.get("hobby"),
+            "interest": md.get("interest"),
+            "skill": md.get("skill")
+        }
+        related.append(s)
+        line = f"{s['name']}, DOB: {s['dob']}, Address: {s['address']}, Hobby: {s['hobby']}, Skill: {s['skill']}"
+        docs.append(line)
+
+    documents_text = "\n".join(f"- {d}" for d in docs)
+    return related, documents_text
+
+
+def embed_in_batches(texts, embed_batch, batch_size=100, max_workers=4, max_retries=3, backoff=0.5):
+    """
+    Chia texts thành các batch và gọi embed_batch(batch) song song với
+    tối đa max_workers request cùng lúc. Mỗi batch được retry với
+    exponential backoff. Kết quả giữ đúng thứ tự của texts.
+    """
+    if batch_size < 1:
+        raise ValueError(f"EMBEDDING_BATCH_SIZE phải >= 1 (hiện tại: {batch_size})")
+    if max_workers < 1:
+        raise ValueError(f"EMBEDDING_WORKERS phải >= 1 (hiện tại: {max_workers})")
+    if max_retries < 0:
+        raise ValueError(f"EMBEDDING_MAX_RETRIES phải >= 0 (hiện tại: {max_retries})")
+
+    texts = list(texts)
+    if not texts:
+        return []
+
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    def run(batch):
+        for attempt in range(max_retries + 1):
+            try:
+                vectors = embed_batch(batch)
+                if len(vectors) != len(batch):
+                    raise RuntimeError(f"Provider trả về {len(vectors)} vectors cho {len(batch)} texts")
+                return vectors
+            except Exception as e:
+                if attempt == max_retries:
+                    raise
+                delay = backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+                print(f"Embedding batch lỗi ({e}), thử lại sau {delay:.2f}s...")
+                time.sleep(delay)
+
+    if len(batches) == 1:
+        return run(batches[0])
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+        results = list(pool.map(run, batches))
+    return [v for batch_vectors in results for v in batch_vectors]
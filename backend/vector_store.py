@@ -0,0 +1,380 @@
+# vector_store.py
+"""
+Vector index chạy trong process, dùng thay Pinecone (VECTOR_STORE=local).
+
+Có cùng interface với pinecone.Index mà pinecone_helper dùng:
+    upsert(vectors=[(id, values, metadata), ...])
+    query(vector=..., top_k=..., include_metadata=True, include_values=False)
+    delete(ids=[...])
+    describe_index_stats()
+
+Vectors được chuẩn hoá L2 và lưu liên tục trong 1 ma trận float32 map từ file
+(vectors.f32), nên cosine top-k chỉ là 1 phép nhân ma trận + argpartition.
+Metadata ghi dạng append-only log (meta.jsonl), replay khi load.
+
+query(filter=...) hỗ trợ metadata filter cú pháp Pinecone ($eq, $ne, $in, $nin, $gt, $gte,
+$lt, $lte, $and, $or): row không thoả filter bị loại trước khi chấm điểm.
+
+Với roster rất lớn có thể gắn thêm 1 ANN index (ann_index.IVFIndex): query chỉ
+chấm điểm các row ứng viên thay vì toàn bộ ma trận.
+
+quantization="float16" / "int8": query quét trên 1 bản sao lượng tử hoá của ma trận giữ
+trong RAM (2x / 4x nhỏ hơn float32; int8 có scale riêng từng row), rồi chấm lại
+top_k * rescore_factor ứng viên bằng float32 gốc trên đĩa. Bản lượng tử hoá được dựng
+lại từ vectors.f32 khi load nên đổi quantization không cần ingest lại.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+_MIN_CAPACITY = 1024
+_SCORE_CHUNK = 65536     # số row chấm điểm mỗi lần trên bản lượng tử hoá
+
+QUANTIZATIONS = {"none": None, "float16": np.float16, "int8": np.int8}
+
+_OPERATORS = {
+    "$eq": lambda v, x: v == x,
+    "$ne": lambda v, x: v != x,
+    "$in": lambda v, x: v in x,
+    "$nin": lambda v, x: v not in x,
+    "$gt": lambda v, x: v is not None and v > x,
+    "$gte": lambda v, x: v is not None and v >= x,
+    "$lt": lambda v, x: v is not None and v < x,
+    "$lte": lambda v, x: v is not None and v <= x,
+}
+
+
+def matches_filter(metadata, flt) -> bool:
+    """metadata có thoả filter (cú pháp Pinecone) không"""
+    for key, cond in flt.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, c) for c in cond):
+                return False
+        else:
+            value = metadata.get(key)
+            ops = cond if isinstance(cond, dict) else {"$eq": cond}
+            for op, arg in ops.items():
+                if op not in _OPERATORS:
+                    raise ValueError(f"Filter operator {op} không được hỗ trợ")
+                if not _OPERATORS[op](value, arg):
+                    return False
+    return True
+
+
+def top_rows(scores, k):
+    """Vị trí k điểm cao nhất trong scores, giảm dần"""
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top])]
+
+
+class LocalVectorIndex:
+    def __init__(self, path: str, dim: int, ann=None, quantization="none", rescore_factor=4):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"❌ LOCAL_QUANTIZATION {quantization} không hợp lệ.")
+        self.path = path
+        self.dim = dim
+        self._ann = ann
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self._lock = threading.RLock()
+        self._ids = []           # row -> id (None nếu row đã bị xoá)
+        self._metadata = []      # row -> metadata
+        self._rows = {}          # id -> row
+        self._free = []          # các row trống để tái sử dụng
+        self._n = 0              # số row đã dùng (high-water mark)
+
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._meta_path = os.path.join(path, "meta.jsonl")
+        self._header_path = os.path.join(path, "header.json")
+
+        self._load_header()
+        self._vectors = self._open_vectors(max(self._file_rows(), _MIN_CAPACITY))
+        self._valid = np.zeros(self._vectors.shape[0], dtype=bool)
+        self._qvectors = self._qscale = None
+        if quantization != "none":
+            self._qvectors = np.zeros(self._vectors.shape, dtype=QUANTIZATIONS[quantization])
+            self._qscale = np.ones(self._vectors.shape[0], dtype=np.float32)
+        self._replay_log()
+        for start in range(0, self._n, _SCORE_CHUNK):
+            rows = np.arange(start, min(start + _SCORE_CHUNK, self._n))
+            self._quantize(rows, self._vectors[rows])
+        self._log = open(self._meta_path, "a", encoding="utf-8")
+
+    # ---------- persistence ----------
+
+    def _load_header(self):
+        if os.path.exists(self._header_path):
+            with open(self._header_path, "r", encoding="utf-8") as f:
+                header = json.load(f)
+            if header["dim"] != self.dim:
+                raise RuntimeError(
+                    f"Local index tại {self.path} có dimension {header['dim']}, "
+                    f"nhưng INDEX_DIM = {self.dim}"
+                )
+        else:
+            with open(self._header_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim}, f)
+
+    def _file_rows(self):
+        if not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (4 * self.dim)
+
+    def _open_vectors(self, capacity):
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _grow(self, needed):
+        capacity = self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._vectors.flush()
+        self._vectors = self._open_vectors(capacity)
+        valid = np.zeros(capacity, dtype=bool)
+        valid[:len(self._valid)] = self._valid
+        self._valid = valid
+        if self._qvectors is not None:
+            qvectors = np.zeros((capacity, self.dim), dtype=self._qvectors.dtype)
+            qvectors[:len(self._qvectors)] = self._qvectors
+            qscale = np.ones(capacity, dtype=np.float32)
+            qscale[:len(self._qscale)] = self._qscale
+            self._qvectors, self._qscale = qvectors, qscale
+
+    # ---------- quantization ----------
+
+    def _quantize(self, rows, values):
+        if self._qvectors is None:
+            return
+        if self.quantization == "float16":
+            self._qvectors[rows] = values.astype(np.float16)
+            return
+        # int8 đối xứng theo từng row: x ~ q * scale, |q| <= 127
+        peak = np.abs(values).max(axis=1)
+        scale = np.where(peak == 0, 1.0, peak / 127.0).astype(np.float32)
+        self._qvectors[rows] = np.round(values / scale[:, None]).astype(np.int8)
+        self._qscale[rows] = scale
+
+    def _approx_scores(self, rows, q):
+        """
+        Điểm gần đúng trên bản lượng tử hoá. einsum nhân thẳng int8/float16 với query float32
+        (không tạo bản sao float32 của ma trận); chunk liên tục thì dùng view thay vì copy.
+        """
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), _SCORE_CHUNK):
+            chunk = rows[start:start + _SCORE_CHUNK]
+            if chunk[-1] - chunk[0] + 1 == len(chunk):
+                block = self._qvectors[chunk[0]:chunk[-1] + 1]
+            else:
+                block = self._qvectors[chunk]
+            scores[start:start + len(chunk)] = np.einsum("ij,j->i", block, q)
+        if self.quantization == "int8":
+            scores *= self._qscale[rows]
+        return scores
+
+    def _top(self, scores, k):
+        return top_rows(scores, k)
+
+    def _replay_log(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                row = entry["row"]
+                while len(self._ids) <= row:
+                    self._ids.append(None)
+                    self._metadata.append(None)
+                old = self._ids[row]
+                if old is not None and self._rows.get(old) == row:
+                    del self._rows[old]
+                if entry.get("deleted"):
+                    self._ids[row] = None
+                    self._metadata[row] = None
+                    self._valid[row] = False
+                else:
+                    self._ids[row] = entry["id"]
+                    self._metadata[row] = entry.get("metadata") or {}
+                    self._rows[entry["id"]] = row
+                    self._valid[row] = True
+        self._n = len(self._ids)
+        self._free = [r for r in range(self._n) if self._ids[r] is None]
+
+    def _append_log(self, entries):
+        self._log.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries))
+        self._log.flush()
+
+    def close(self):
+        with self._lock:
+            self._vectors.flush()
+            self._log.close()
+
+    def export(self, chunk=_SCORE_CHUNK):
+        """Yield (ids, vectors float32 đã chuẩn hoá, metadatas) theo từng chunk row còn dùng"""
+        with self._lock:
+            rows = np.flatnonzero(self._valid[:self._n])
+            for start in range(0, len(rows), chunk):
+                part = rows[start:start + chunk]
+                yield ([self._ids[r] for r in part], np.asarray(self._vectors[part]),
+                       [self._metadata[r] or {} for r in part])
+
+    # ---------- Pinecone-compatible API ----------
+
+    def upsert(self, vectors, **kwargs):
+        """vectors = list of tuples (id, vector, metadata)"""
+        if not vectors:
+            return {"upserted_count": 0}
+
+        ids = [str(v[0]) for v in vectors]
+        values = np.asarray([v[1] for v in vectors], dtype=np.float32)
+        if values.ndim != 2 or values.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {values.shape[-1]} khác index dimension {self.dim}")
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values /= np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            rows = []
+            for vid in ids:
+                row = self._rows.get(vid)
+                if row is None:
+                    row = self._free.pop() if self._free else self._n
+                    if row == self._n:
+                        self._n += 1
+                        self._ids.append(None)
+                        self._metadata.append(None)
+                    self._rows[vid] = row
+                rows.append(row)
+
+            self._grow(self._n)
+            self._vectors[rows] = values
+            self._vectors.flush()
+            self._quantize(rows, values)
+            if self._ann is not None:
+                self._ann.add(rows, values)
+
+            log = []
+            for vid, row, v in zip(ids, rows, vectors):
+                metadata = dict(v[2]) if len(v) > 2 and v[2] else {}
+                self._ids[row] = vid
+                self._metadata[row] = metadata
+                self._valid[row] = True
+                log.append({"row": row, "id": vid, "metadata": metadata})
+            self._append_log(log)
+
+            if self._ann is not None:
+                self._ann.maybe_train(self._vectors[:self._n], self._valid[:self._n])
+
+        return {"upserted_count": len(ids)}
+
+    def delete(self, ids=None, **kwargs):
+        with self._lock:
+            log = []
+            for vid in ids or []:
+                row = self._rows.pop(str(vid), None)
+                if row is None:
+                    continue
+                self._ids[row] = None
+                self._metadata[row] = None
+                self._valid[row] = False
+                self._free.append(row)
+                log.append({"row": row, "id": str(vid), "deleted": True})
+            self._append_log(log)
+            if self._ann is not None:
+                self._ann.remove([e["row"] for e in log])
+        return {}
+
+    def query(self, vector, top_k=5, include_metadata=True, include_values=False, nprobe=None,
+              filter=None, **kwargs):
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+
+        # Tính điểm và tra id/metadata trong cùng lock để upsert/delete song song
+        # không làm lẫn dữ liệu cũ và mới trong 1 kết quả
+        with self._lock:
+            n = self._n
+            if n == 0:
+                return {"matches": []}
+
+            matrix = self._vectors[:n]
+            valid = self._valid[:n]
+            if self._ann is not None and self._ann.trained:
+                # ANN: chỉ chấm điểm chính xác các row trong nprobe cụm gần nhất
+                rows = self._ann.candidates(q, nprobe)
+                rows = rows[valid[rows]]
+                if filter:
+                    rows = self._filter_rows(rows, filter)
+            else:
+                rows = np.flatnonzero(valid)
+                if filter:
+                    # Pre-filter: chỉ chấm điểm các row thoả filter
+                    rows = self._filter_rows(rows, filter)
+
+            k = min(top_k, len(rows))
+            if k <= 0:
+                return {"matches": []}
+            if self._qvectors is not None:
+                # Quét bản lượng tử hoá, chấm lại các ứng viên tốt nhất bằng float32
+                scores = self._approx_scores(rows, q)
+                if self.rescore_factor > 0:
+                    candidates = self._top(scores, min(k * self.rescore_factor, len(rows)))
+                    rows = rows[candidates]
+                    scores = matrix[rows] @ q
+            elif self._ann is not None and self._ann.trained or filter:
+                scores = matrix[rows] @ q
+            else:
+                scores = (matrix @ q)[rows]
+            top = self._top(scores, k)
+
+            matches = []
+            for i in top:
+                row = rows[i]
+                match = {"id": self._ids[row], "score": float(scores[i])}
+                if include_metadata:
+                    match["metadata"] = dict(self._metadata[row] or {})
+                if include_values:
+                    match["values"] = matrix[row].tolist()
+                matches.append(match)
+        return {"matches": matches}
+
+    def _filter_rows(self, rows, flt):
+        keep = np.fromiter((matches_filter(self._metadata[r], flt) for r in rows), dtype=bool, count=len(rows))
+        return rows[keep]
+
+    def fetch(self, ids, **kwargs):
+        with self._lock:
+            vectors = {}
+            for vid in ids:
+                row = self._rows.get(str(vid))
+                if row is not None:
+                    vectors[str(vid)] = {
+                        "id": str(vid),
+                        "values": self._vectors[row].tolist(),
+                        "metadata": self._metadata[row] or {},
+                    }
+        return {"vectors": vectors}
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            return {
+                "dimension": self.dim,
+                "total_vector_count": len(self._rows),
+                "quantization": self.quantization,
+                # Byte quét mỗi vector khi query (float32: 4 * dim)
+                "bytes_per_vector": self.dim * (self._qvectors.itemsize if self._qvectors is not None else 4)
+                                    + (4 if self.quantization == "int8" else 0),
+            }
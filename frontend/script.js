@@ -12,29 +12,62 @@ async function sendMessage() {
   chatBox.scrollTop = chatBox.scrollHeight;
   input.value = "";
 
-  // gọi API backend
+  const botMsg = document.createElement("div");
+  botMsg.className = "message bot";
+  botMsg.innerText = "…";
+  chatBox.appendChild(botMsg);
+
+  // gọi API backend (stream từng đoạn câu trả lời qua Server-Sent Events)
   try {
-    const res = await fetch("http://127.0.0.1:5000/api/chat", {
+    const res = await fetch("http://127.0.0.1:5000/api/chat/stream", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ question: message })
     });
-    const data = await res.json();
+    if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let answer = "";
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // mỗi event SSE kết thúc bằng 1 dòng trống
+      let sep;
+      while ((sep = buffer.indexOf("\n\n")) !== -1) {
+        const { event, data } = parseSseEvent(buffer.slice(0, sep));
+        buffer = buffer.slice(sep + 2);
 
-    const botMsg = document.createElement("div");
-    botMsg.className = "message bot";
-    botMsg.innerText = data.answer || "No answer.";
-    chatBox.appendChild(botMsg);
-    chatBox.scrollTop = chatBox.scrollHeight;
+        if (event === "token") {
+          answer += data.text;
+          botMsg.innerText = answer;
+        } else if (event === "error") {
+          botMsg.innerText = "⚠️ " + (data.error || "Server error");
+        }
+        chatBox.scrollTop = chatBox.scrollHeight;
+      }
+    }
+    if (!answer && botMsg.innerText === "…") botMsg.innerText = "No answer.";
 
   } catch (error) {
-    const errMsg = document.createElement("div");
-    errMsg.className = "message bot";
-    errMsg.innerText = "⚠️ Error connecting to server.";
-    chatBox.appendChild(errMsg);
+    botMsg.innerText = "⚠️ Error connecting to server.";
   }
 }
 
+function parseSseEvent(block) {
+  let event = "message";
+  let data = "";
+  for (const line of block.split("\n")) {
+    if (line.startsWith("event: ")) event = line.slice(7);
+    else if (line.startsWith("data: ")) data += line.slice(6);
+  }
+  return { event, data: data ? JSON.parse(data) : {} };
+}
+
 async function uploadFile() {
   const fileInput = document.getElementById("fileInput");
   const status = document.getElementById("upload-status");
@@ -55,8 +88,9 @@ async function uploadFile() {
       });
 
       if (res.ok) {
-        status.innerText = "✅ Upload successful!";
-        status.style.color = "green";
+        const { status_url } = await res.json();
+        status.style.color = "";
+        await pollUploadJob("http://127.0.0.1:5000" + status_url, status);
       } else {
         status.innerText = "❌ Upload failed.";
         status.style.color = "red";
@@ -69,6 +103,27 @@ async function uploadFile() {
   reader.readAsText(file);
 }
 
+// Upload chạy nền: hỏi trạng thái job mỗi giây tới khi xong
+async function pollUploadJob(url, status) {
+  while (true) {
+    const job = await (await fetch(url)).json();
+    if (job.status === "done") {
+      status.innerText = `✅ Upload successful! ${job.added} added, ${job.updated} updated, ` +
+        `${job.unchanged} unchanged, ${job.deleted} deleted` +
+        (job.failed ? `, ${job.failed} failed` : "");
+      status.style.color = job.failed ? "orange" : "green";
+      return;
+    }
+    if (job.status === "failed") {
+      status.innerText = `❌ Upload failed: ${job.error}`;
+      status.style.color = "red";
+      return;
+    }
+    status.innerText = `⏳ Uploading... ${job.processed}/${job.total} (${job.records_per_sec} records/s)`;
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+  }
+}
+
 // Gửi bằng phím Enter
 document.getElementById("user-input").addEventListener("keypress", (e) => {
   if (e.key === "Enter") sendMessage();